@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Benchmark the analysis scripts against the local fake historian.
+
+Starts fake_historian as a separate process with the requested synthetic
+factory, then runs each scenario as a separate Python process (the way agents
+call the scripts) and records wall time, historian requests, bytes and points
+served, and the child's peak RSS. The factory lives outside this process
+because a child's peak RSS starts at its parent's size: hosting it here
+would put a floor under every measurement. Results print as a table on stderr and as JSON
+lines on stdout (or --output).
+
+Zero external dependencies (stdlib only; Unix for peak RSS).
+
+Usage:
+    python3 shared/bench/bench_scripts.py
+    python3 shared/bench/bench_scripts.py --days 28 --latency-ms 20 --repeat 5 --output bench.jsonl
+    python3 shared/bench/bench_scripts.py --sites 40 --lines-per-site 10 --only oee_line,spc_week
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+from fake_historian import ENTERPRISE
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(os.path.dirname(BENCH_DIR), "scripts")
+
+SITE = f"{ENTERPRISE}/Site1"
+LINE = f"{SITE}/fillerproduction/fillingline01"
+VAT_WEIGHT = f"{SITE}/liquidprocessing/mixroom01/vat01/processdata/process/weight"
+TANK_WEIGHT = f"{SITE}/liquidprocessing/tankstorage01/tank01/processdata/process/weight"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis scripts against a fake historian")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per scenario; the median wall time is reported (default: 3)")
+    parser.add_argument("--only", default=None,
+                        help="Comma-separated scenario names to run")
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="Leave the response cache on and prime it before timing")
+    parser.add_argument("--output", default=None,
+                        help="Write JSON lines here instead of stdout")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--sites", type=int, default=None,
+                        help="Uniform synthetic sites (default: the real 3-site layout)")
+    parser.add_argument("--lines-per-site", type=int, default=3)
+    parser.add_argument("--vats-per-site", type=int, default=4)
+    parser.add_argument("--tanks-per-site", type=int, default=6)
+    parser.add_argument("--interval", type=float, default=10.0,
+                        help="Historian sampling interval in seconds (default: 10)")
+    parser.add_argument("--days", type=float, default=14.0,
+                        help="Days of synthetic history (default: 14)")
+    parser.add_argument("--deadband", action="store_true")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="Injected historian latency per request")
+    return parser.parse_args()
+
+
+def scenarios(days):
+    """(name, script, args) for every benchmark scenario."""
+    now = datetime.now(timezone.utc)
+    week_start = (now - timedelta(days=min(7.0, days - 0.5))).isoformat()
+    week_end = now.isoformat()
+    batch_jobs = [
+        {"script": "discover_data_range", "args": ["--site", SITE]},
+        {"script": "query_equipment_states", "args": ["--site", SITE]},
+    ]
+    batch_jobs += [{"script": "calculate_oee", "args": ["--line", f"{SITE}/fillerproduction/fillingline{i:02d}"]}
+                   for i in (1, 2, 3)]
+    batch_jobs += [{"script": "spc_analysis",
+                    "args": ["--tag", f"{SITE}/liquidprocessing/mixroom01/vat{i:02d}/processdata/process/weight"]}
+                   for i in (1, 2, 3, 4)]
+    return [
+        ("discover", "discover_data_range.py", ["--site", SITE]),
+        ("states_site", "query_equipment_states.py", ["--site", SITE]),
+        ("states_all", "query_equipment_states.py", ["--site", "all"]),
+        ("oee_line", "calculate_oee.py", ["--line", LINE]),
+        ("oee_line_full", "calculate_oee.py", ["--line", LINE, "--fetch", "full"]),
+        ("oee_line_boundary", "calculate_oee.py", ["--line", LINE, "--fetch", "boundary"]),
+        ("spc_shift", "spc_analysis.py", ["--tag", VAT_WEIGHT]),
+        ("spc_week", "spc_analysis.py", ["--tag", TANK_WEIGHT, "--start", week_start, "--end", week_end]),
+        ("spc_week_chunked", "spc_analysis.py",
+         ["--tag", TANK_WEIGHT, "--start", week_start, "--end", week_end, "--chunk", "1d"]),
+        ("spc_site_weights", "spc_analysis.py",
+         ["--tag", f"{SITE}/liquidprocessing/*/*/processdata/process/weight"]),
+        ("batch_site_report", "run_batch.py", batch_jobs),
+    ]
+
+
+def start_historian(args):
+    """Launch fake_historian on a free port. Returns (process, base_url)."""
+    cmd = [sys.executable, os.path.join(BENCH_DIR, "fake_historian.py"), "--port", "0",
+           "--seed", str(args.seed), "--lines-per-site", str(args.lines_per_site),
+           "--vats-per-site", str(args.vats_per_site), "--tanks-per-site", str(args.tanks_per_site),
+           "--interval", str(args.interval), "--days", str(args.days), "--latency-ms", str(args.latency_ms)]
+    if args.sites is not None:
+        cmd += ["--sites", str(args.sites)]
+    if args.deadband:
+        cmd.append("--deadband")
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True)
+    # The server announces its address on stderr once the factory is built
+    banner = proc.stderr.readline()
+    match = re.search(r"http://\S+", banner)
+    if not match:
+        proc.kill()
+        sys.exit(f"fake historian failed to start: {banner.strip() or proc.wait()}")
+    # Keep forwarding its stderr (tracebacks) so the pipe never fills up
+    threading.Thread(target=lambda: sys.stderr.writelines(proc.stderr), daemon=True).start()
+    return proc, match.group(0)
+
+
+def fetch_stats(base_url, reset):
+    with urllib.request.urlopen(f"{base_url}/_stats{'?reset=1' if reset else ''}", timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+def run_once(script, args, base_url, cache_args, env):
+    """Run one script process. Returns (wall_seconds, peak_rss_kb, exit_code)."""
+    cmd = [sys.executable, os.path.join(SCRIPTS_DIR, script)]
+    stdin = None
+    if script == "run_batch.py":
+        jobs = [{"script": j["script"], "args": j["args"] + ["--historian", base_url] + cache_args} for j in args]
+        stdin = "".join(json.dumps(j) + "\n" for j in jobs).encode()
+    else:
+        cmd += args + ["--historian", base_url] + cache_args
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if stdin else subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    if stdin:
+        proc.stdin.write(stdin)
+        proc.stdin.close()
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    rss_kb = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return wall, rss_kb, proc.returncode
+
+
+def main():
+    args = parse_args()
+    server, base_url = start_historian(args)
+
+    selected = set(args.only.split(",")) if args.only else None
+    out = open(args.output, "w") if args.output else sys.stdout
+    print(f"{'scenario':<20}{'wall ms':>10}{'requests':>10}{'kB':>12}{'points':>10}{'peak MB':>10}  exit",
+          file=sys.stderr)
+
+    with tempfile.TemporaryDirectory(prefix="bench-cache-") as cache_dir:
+        env = dict(os.environ, HISTORIAN_CACHE_DIR=cache_dir)
+        cache_args = [] if args.warm_cache else ["--no-cache"]
+        for name, script, script_args in scenarios(args.days):
+            if selected and name not in selected:
+                continue
+            if args.warm_cache:
+                run_once(script, script_args, base_url, cache_args, env)
+            walls, peaks, exit_codes = [], [], []
+            fetch_stats(base_url, reset=True)
+            for _ in range(max(1, args.repeat)):
+                wall, rss_kb, code = run_once(script, script_args, base_url, cache_args, env)
+                walls.append(wall)
+                peaks.append(rss_kb)
+                exit_codes.append(code)
+            served = fetch_stats(base_url, reset=True)
+            runs = max(1, args.repeat)
+            record = {
+                "scenario": name,
+                "script": script,
+                "wall_ms": round(statistics.median(walls) * 1000, 1),
+                "wall_ms_min": round(min(walls) * 1000, 1),
+                "requests": served["requests"] / runs,
+                "bytes": served["bytes_sent"] // runs,
+                "points": served["points"] // runs,
+                "peak_rss_kb": max(peaks),
+                "exit_code": max(exit_codes),
+                "factory": {"sites": args.sites or 3, "days": args.days, "interval": args.interval,
+                            "latency_ms": args.latency_ms, "warm_cache": args.warm_cache},
+            }
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            print(f"{name:<20}{record['wall_ms']:>10.1f}{record['requests']:>10.1f}"
+                  f"{record['bytes'] / 1024:>12.1f}{record['points']:>10}{record['peak_rss_kb'] / 1024:>10.1f}"
+                  f"  {record['exit_code']}", file=sys.stderr)
+
+    if out is not sys.stdout:
+        out.close()
+    server.terminate()
+    server.wait()
+
+
+if __name__ == "__main__":
+    main()
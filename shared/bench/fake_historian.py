@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Timebase historian, serving a synthetic Enterprise B.
+
+Implements the parts of the historian HTTP API the analysis scripts use:
+
+    GET /api/datasets
+    GET /api/datasets/{name}/tags
+    GET /api/datasets/{name}/data?tagname=...&start=...&end=...
+
+with the same response shape (``tl`` -> ``t.n`` / ``d`` -> ``t``/``v``/``q``).
+Data is generated on the fly and is a pure function of (seed, tag, time), so
+repeated queries and separate server runs return identical values. The
+factory defaults to the real three-site layout and scales to any number of
+sites/lines and any history length. Counters are monotone cumulative values,
+equipment states cycle through the real state names, and vat weights follow
+the batch cycle from ENT-B-QA-012 (no points during hold phases).
+
+    GET /_stats            request/connection/byte/point counters
+    GET /_stats?reset=1    same, then zero them
+
+Zero external dependencies (stdlib only).
+
+Usage:
+    python3 shared/bench/fake_historian.py --port 4511
+    python3 shared/bench/fake_historian.py --port 4599 --sites 20 --lines-per-site 10 --days 28 --latency-ms 5
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ENTERPRISE = "Enterprise B"
+DATASETS = ("Virtual Factory", "Virtual Factory SparkplugB")
+
+# Real layout: site -> (filling lines, vats, storage tanks)
+REAL_SITES = {
+    "Site1": (3, 4, 6),
+    "Site2": (2, 2, 3),
+    "Site3": (1, 1, 2),
+}
+
+SLOT_SECONDS = 600          # line state / efficiency changes every 10 minutes
+WORK_ORDER_SECONDS = 4 * 3600
+LINE_STATES = ("Running", "Idle", "Planned Downtime", "Unplanned Downtime")
+TIME_COUNTERS = ("timerunning", "timeidle", "timedownplanned", "timedownunplanned")
+EQUIPMENT = ("washer", "filler", "caploader")
+PRODUCTS = ("Cola 0.5L 20Pk", "Cola 1L 12Pk", "Lemon Soda 0.33L 24Pk", "Orange 0.5L 20Pk")
+
+# Vat batch cycle: (state, seconds). Weight rises in Fill, holds, drops in Transfer.
+VAT_CYCLE = (("Idle", 1920), ("Fill", 1200), ("Mix", 1260), ("Pasteurize", 960),
+             ("Cool", 420), ("Transfer", 900), ("CIP", 840))
+VAT_CYCLE_SECONDS = sum(d for _, d in VAT_CYCLE)
+# Hold phases are deadbanded by the historian: no points recorded.
+VAT_RECORDED = {"Fill", "Transfer"}
+
+OEE_LEAVES = ("metric/oee", "metric/availability", "metric/performance", "metric/quality")
+WORK_ORDER_LEAVES = ("workorder/workordernumber", "workorder/lotnumber/lotnumber",
+                     "workorder/lotnumber/item/itemname", "workorder/quantityactual",
+                     "workorder/quantitytarget", "workorder/quantitydefect", "workorder/uom")
+LINE_LEAVES = (
+    tuple(f"metric/input/{c}" for c in TIME_COUNTERS)
+    + tuple(f"metric/input/{c}" for c in ("countinfeed", "countoutfeed", "countdefect",
+                                          "rateactual", "ratestandard"))
+    + OEE_LEAVES
+    + tuple(f"{e}/processdata/state/name" for e in EQUIPMENT)
+    + WORK_ORDER_LEAVES
+)
+STRING_LEAVES = frozenset(
+    [f"{e}/processdata/state/name" for e in EQUIPMENT]
+    + ["workorder/workordernumber", "workorder/lotnumber/lotnumber",
+       "workorder/lotnumber/item/itemname", "workorder/uom"])
+
+
+def _unit(*parts):
+    """Deterministic pseudo-random float in [0, 1) from the given parts."""
+    digest = hashlib.blake2b("\x1f".join(map(str, parts)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") / 2.0 ** 64
+
+
+def _iso(ts):
+    ms = int(round(ts * 1000))
+    dt = datetime.fromtimestamp(ms // 1000, timezone.utc)
+    return f"{dt.strftime('%Y-%m-%dT%H:%M:%S')}.{ms % 1000:03d}Z"
+
+
+def _parse_time(value, now):
+    """ISO 8601, or a relative offset like -1h / -30m / -2d from now."""
+    m = re.fullmatch(r"-(\d+(?:\.\d+)?)([smhd])", value)
+    if m:
+        return now - float(m.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[m.group(2)]
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class Line:
+    """Synthetic filling line: state per slot and cumulative counters."""
+
+    def __init__(self, seed, key, index, origin):
+        self.seed = seed
+        self.key = key
+        self.index = index
+        self.origin = origin
+        self.rate_standard = float(180 + int(_unit(seed, key, "rate") * 60) * 5)
+        self.base = 1_000_000 * (1 + int(_unit(seed, key, "base") * 50))
+        # prefix[k] = (running, idle, planned, unplanned seconds, infeed units) before slot k
+        self.prefix = [(0.0, 0.0, 0.0, 0.0, 0.0)]
+        self.lock = threading.Lock()
+
+    def slot_state(self, k):
+        u = _unit(self.seed, self.key, "state", k)
+        if u < 0.78:
+            return 0
+        if u < 0.88:
+            return 1
+        if u < 0.94:
+            return 2
+        return 3
+
+    def slot_efficiency(self, k):
+        return 0.82 + 0.15 * _unit(self.seed, self.key, "eff", k)
+
+    def _prefix_upto(self, k):
+        with self.lock:
+            while len(self.prefix) <= k:
+                j = len(self.prefix) - 1
+                run, idle, planned, unplanned, infeed = self.prefix[j]
+                state = self.slot_state(j)
+                acc = [run, idle, planned, unplanned]
+                acc[state] += SLOT_SECONDS
+                if state == 0:
+                    infeed += SLOT_SECONDS * self.rate_standard / 60.0 * self.slot_efficiency(j)
+                self.prefix.append((*acc, infeed))
+            return self.prefix[k]
+
+    def cumulative(self, t):
+        """(running, idle, planned, unplanned seconds, infeed units) at time t."""
+        k, partial = divmod(t - self.origin, SLOT_SECONDS)
+        k = int(k)
+        run, idle, planned, unplanned, infeed = self._prefix_upto(k)
+        acc = [run, idle, planned, unplanned]
+        state = self.slot_state(k)
+        acc[state] += partial
+        if state == 0:
+            infeed += partial * self.rate_standard / 60.0 * self.slot_efficiency(k)
+        return (*acc, infeed)
+
+    def value(self, leaf, t):
+        """Value of a line tag (path below the line) at time t, or None if unknown."""
+        k = int((t - self.origin) // SLOT_SECONDS)
+        state = self.slot_state(k)
+        if leaf.startswith("metric/input/"):
+            name = leaf[len("metric/input/"):]
+            if name in TIME_COUNTERS:
+                return round(self.base + self.cumulative(t)[TIME_COUNTERS.index(name)], 1)
+            infeed = self.cumulative(t)[4]
+            if name == "countinfeed":
+                return float(self.base + int(infeed))
+            if name == "countoutfeed":
+                return float(self.base + int(infeed * 0.985))
+            if name == "countdefect":
+                return float(int(infeed * 0.012))
+            if name == "ratestandard":
+                return self.rate_standard
+            if name == "rateactual":
+                return round(self.rate_standard * self.slot_efficiency(k), 1) if state == 0 else 0.0
+            return None
+        if leaf in OEE_LEAVES:
+            availability = 0.70 + 0.25 * _unit(self.seed, self.key, "avail", k)
+            performance = self.slot_efficiency(k)
+            quality = 0.975 + 0.02 * _unit(self.seed, self.key, "qual", k)
+            return round({
+                "metric/availability": availability,
+                "metric/performance": performance,
+                "metric/quality": quality,
+                "metric/oee": availability * performance * quality,
+            }[leaf], 4)
+        if leaf.endswith("/processdata/state/name") and leaf.split("/", 1)[0] in EQUIPMENT:
+            if state == 0 and _unit(self.seed, self.key, leaf, k) < 0.05:
+                return "Blocked"
+            return LINE_STATES[state]
+        if leaf.startswith("workorder/"):
+            n = int(t // WORK_ORDER_SECONDS)
+            wo_start = max(n * WORK_ORDER_SECONDS, self.origin)
+            made = self.cumulative(t)[4] - self.cumulative(wo_start)[4]
+            return {
+                "workorder/workordernumber": f"WO-L{self.index:02d}-{n % 10000:04d}",
+                "workorder/lotnumber/lotnumber": f"L{self.index:02d}-{n % 10000:04d}",
+                "workorder/lotnumber/item/itemname": PRODUCTS[n % len(PRODUCTS)],
+                "workorder/quantityactual": float(int(made * 0.985)),
+                "workorder/quantitytarget": float(int(self.rate_standard * 240 * 0.9)),
+                "workorder/quantitydefect": float(int(made * 0.012)),
+                "workorder/uom": "bottle",
+            }.get(leaf)
+        return None
+
+
+class Vessel:
+    """Synthetic mixing vat or storage tank following the batch cycle."""
+
+    def __init__(self, seed, key, is_tank):
+        self.seed = seed
+        self.key = key
+        self.offset = _unit(seed, key, "offset") * VAT_CYCLE_SECONDS
+        self.peak = 10800.0 + 5000.0 * _unit(seed, key, "peak")
+        self.is_tank = is_tank
+
+    def phase(self, t):
+        pos = (t + self.offset) % VAT_CYCLE_SECONDS
+        for state, duration in VAT_CYCLE:
+            if pos < duration:
+                return state, pos / duration
+            pos -= duration
+        return VAT_CYCLE[-1][0], 1.0
+
+    def value(self, leaf, t):
+        state, frac = self.phase(t)
+        if leaf == "processdata/state/name":
+            return state
+        if leaf == "processdata/process/weight":
+            if self.is_tank:
+                level = 0.5 + 0.45 * math.sin(2 * math.pi * (t + self.offset) / (6 * 3600))
+                return round(self.peak * 2 * level, 1)
+            if state not in VAT_RECORDED:
+                return None
+            noise = (_unit(self.seed, self.key, int(t)) - 0.5) * 0.002 * self.peak
+            weight = self.peak * frac if state == "Fill" else self.peak * 0.989 * (1.0 - frac)
+            return round(max(weight + noise, 0.0), 1)
+        return None
+
+
+class Factory:
+    """Synthetic Enterprise B: resolves tag paths to generators."""
+
+    def __init__(self, seed, sites, lines_per_site, vats_per_site, tanks_per_site,
+                 interval, days, deadband):
+        self.seed = seed
+        self.interval = interval
+        self.deadband = deadband
+        now = time.time()
+        self.origin = (now - days * 86400) // SLOT_SECONDS * SLOT_SECONDS
+        if sites is None:
+            layout = dict(REAL_SITES)
+        else:
+            layout = {f"Site{i}": (lines_per_site, vats_per_site, tanks_per_site)
+                      for i in range(1, sites + 1)}
+        self.lines, self.vessels = {}, {}
+        line_index = 0
+        for site, (n_lines, n_vats, n_tanks) in layout.items():
+            for i in range(1, n_lines + 1):
+                line_index += 1
+                key = f"{ENTERPRISE}/{site}/fillerproduction/fillingline{i:02d}"
+                self.lines[key] = Line(seed, key, line_index, self.origin)
+            for i in range(1, n_vats + 1):
+                key = f"{ENTERPRISE}/{site}/liquidprocessing/mixroom01/vat{i:02d}"
+                self.vessels[key] = Vessel(seed, key, is_tank=False)
+            for i in range(1, n_tanks + 1):
+                key = f"{ENTERPRISE}/{site}/liquidprocessing/tankstorage01/tank{i:02d}"
+                self.vessels[key] = Vessel(seed, key, is_tank=True)
+        self.layout = layout
+
+    def resolve(self, tag):
+        """Return a value function f(t) for a tag, or None if it does not exist."""
+        parts = tag.split("/")
+        if len(parts) < 5:
+            return None
+        if parts[2] == "fillerproduction":
+            line = self.lines.get("/".join(parts[:4]))
+            leaf = "/".join(parts[4:])
+            if line is None or leaf not in LINE_LEAVES:
+                return None
+            return lambda t: line.value(leaf, t)
+        if parts[2] == "liquidprocessing" and len(parts) >= 6:
+            vessel = self.vessels.get("/".join(parts[:5]))
+            leaf = "/".join(parts[5:])
+            if vessel is None or leaf not in ("processdata/state/name", "processdata/process/weight"):
+                return None
+            return lambda t: vessel.value(leaf, t)
+        return None
+
+    def tags(self):
+        out = []
+        for key in self.lines:
+            for leaf in LINE_LEAVES:
+                kind = "System.String" if leaf in STRING_LEAVES else "System.Double"
+                out.append({"n": f"{key}/{leaf}", "t": kind})
+        for key in self.vessels:
+            out.append({"n": f"{key}/processdata/state/name", "t": "System.String"})
+            out.append({"n": f"{key}/processdata/process/weight", "t": "System.Double"})
+        return out
+
+    def points(self, tag, start, end, now):
+        """Sampled points for a tag within [start, end], clipped to the history."""
+        fn = self.resolve(tag)
+        if fn is None:
+            return None
+        lo = max(start, self.origin)
+        hi = min(end, now)
+        step = self.interval
+        t = math.ceil(lo / step) * step
+        out = []
+        previous = object()
+        while t <= hi:
+            v = fn(t)
+            if v is not None and not (self.deadband and v == previous):
+                out.append({"t": _iso(t), "v": v, "q": 192})
+            previous = v
+            t += step
+        return out
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.connections = 0
+        self.bytes_sent = 0
+        self.points = 0
+
+    def snapshot(self):
+        return {"requests": self.requests, "connections": self.connections,
+                "bytes_sent": self.bytes_sent, "points": self.points}
+
+
+class HistorianHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeTimebase/1"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def setup(self):
+        super().setup()
+        with self.server.stats.lock:
+            self.server.stats.connections += 1
+
+    def _send(self, status, payload, points=0, count=True):
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if count:
+            stats = self.server.stats
+            with stats.lock:
+                stats.requests += 1
+                stats.bytes_sent += len(body)
+                stats.points += points
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        path = urllib.parse.unquote(url.path)
+        factory = self.server.factory
+
+        if path == "/_stats":
+            stats = self.server.stats
+            with stats.lock:
+                snapshot = stats.snapshot()
+                if query.get("reset"):
+                    stats.reset()
+            self._send(200, snapshot, count=False)
+            return
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if path == "/api/datasets":
+            self._send(200, [{"n": name} for name in DATASETS])
+            return
+
+        m = re.fullmatch(r"/api/datasets/([^/]+)/(tags|data)", path)
+        if not m or m.group(1) not in DATASETS:
+            self._send(404, {"error": f"Not found: {path}"})
+            return
+
+        if m.group(2) == "tags":
+            self._send(200, {"User": factory.tags()})
+            return
+
+        now = time.time()
+        try:
+            start = _parse_time((query.get("start") or query.get("relativeStart") or ["-1h"])[0], now)
+            end = _parse_time((query.get("end") or query.get("relativeEnd") or [_iso(now)])[0], now)
+        except ValueError as e:
+            self._send(400, {"error": f"Bad time range: {e}"})
+            return
+
+        tl, total = [], 0
+        for tag in query.get("tagname", []):
+            points = factory.points(tag, start, end, now)
+            if points is None:
+                continue
+            total += len(points)
+            kind = "System.String" if points and isinstance(points[0]["v"], str) else "System.Double"
+            tl.append({"t": {"n": tag, "t": kind}, "d": points})
+        self._send(200, {"s": _iso(start), "e": _iso(end), "tl": tl}, points=total)
+
+
+def make_server(host="127.0.0.1", port=0, seed=1, sites=None, lines_per_site=3,
+                vats_per_site=4, tanks_per_site=6, interval=10.0, days=14.0,
+                deadband=False, latency_ms=0.0, verbose=False):
+    """Build (but do not start) a fake historian server. port=0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), HistorianHandler)
+    server.daemon_threads = True
+    server.factory = Factory(seed, sites, lines_per_site, vats_per_site, tanks_per_site,
+                             interval, days, deadband)
+    server.stats = Stats()
+    server.latency = latency_ms / 1000.0
+    server.verbose = verbose
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fake Timebase historian with a synthetic Enterprise B")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4511)
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed for the synthetic data (default: 1)")
+    parser.add_argument("--sites", type=int, default=None,
+                        help="Number of uniform synthetic sites (default: the real 3-site layout)")
+    parser.add_argument("--lines-per-site", type=int, default=3)
+    parser.add_argument("--vats-per-site", type=int, default=4)
+    parser.add_argument("--tanks-per-site", type=int, default=6)
+    parser.add_argument("--interval", type=float, default=10.0,
+                        help="Sampling interval in seconds (default: 10)")
+    parser.add_argument("--days", type=float, default=14.0,
+                        help="Days of history ending now (default: 14)")
+    parser.add_argument("--deadband", action="store_true",
+                        help="Only record a point when the value changes")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="Injected latency per request in milliseconds")
+    parser.add_argument("--verbose", action="store_true", help="Log requests to stderr")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = make_server(args.host, args.port, args.seed, args.sites, args.lines_per_site,
+                         args.vats_per_site, args.tanks_per_site, args.interval, args.days,
+                         args.deadband, args.latency_ms, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"fake historian on http://{host}:{port} "
+          f"({len(server.factory.lines)} lines, {len(server.factory.vessels)} vessels)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
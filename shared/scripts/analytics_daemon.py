@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""Resident analytics service for the Enterprise B analysis scripts.
+
+Hosts calculate_oee, spc_analysis, query_equipment_states and
+discover_data_range in one long-running process, so repeated calls skip
+interpreter startup and imports and reuse warm historian connections and the
+open response cache. The daemon speaks HTTP over a unix socket created with
+mode 0600: only its owner can connect, so path options such as --cache-dir
+or --rollup-db never reach files other users could not write themselves.
+The thin client (``run``) prints exactly what the script CLI would print,
+JSON on stdout or an argparse usage error on stderr, and exits with the same
+code; if no daemon is listening it runs the script in-process instead.
+
+Zero external dependencies (stdlib only).
+
+Usage:
+    python3 scripts/analytics_daemon.py serve
+    python3 scripts/analytics_daemon.py run calculate_oee \
+      --line "Enterprise B/Site1/fillerproduction/fillingline01" --shift last
+    python3 scripts/analytics_daemon.py status
+"""
+
+import argparse
+import http.client
+import importlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+# Script modules are imported on first use so the thin client stays light.
+SCRIPTS = ("calculate_oee", "spc_analysis", "query_equipment_states", "discover_data_range")
+
+DEFAULT_SOCKET = os.environ.get("ANALYTICS_DAEMON") or os.path.join(
+    os.path.expanduser("~"), ".cache", "enterprise-b-historian", "analytics-daemon.sock")
+
+# Options that determine which HistorianClient a call can share.
+_CLIENT_OPTIONS = ("historian", "timeout", "log_requests", "max_url_length",
+                   "workers", "no_cache", "cache_dir")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Resident analytics service for the analysis scripts")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET,
+                        help=f"Unix socket of the daemon (default: $ANALYTICS_DAEMON or {DEFAULT_SOCKET})")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("serve", help="Run the daemon in the foreground")
+    sub.add_parser("status", help="Show daemon uptime and historian statistics")
+    run = sub.add_parser("run", help="Run a script through the daemon", add_help=False)
+    run.add_argument("script", choices=sorted(SCRIPTS))
+    run.add_argument("script_args", nargs=argparse.REMAINDER)
+    return parser.parse_args()
+
+
+class ArgumentsError(Exception):
+    """Invalid script arguments: ``str()`` is argparse's error line, ``usage`` its usage text."""
+
+    def __init__(self, message, usage=""):
+        super().__init__(message)
+        self.usage = usage
+
+
+def load_script(script):
+    """Import a hosted script module by name."""
+    return importlib.import_module(script)
+
+
+def parse_script_args(script, argv):
+    """Parse script arguments without letting argparse exit the process."""
+    parser = load_script(script).build_parser()
+    parser.prog = f"{script}.py"
+
+    def error(message):
+        raise ArgumentsError(f"{parser.prog}: error: {message}", parser.format_usage())
+
+    parser.error = error
+    return parser.parse_args(argv)
+
+
+class ClientRegistry:
+    """Warm HistorianClients shared by every call with the same connection options.
+
+    With ``memoize`` each client keeps fetched series in memory, so calls
+    that repeat a query share one historian request.
+    """
+
+    def __init__(self, memoize=False):
+        self.memoize = memoize
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, args):
+        from historian_client import client_from_args
+
+        key = tuple(getattr(args, opt) for opt in _CLIENT_OPTIONS)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = client_from_args(args)
+                client.memoize = self.memoize
+            return client
+
+    def stats(self):
+        with self._lock:
+            clients = list(self._clients.items())
+        summaries = []
+        for key, client in clients:
+            options = dict(zip(_CLIENT_OPTIONS, key))
+            stats = client.stats()
+            del stats["latency_ms"]
+            summaries.append({"historian": options["historian"], "cache": not options["no_cache"], **stats})
+        return summaries
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+
+def execute(script, argv, registry):
+    """Run one script invocation in-process. Returns (output, exit_code).
+
+    Raises ArgumentsError for arguments the script CLI would reject.
+    """
+    if script not in SCRIPTS:
+        return {"status": "error", "message": f"Unknown script: {script}. Expected: {sorted(SCRIPTS)}"}, 2
+    args = parse_script_args(script, argv)
+    from profiling import run_profiled
+
+    return run_profiled(load_script(script).run, args, registry.get(args))
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "EntBAnalytics/1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/status":
+            self._send_json(404, {"status": "error", "message": f"Not found: {self.path}"})
+            return
+        server = self.server
+        self._send_json(200, {
+            "status": "ok",
+            "uptime_seconds": round(time.time() - server.started, 1),
+            "calls": server.calls,
+            "historian_clients": server.registry.stats(),
+        })
+
+    def do_POST(self):
+        if self.path != "/run":
+            self._send_json(404, {"status": "error", "message": f"Not found: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            script, argv = request["script"], list(request.get("args", []))
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"status": "error", "message": f"Bad request: {e}"})
+            return
+
+        started = time.perf_counter()
+        reply = {}
+        try:
+            reply["output"], reply["exit_code"] = execute(script, argv, self.server.registry)
+        except ArgumentsError as e:
+            reply["arguments_error"], reply["usage"], reply["exit_code"] = str(e), e.usage, 2
+        except Exception as e:  # keep serving; report like a crashed CLI would
+            reply["output"], reply["exit_code"] = {"status": "error", "message": f"{type(e).__name__}: {e}"}, 1
+        with self.server.lock:
+            self.server.calls += 1
+        reply["elapsed_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+        self._send_json(200, reply)
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # Owner-only from the moment the socket exists
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+        os.chmod(self.server_address, 0o600)
+
+
+def serve(path):
+    for script in SCRIPTS:
+        load_script(script)
+    os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+    if os.path.exists(path):
+        try:
+            _UnixHTTPConnection(path, timeout=1).connect()
+        except OSError:
+            os.unlink(path)  # left behind by a daemon that did not shut down cleanly
+        else:
+            sys.exit(f"analytics daemon already listening on {path}")
+    server = DaemonServer(path, DaemonHandler)
+    server.registry = ClientRegistry()
+    server.lock = threading.Lock()
+    server.calls = 0
+    server.started = time.time()
+    print(f"analytics daemon listening on {path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
+        server.registry.close()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a unix socket."""
+
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request_daemon(path, method, url, payload=None, timeout=300):
+    """One request to the daemon; returns the decoded reply. Raises OSError if it is not reachable."""
+    conn = _UnixHTTPConnection(path, timeout)
+    try:
+        body = None if payload is None else json.dumps(payload).encode()
+        conn.request(method, url, body=body, headers={"Content-Type": "application/json"})
+        return json.loads(conn.getresponse().read())
+    except (http.client.HTTPException, ValueError) as e:
+        raise OSError(f"Bad reply from daemon: {e}") from e
+    finally:
+        conn.close()
+
+
+def call_daemon(path, script, argv, timeout=300):
+    """Send one call to the daemon. Raises OSError if it is not reachable.
+
+    Raises ArgumentsError if the script rejected its arguments.
+    """
+    reply = request_daemon(path, "POST", "/run", {"script": script, "args": argv}, timeout)
+    if "arguments_error" in reply:
+        raise ArgumentsError(reply["arguments_error"], reply["usage"])
+    return reply["output"], reply["exit_code"]
+
+
+def main():
+    args = parse_args()
+
+    if args.command == "serve":
+        serve(args.socket)
+        return
+
+    if args.command == "status":
+        try:
+            status = request_daemon(args.socket, "GET", "/status", timeout=5)
+        except OSError as e:
+            status = {"status": "error", "message": f"Daemon not reachable at {args.socket}: {e}"}
+        json.dump(status, sys.stdout, indent=2)
+        print()
+        sys.exit(0 if status["status"] == "ok" else 1)
+
+    if any(a in ("-h", "--help") for a in args.script_args):
+        load_script(args.script).parse_args(args.script_args)
+
+    try:
+        try:
+            output, exit_code = call_daemon(args.socket, args.script, args.script_args)
+        except OSError:
+            # No daemon: same logic, same output, just without the warm process.
+            registry = ClientRegistry()
+            try:
+                output, exit_code = execute(args.script, args.script_args, registry)
+            finally:
+                registry.close()
+    except ArgumentsError as e:
+        # Same stderr and exit code as argparse in the script CLI
+        sys.stderr.write(f"{e.usage}{e}\n")
+        sys.exit(2)
+
+    json.dump(output, sys.stdout, indent=2)
+    print()
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
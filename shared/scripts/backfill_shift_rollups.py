@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Fill the shift rollup store with missing closed shifts.
+
+For every selected filling line and each of the previous N shifts, checks
+the local shift rollup store (oee_store) and computes the shifts it lacks
+from the historian, several shifts at a time. calculate_oee then answers
+those shifts, and multi-shift comparisons over them, without a historian
+query. Shifts already stored are not fetched again.
+
+Zero external dependencies (stdlib only).
+
+Usage:
+    python3 scripts/backfill_shift_rollups.py --site all --shifts 14
+    python3 scripts/backfill_shift_rollups.py --line "Enterprise B/Site1/fillerproduction/fillingline02" --shifts 60
+"""
+
+import argparse
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from calculate_oee import resolve_lines, shift_windows, window_values
+from historian_client import add_historian_arguments, run_cli
+from oee_store import ShiftRollupStore, closed_shift
+from profiling import stage
+
+
+DEFAULT_SHIFTS = 14
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Backfill the shift rollup store from the historian")
+    parser.add_argument("--line", action="append", default=None,
+                        help="ISA-95 path to filling line (repeatable)")
+    parser.add_argument("--site", nargs="+", default=None,
+                        help="Every filling line of these site path(s), or 'all' for every site")
+    parser.add_argument("--shifts", type=int, default=DEFAULT_SHIFTS,
+                        help=f"Number of previous shifts to cover (default: {DEFAULT_SHIFTS})")
+    parser.add_argument("--rollup-db", default=None,
+                        help="Shift rollup store (default: $OEE_ROLLUP_DB or shift-rollups.sqlite in the cache "
+                             "directory)")
+    add_historian_arguments(parser)
+    return parser
+
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
+
+
+def backfill_shift(client, store, dataset, lines, window):
+    """Compute and store one shift's missing lines. Returns (counts, error)."""
+    # Streamed, so resets inside the shift are seen before the values are stored
+    values_by_line, fetched, _, err = window_values(client, dataset, lines, *window, "stream", None, store)
+    counts = {"already_stored": len(lines) - len(fetched), "filled": 0, "no_data": 0}
+    if err:
+        return counts, err
+    counts["no_data"] = sum(values_by_line[line] is None for line in fetched)
+    counts["filled"] = len(fetched) - counts["no_data"]
+    return counts, None
+
+
+def run(args, client):
+    """Run the backfill for parsed arguments. Returns (output, exit_code)."""
+    if args.shifts < 1:
+        return {"status": "error", "message": "--shifts must be at least 1"}, 1
+    lines, err = resolve_lines(args)
+    if err:
+        return {"status": "error", "message": err}, 1
+
+    with stage("resolve_window"):
+        # The current shift and one that ended within the settle margin are not closed yet
+        windows = [w for w in shift_windows(args.shifts) if closed_shift(*w)]
+
+    store = ShiftRollupStore.open(args.rollup_db)
+    if store is None:
+        return {"status": "error", "message": "Shift rollup store unavailable"}, 1
+
+    totals = {"already_stored": 0, "filled": 0, "no_data": 0}
+    failed = {}
+    try:
+        with ThreadPoolExecutor(max_workers=min(client.max_workers, len(windows) or 1)) as pool:
+            # Each shift in a copy of this context, so its stages reach the profiler
+            futures = [pool.submit(contextvars.copy_context().run,
+                                   backfill_shift, client, store, args.dataset, lines, window)
+                       for window in windows]
+            for (start, _), future in zip(windows, futures):
+                counts, shift_err = future.result()
+                for key, count in counts.items():
+                    totals[key] += count
+                if shift_err:
+                    failed[start] = f"Historian query failed: {shift_err}"
+    finally:
+        store.close()
+
+    if windows and len(failed) == len(windows):
+        return {"status": "error", "message": next(iter(failed.values()))}, 1
+    output = {
+        "lines": len(lines),
+        "shifts": len(windows),
+        "period": {"start": windows[0][0], "end": windows[-1][1]} if windows else None,
+        **totals,
+    }
+    if failed:
+        output["failed_shifts"] = failed
+    output["status"] = "ok"
+    return output, 0
+
+
+def main():
+    run_cli(parse_args, run)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,34 +5,144 @@ Queries the Timebase historian HTTP API, computes throughput, yield, time utiliz
 and production vs. target from raw cumulative counters and work order data.
 Returns compact JSON to stdout for consumption by AI agents.
 
+Counter deltas come from counter_engine, which sums the positive increments
+and survives counter resets (and, with --rollover-bits, wraps at that integer
+width); the number detected is reported as counter_resets. By default the
+counters are streamed hour by hour, so every point is seen. --fetch boundary
+reads only each counter's first and last point: fewer points, but it catches
+only resets that leave a counter below its starting value.
+
+Several lines (repeated --line, or every line of a site with --site) are
+fetched in one batched query and reported together, with a rollup per site.
+
+Closed shifts are answered from the local shift rollup store (oee_store)
+when it holds them; freshly computed closed shifts are added to it. The
+store only holds results computed from every counter point without a
+rollover width, so --fetch boundary and --rollover-bits bypass it.
+
+--shifts N reports a compact per-shift trend over the previous N shifts.
+Shifts in the rollup store are read from it; the counters of the rest are
+streamed once over the span and split at the 06:00 / 18:00 boundaries.
+
+--bucket splits the shift into fixed intervals (e.g. 1h or 15m) and adds a
+per-bucket timeline of counter deltas, time utilization, throughput and
+yield, computed from the same single fetch of the full series.
+
 Usage:
     python3 scripts/calculate_oee.py --line "Enterprise B/Site1/fillerproduction/fillingline01" --shift last
+    python3 scripts/calculate_oee.py --site "Enterprise B/Site1" --shift last
+    python3 scripts/calculate_oee.py --site all --shift last
+    python3 scripts/calculate_oee.py --line "Enterprise B/Site1/fillerproduction/fillingline01" --bucket 1h
+    python3 scripts/calculate_oee.py --line "Enterprise B/Site1/fillerproduction/fillingline02" --shifts 14
 """
 
 import argparse
-import json
-import sys
-import urllib.request
-import urllib.parse
-import urllib.error
+import math
+from bisect import bisect_right
 from datetime import datetime, timezone, timedelta
 
-
-def parse_args():
-    parser = argparse.ArgumentParser(description="Production analysis for a filling line")
-    parser.add_argument("--line", required=True,
-                        help="ISA-95 path to filling line, e.g. 'Enterprise B/Site1/fillerproduction/fillingline01'")
+from counter_engine import ROLLOVER_WIDTHS, CounterDelta, counter_delta
+from historian_client import add_historian_arguments, run_cli
+from oee_store import SHIFT_MS, ShiftRollupStore, closed_shift
+from profiling import note_series, stage
+from query_equipment_states import SITE_CONFIG, identify_site, resolve_sites
+from tagseries import format_iso_ms, parse_duration_ms, parse_iso_ms
+
+
+# Cumulative time counters (delta = seconds in each state during the shift)
+TIME_TAGS = {
+    "timerunning": "metric/input/timerunning",
+    "timeidle": "metric/input/timeidle",
+    "timedownplanned": "metric/input/timedownplanned",
+    "timedownunplanned": "metric/input/timedownunplanned",
+}
+
+# Cumulative production counters (delta = units during the shift)
+COUNT_TAGS = {
+    "countinfeed": "metric/input/countinfeed",
+    "countoutfeed": "metric/input/countoutfeed",
+    "countdefect": "metric/input/countdefect",
+}
+
+# Instantaneous rates (latest value)
+RATE_TAGS = {
+    "rateactual": "metric/input/rateactual",
+    "ratestandard": "metric/input/ratestandard",
+}
+
+# Work order data (latest value)
+WO_TAGS = {
+    "wo_number": "workorder/workordernumber",
+    "wo_product": "workorder/lotnumber/item/itemname",
+    "wo_actual": "workorder/quantityactual",
+    "wo_target": "workorder/quantitytarget",
+    "wo_defect": "workorder/quantitydefect",
+    "wo_uom": "workorder/uom",
+}
+
+# Line values that are deltas of a cumulative counter, and the counter's metric name
+COUNTER_KEYS = {
+    "t_running": "timerunning",
+    "t_idle": "timeidle",
+    "t_down_planned": "timedownplanned",
+    "t_down_unplanned": "timedownunplanned",
+    "c_infeed": "countinfeed",
+    "c_outfeed": "countoutfeed",
+    "c_defect": "countdefect",
+}
+
+# Window size for --fetch stream, bounding the counter points held at once.
+STREAM_CHUNK_SECONDS = 3600
+
+# Upper bound on --bucket intervals per window, keeping the timeline compact.
+MAX_BUCKETS = 288
+
+# Line values that add up across lines in a site rollup
+ROLLUP_KEYS = ("t_running", "t_idle", "t_down_planned", "t_down_unplanned",
+               "c_infeed", "c_outfeed", "c_defect", "rate_actual", "rate_standard")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Production analysis for filling lines")
+    parser.add_argument("--line", action="append", default=None,
+                        help="ISA-95 path to filling line, e.g. 'Enterprise B/Site1/fillerproduction/fillingline01' "
+                             "(repeatable)")
+    parser.add_argument("--site", nargs="+", default=None,
+                        help="Analyze every filling line of these site path(s), e.g. 'Enterprise B/Site1', "
+                             "or 'all' for every site")
     parser.add_argument("--shift", default="last", choices=["last", "current", "day", "night"],
                         help="Shift to analyze (default: last)")
     parser.add_argument("--start", default=None,
                         help="ISO 8601 start time (overrides --shift)")
     parser.add_argument("--end", default=None,
                         help="ISO 8601 end time (overrides --shift)")
-    parser.add_argument("--historian", default="http://localhost:4511",
-                        help="Historian base URL")
-    parser.add_argument("--dataset", default="Virtual Factory",
-                        help="Dataset name")
-    return parser.parse_args()
+    parser.add_argument("--fetch", default=None, choices=["boundary", "full", "stream"],
+                        help="Stream the counters hour by hour (stream, default), fetch the full series "
+                             "(full, default with --bucket), or only the first/last point per tag (boundary: "
+                             "fewer points, but misses counter resets that end above the starting value)")
+    parser.add_argument("--rollover-bits", type=int, default=None, choices=sorted(ROLLOVER_WIDTHS),
+                        help="Integer width the selected lines' counters wrap at; a drop from the top of it "
+                             "to the bottom is a rollover (default: none, every drop is a reset)")
+    parser.add_argument("--bucket", type=duration, default=None, metavar="INTERVAL",
+                        help="Add a per-interval timeline, e.g. 1h or 15m, aligned to the window start")
+    parser.add_argument("--shifts", type=int, default=None, metavar="N",
+                        help="Per-shift trend over the previous N shifts instead of one period")
+    parser.add_argument("--rollup-db", default=None,
+                        help="Shift rollup store (default: $OEE_ROLLUP_DB or shift-rollups.sqlite in the cache "
+                             "directory); bypassed with --no-cache")
+    add_historian_arguments(parser)
+    return parser
+
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
+
+
+def duration(text):
+    try:
+        return parse_duration_ms(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid interval: {text!r}")
 
 
 def resolve_shift(shift_name):
@@ -67,138 +177,219 @@ def resolve_shift(shift_name):
             return today_6am.isoformat(), today_6pm.isoformat()
 
 
+def shift_windows(count, now=None):
+    """(start, end) of the previous ``count`` whole shifts, oldest first.
+
+    The newest is the shift resolve_shift("last") returns.
+    """
+    now = now or datetime.now(timezone.utc)
+    boundary = now.replace(minute=0, second=0, microsecond=0)
+    if 6 <= now.hour < 18:
+        boundary = boundary.replace(hour=6)
+    elif now.hour >= 18:
+        boundary = boundary.replace(hour=18)
+    else:
+        boundary = boundary.replace(hour=18) - timedelta(days=1)
+    shift = timedelta(hours=12)
+    return [((boundary - shift * (k + 1)).isoformat(), (boundary - shift * k).isoformat())
+            for k in reversed(range(count))]
+
+
 def shift_label(start_str):
     """Determine shift label from start time."""
     dt = datetime.fromisoformat(start_str)
     return "day" if dt.hour == 6 else "night"
 
 
-def query_historian(base_url, dataset, tag_names, start, end):
-    """Query the Timebase historian for multiple tags over a time range."""
-    params = [("tagname", t) for t in tag_names]
-    params.append(("start", start))
-    params.append(("end", end))
-    query = urllib.parse.urlencode(params, quote_via=urllib.parse.quote)
-    url = f"{base_url}/api/datasets/{urllib.parse.quote(dataset)}/data?{query}"
-
-    req = urllib.request.Request(url)
-    try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
-    except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError) as e:
-        return None, str(e)
-
-    result = {}
-    for tag_data in data.get("tl", []):
-        name = tag_data["t"]["n"]
-        points = [p for p in tag_data.get("d", []) if "v" in p]
-        result[name] = points
-
-    return result, None
-
-
-def get_delta(points):
-    """Get delta value for a cumulative counter (last - first)."""
-    if not points:
-        return None
-    if len(points) == 1:
-        return 0.0
-    return points[-1]["v"] - points[0]["v"]
-
-
-def get_latest(points):
+def get_latest(series):
     """Get the most recent value."""
-    if not points:
+    if not series:
         return None
-    return points[-1]["v"]
+    return series.values[-1]
 
 
-def main():
-    args = parse_args()
-
-    if args.start and args.end:
-        start, end = args.start, args.end
-    else:
-        start, end = resolve_shift(args.shift)
-
-    line = args.line
+def line_tags(line):
+    """Every tag read for one line, keyed by metric name."""
+    tags = {}
+    for group in (TIME_TAGS, COUNT_TAGS, RATE_TAGS, WO_TAGS):
+        tags.update({key: f"{line}/{suffix}" for key, suffix in group.items()})
+    return tags
 
-    # --- Tags to query ---
 
-    # Cumulative time counters (delta = seconds in each state during the shift)
-    time_tags = {
-        "timerunning": f"{line}/metric/input/timerunning",
-        "timeidle": f"{line}/metric/input/timeidle",
-        "timedownplanned": f"{line}/metric/input/timedownplanned",
-        "timedownunplanned": f"{line}/metric/input/timedownunplanned",
-    }
-
-    # Cumulative production counters (delta = units during the shift)
-    count_tags = {
-        "countinfeed": f"{line}/metric/input/countinfeed",
-        "countoutfeed": f"{line}/metric/input/countoutfeed",
-        "countdefect": f"{line}/metric/input/countdefect",
-    }
+def counter_values(line, counters):
+    """Counter deltas of one line and the resets they absorbed, or None without time data.
 
-    # Instantaneous rates (latest value)
-    rate_tags = {
-        "rateactual": f"{line}/metric/input/rateactual",
-        "ratestandard": f"{line}/metric/input/ratestandard",
-    }
-
-    # Work order data (latest value)
-    wo_tags = {
-        "wo_number": f"{line}/workorder/workordernumber",
-        "wo_product": f"{line}/workorder/lotnumber/item/itemname",
-        "wo_actual": f"{line}/workorder/quantityactual",
-        "wo_target": f"{line}/workorder/quantitytarget",
-        "wo_defect": f"{line}/workorder/quantitydefect",
-        "wo_uom": f"{line}/workorder/uom",
-    }
-
-    all_tags = list(time_tags.values()) + list(count_tags.values()) + list(rate_tags.values()) + list(wo_tags.values())
-
-    # Query historian
-    data, err = query_historian(args.historian, args.dataset, all_tags, start, end)
-    if err:
-        json.dump({"status": "error", "message": f"Historian query failed: {err}"}, sys.stdout, indent=2)
-        sys.exit(1)
-
-    # --- Extract raw values ---
+    ``counters`` maps the line's counter tags to fed CounterDelta objects.
+    """
+    tags = line_tags(line)
+    deltas = {key: counters[tags[name]] for key, name in COUNTER_KEYS.items()}
 
     # Time deltas (seconds in each state during shift)
-    t_running = get_delta(data.get(time_tags["timerunning"], []))
-    t_idle = get_delta(data.get(time_tags["timeidle"], []))
-    t_down_planned = get_delta(data.get(time_tags["timedownplanned"], []))
-    t_down_unplanned = get_delta(data.get(time_tags["timedownunplanned"], []))
-
+    t_running = deltas["t_running"].delta
     if t_running is None:
-        json.dump({"status": "error", "message": f"No time data for {line}"}, sys.stdout, indent=2)
-        sys.exit(1)
+        return None
 
-    # Default missing time counters to 0
-    t_idle = t_idle or 0.0
-    t_down_planned = t_down_planned or 0.0
-    t_down_unplanned = t_down_unplanned or 0.0
+    return {
+        "t_running": t_running,
+        # Default missing time counters to 0
+        "t_idle": deltas["t_idle"].delta or 0.0,
+        "t_down_planned": deltas["t_down_planned"].delta or 0.0,
+        "t_down_unplanned": deltas["t_down_unplanned"].delta or 0.0,
+        # Count deltas (units during shift)
+        "c_infeed": deltas["c_infeed"].delta or 0.0,
+        "c_outfeed": deltas["c_outfeed"].delta or 0.0,
+        "c_defect": deltas["c_defect"].delta or 0.0,
+        # Resets and rollovers absorbed by the counter deltas
+        "counter_resets": sum(counter.discontinuities for counter in deltas.values()),
+    }
 
-    # Count deltas (units during shift)
-    c_infeed = get_delta(data.get(count_tags["countinfeed"], [])) or 0.0
-    c_outfeed = get_delta(data.get(count_tags["countoutfeed"], [])) or 0.0
-    c_defect = get_delta(data.get(count_tags["countdefect"], [])) or 0.0
 
-    # Rates (instantaneous)
-    rate_actual = get_latest(data.get(rate_tags["rateactual"], [])) or 0.0
-    rate_standard = get_latest(data.get(rate_tags["ratestandard"], [])) or 0.0
+def line_values(line, data, counters=None, modulus=None):
+    """Raw shift values for one line from the fetched data, or None without time data.
 
+    ``counters`` maps counter tags to CounterDelta objects already fed
+    (--fetch stream); otherwise they are computed from the series in ``data``,
+    wrapping at ``modulus`` if given.
+    """
+    tags = line_tags(line)
+    if counters is None:
+        counters = {tags[name]: counter_delta(data.get(tags[name]), modulus) for name in COUNTER_KEYS.values()}
+    values = counter_values(line, counters)
+    if values is None:
+        return None
+    # Rates (instantaneous)
+    values["rate_actual"] = get_latest(data.get(tags["rateactual"])) or 0.0
+    values["rate_standard"] = get_latest(data.get(tags["ratestandard"])) or 0.0
     # Work order
-    wo_number = get_latest(data.get(wo_tags["wo_number"], []))
-    wo_product = get_latest(data.get(wo_tags["wo_product"], []))
-    wo_actual = get_latest(data.get(wo_tags["wo_actual"], []))
-    wo_target = get_latest(data.get(wo_tags["wo_target"], []))
-    wo_defect = get_latest(data.get(wo_tags["wo_defect"], []))
-    wo_uom = get_latest(data.get(wo_tags["wo_uom"], []))
+    for key in WO_TAGS:
+        values[key] = get_latest(data.get(tags[key]))
+    return values
+
 
-    # --- Compute derived metrics ---
+def bucket_deltas(series, start_ms, bucket_ms, count, modulus=None):
+    """Per-bucket increase of a cumulative counter, in one pass over its points.
+
+    Returns (deltas, resets): the increase and the counter resets or
+    rollovers detected in each bucket. The change between two consecutive
+    points is credited to the bucket of the later point, so the buckets add
+    up to the whole-window delta.
+    """
+    deltas = [0.0] * count
+    resets = [0] * count
+    if not series:
+        return deltas, resets
+    times, values = series.times, series.values
+    counter = CounterDelta(modulus)
+    step = counter.step
+    last = count - 1
+    step(values[0])
+    for i in range(1, len(times)):
+        index = min(max((times[i] - start_ms) // bucket_ms, 0), last)
+        seen = counter.resets + counter.rollovers
+        deltas[index] += step(values[i])
+        if counter.resets + counter.rollovers != seen:
+            resets[index] += 1
+    return deltas, resets
+
+
+def timeline_row(values):
+    """Compact counter-derived metrics for one bucket or shift."""
+    metrics = production_metrics({**values, "rate_actual": 0.0, "rate_standard": 0.0})
+    utilization, production = metrics["time_utilization"], metrics["production"]
+    row = {
+        "running_seconds": utilization["running_seconds"],
+        "pct_running": utilization["pct_running"],
+        "pct_unplanned_down": utilization["pct_unplanned_down"],
+        "units_in": production["units_in"],
+        "units_out": production["units_out"],
+        "defects": production["defects"],
+        "yield_pct": production["yield_pct"],
+        "throughput_per_hour": production["throughput_per_hour"],
+    }
+    if values.get("counter_resets"):
+        row["counter_resets"] = values["counter_resets"]
+    return row
+
+
+def counter_columns(line, data, start_ms, bucket_ms, count, modulus=None):
+    """Per-bucket line values (counter deltas and resets) for every bucket."""
+    tags = line_tags(line)
+    columns = {key: bucket_deltas(data.get(tags[name]), start_ms, bucket_ms, count, modulus)
+               for key, name in COUNTER_KEYS.items()}
+    rows = []
+    for i in range(count):
+        values = {key: deltas[i] for key, (deltas, _) in columns.items()}
+        values["counter_resets"] = sum(resets[i] for _, resets in columns.values())
+        rows.append(values)
+    return rows
+
+
+def line_buckets(line, data, start_ms, end_ms, bucket_ms, modulus=None):
+    """Compact per-bucket timeline for one line."""
+    count = max(1, math.ceil((end_ms - start_ms) / bucket_ms))
+    return [{"start": format_iso_ms(start_ms + i * bucket_ms), **timeline_row(values)}
+            for i, values in enumerate(counter_columns(line, data, start_ms, bucket_ms, count, modulus))]
+
+
+def shift_trend(client, args, lines, windows, modulus=None):
+    """Per-shift rows for every line: dict of line -> rows, or (None, error).
+
+    Shifts in the rollup store are read from it. The counters of the rest
+    are streamed once per run of consecutive missing shifts and split at the
+    shift boundaries (stream_counters), which gives the same values as a
+    single-shift query of each.
+    """
+    found = [{} for _ in windows]
+    store = open_store(args, "stream", modulus)
+    if store:
+        try:
+            for i, (start, end) in enumerate(windows):
+                shift = closed_shift(start, end)
+                if shift:
+                    found[i] = store.get_many(client.historian_key, args.dataset, lines, shift)
+        finally:
+            store.close()
+
+    missing = [i for i, values_by_line in enumerate(found) if len(values_by_line) < len(lines)]
+    runs = []
+    for i in missing:
+        if runs and runs[-1][-1] == i - 1:
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+    for run in runs:
+        pending = [line for line in lines if any(line not in found[i] for i in run)]
+        with stage("fetch"):
+            counters, err = stream_counters(client, args.dataset, pending, windows[run[0]:run[-1] + 1], modulus)
+        if err:
+            return None, err
+        for i, shift_counters in zip(run, counters):
+            for line in pending:
+                found[i].setdefault(line, counter_values(line, shift_counters))
+
+    trends = {line: [] for line in lines}
+    for (start, _), values_by_line in zip(windows, found):
+        for line in lines:
+            row = {"start": start, "shift": shift_label(start)}
+            if values_by_line[line] is None:
+                row["status"] = "no_data"
+            else:
+                row.update(timeline_row(values_by_line[line]))
+            trends[line].append(row)
+    return trends, None
+
+
+def production_metrics(values):
+    """time_utilization and production blocks from raw (or summed) line values."""
+    t_running = values["t_running"]
+    t_idle = values["t_idle"]
+    t_down_planned = values["t_down_planned"]
+    t_down_unplanned = values["t_down_unplanned"]
+    c_infeed = values["c_infeed"]
+    c_outfeed = values["c_outfeed"]
+    c_defect = values["c_defect"]
+    rate_actual = values["rate_actual"]
+    rate_standard = values["rate_standard"]
 
     # Time utilization
     total_time = t_running + t_idle + t_down_planned + t_down_unplanned
@@ -229,20 +420,7 @@ def main():
     else:
         yield_pct = None
 
-    # Work order completion
-    if wo_target is not None and wo_target > 0 and wo_actual is not None:
-        wo_completion = round(wo_actual / wo_target * 100, 1)
-    else:
-        wo_completion = None
-
-    # --- Build output ---
-    output = {
-        "line": line,
-        "period": {
-            "start": start,
-            "end": end,
-            "shift": shift_label(start) if not (args.start and args.end) else "custom",
-        },
+    return {
         "time_utilization": {
             "total_seconds": round(total_time, 1),
             "running_seconds": round(t_running, 1),
@@ -264,20 +442,275 @@ def main():
             "rate_standard": round(rate_standard, 1),
             "rate_efficiency_pct": rate_efficiency,
         },
-        "work_order": {
-            "number": wo_number,
-            "product": wo_product,
-            "actual": round(wo_actual) if wo_actual is not None else None,
-            "target": round(wo_target) if wo_target is not None else None,
-            "defects": round(wo_defect) if wo_defect is not None else None,
-            "completion_pct": wo_completion,
-            "uom": wo_uom,
-        },
+    }
+
+
+def work_order_block(values):
+    wo_actual = values["wo_actual"]
+    wo_target = values["wo_target"]
+    wo_defect = values["wo_defect"]
+
+    # Work order completion
+    if wo_target is not None and wo_target > 0 and wo_actual is not None:
+        wo_completion = round(wo_actual / wo_target * 100, 1)
+    else:
+        wo_completion = None
+
+    return {
+        "number": values["wo_number"],
+        "product": values["wo_product"],
+        "actual": round(wo_actual) if wo_actual is not None else None,
+        "target": round(wo_target) if wo_target is not None else None,
+        "defects": round(wo_defect) if wo_defect is not None else None,
+        "completion_pct": wo_completion,
+        "uom": values["wo_uom"],
+    }
+
+
+def rollup(values_list):
+    """Combined metrics for several lines.
+
+    Times and counts are summed, so utilization, yield and throughput are
+    the pooled figures; rate efficiency is sum(rateactual) / sum(ratestandard),
+    i.e. the line efficiencies weighted by their standard rate.
+    """
+    totals = {key: sum(values[key] for values in values_list) for key in ROLLUP_KEYS}
+    return {"lines": len(values_list), **production_metrics(totals),
+            "counter_resets": sum(values["counter_resets"] for values in values_list)}
+
+
+def stream_counters(client, dataset, lines, windows, modulus=None):
+    """Stream the lines' counters once over consecutive windows, one CounterDelta per tag and window.
+
+    Returns (list of dict of tag_name -> CounterDelta, one per window, error).
+    Each window's engines start from its own first point. A point exactly on
+    the edge between two windows also closes the earlier one, so each window
+    gets the values a query of [start, end] alone would give. The chunks are
+    epoch-aligned hours, so 06:00 / 18:00 shift edges never fall inside one.
+    """
+    counter_names = set(COUNTER_KEYS.values())
+    tags = [tag for line in lines for name, tag in line_tags(line).items() if name in counter_names]
+    counters = [{tag: CounterDelta(modulus) for tag in tags} for _ in windows]
+    edges = [parse_iso_ms(start) for start, _ in windows[1:]]
+    try:
+        for lo, _, chunk, errors in client.iter_chunks(dataset, tags, windows[0][0], windows[-1][1],
+                                                       STREAM_CHUNK_SECONDS):
+            if errors:
+                return None, next(iter(errors.values()))
+            note_series(chunk)
+            lo_ms = parse_iso_ms(lo)
+            index = bisect_right(edges, lo_ms)
+            opens_window = index and edges[index - 1] == lo_ms
+            for tag, series in chunk.items():
+                if not series:
+                    continue
+                if opens_window and series.times[0] == lo_ms:
+                    counters[index - 1][tag].step(series.values[0])
+                counters[index][tag].advance(series.values)
+    except ValueError as e:
+        return None, str(e)
+    return counters, None
+
+
+def fetch_lines(client, dataset, lines, start, end, fetch="stream", modulus=None):
+    """Fetch every line's tags in one batched query.
+
+    Returns (data, counters, error). ``counters`` maps counter tags to fed
+    CounterDelta objects (wrapping at ``modulus``) for --fetch stream and is
+    None otherwise.
+    """
+    all_tags = [tag for line in lines for tag in line_tags(line).values()]
+    # Every whole-window metric uses only the first and/or last point of
+    # each tag, so boundary mode skips the points in between.
+    if fetch != "stream":
+        query = client.query_boundaries if fetch == "boundary" else client.query
+        data, err = query(dataset, all_tags, start, end)
+        return data, None, err
+
+    # Stream: counters chunk by chunk through their engines, the rest as boundaries
+    counters, err = stream_counters(client, dataset, lines, [(start, end)], modulus)
+    if err:
+        return None, None, err
+    counters = counters[0]
+    other_tags = [tag for tag in all_tags if tag not in counters]
+    data, err = client.query_boundaries(dataset, other_tags, start, end)
+    return data, counters, err
+
+
+def open_store(args, fetch, modulus):
+    """The shift rollup store, or None if this run's values differ from what it holds.
+
+    It holds values from every counter point with no rollover width.
+    """
+    if args.bucket or args.no_cache or fetch == "boundary" or modulus:
+        return None
+    return ShiftRollupStore.open(args.rollup_db)
+
+
+def window_values(client, dataset, lines, start, end, fetch, modulus=None, store=None):
+    """Raw values of every line over one window.
+
+    Returns (values_by_line, fetched lines, data, error). A closed shift is
+    read from ``store`` when it holds it; only the lines it lacks are
+    fetched, and added to it. Lines without time data map to None.
+    """
+    shift = closed_shift(start, end) if store else None
+    values_by_line = store.get_many(client.historian_key, dataset, lines, shift) if shift else {}
+    pending = [line for line in lines if line not in values_by_line]
+    data = {}
+    if pending:
+        # One combined tag set for every line, fetched in a single batched query
+        with stage("fetch"):
+            data, counters, err = fetch_lines(client, dataset, pending, start, end, fetch, modulus)
+        if err:
+            return None, pending, None, err
+        note_series(data)
+        computed = {line: line_values(line, data, counters, modulus) for line in pending}
+        if shift:
+            store.put_many(client.historian_key, dataset, {line: v for line, v in computed.items() if v is not None},
+                           shift)
+        values_by_line.update(computed)
+    return values_by_line, pending, data, None
+
+
+def line_site(line):
+    """Site path of a line path like 'Enterprise B/Site1/fillerproduction/fillingline01'."""
+    return line.rstrip("/").rsplit("/", 2)[0]
+
+
+def resolve_lines(args):
+    """Line paths from --line and --site, in order and without duplicates.
+
+    Returns (lines, error).
+    """
+    lines = [line.rstrip("/") for line in args.line or []]
+    for site_path in resolve_sites(args.site or []):
+        site_name = identify_site(site_path)
+        if site_name not in SITE_CONFIG:
+            return None, f"Unknown site: {site_name}. Expected: {list(SITE_CONFIG.keys())}"
+        lines.extend(f"{site_path}/fillerproduction/{name}" for name in SITE_CONFIG[site_name]["filling_lines"])
+    if not lines:
+        return None, "Specify at least one --line or --site"
+    return list(dict.fromkeys(lines)), None
+
+
+def run(args, client):
+    """Run the analysis for parsed arguments. Returns (output, exit_code)."""
+    with stage("resolve_window"):
+        if args.start and args.end:
+            start, end = args.start, args.end
+        else:
+            start, end = resolve_shift(args.shift)
+
+    lines, err = resolve_lines(args)
+    if err:
+        return {"status": "error", "message": err}, 1
+
+    if args.shifts is not None:
+        return run_trend(args, client, lines)
+
+    # Bucketed timelines need every point in memory, not just running counter totals
+    fetch = args.fetch or ("full" if args.bucket else "stream")
+    modulus = ROLLOVER_WIDTHS.get(args.rollover_bits)
+    if args.bucket:
+        if fetch != "full":
+            return {"status": "error", "message": "--bucket needs the full series; use --fetch full"}, 1
+        start_ms, end_ms = parse_iso_ms(start), parse_iso_ms(end)
+        if end_ms <= start_ms:
+            return {"status": "error", "message": "--end must be after --start"}, 1
+        if math.ceil((end_ms - start_ms) / args.bucket) > MAX_BUCKETS:
+            return {"status": "error",
+                    "message": f"--bucket too small: more than {MAX_BUCKETS} buckets in the window"}, 1
+
+    # Closed shifts come from the rollup store; only lines it lacks are fetched
+    store = open_store(args, fetch, modulus) if closed_shift(start, end) else None
+    try:
+        values_by_line, _, data, err = window_values(client, args.dataset, lines, start, end, fetch, modulus, store)
+    finally:
+        if store:
+            store.close()
+    if err:
+        return {"status": "error", "message": f"Historian query failed: {err}"}, 1
+
+    period = {
+        "start": start,
+        "end": end,
+        "shift": shift_label(start) if not (args.start and args.end) else "custom",
+    }
+
+    if len(lines) == 1 and not args.site:
+        line = lines[0]
+        values = values_by_line[line]
+        if values is None:
+            return {"status": "error", "message": f"No time data for {line}"}, 1
+        output = {
+            "line": line,
+            "period": period,
+            **production_metrics(values),
+            "work_order": work_order_block(values),
+            "counter_resets": values["counter_resets"],
+            "status": "ok",
+        }
+        if args.bucket:
+            output["buckets"] = line_buckets(line, data, start_ms, end_ms, args.bucket, modulus)
+            output["status"] = output.pop("status")
+        return output, 0
+
+    line_blocks = {}
+    by_site = {}
+    for line in lines:
+        values = values_by_line[line]
+        if values is None:
+            line_blocks[line] = {"status": "error", "message": f"No time data for {line}"}
+            continue
+        line_blocks[line] = {**production_metrics(values), "work_order": work_order_block(values),
+                             "counter_resets": values["counter_resets"]}
+        if args.bucket:
+            line_blocks[line]["buckets"] = line_buckets(line, data, start_ms, end_ms, args.bucket, modulus)
+        line_blocks[line]["status"] = "ok"
+        by_site.setdefault(line_site(line), []).append(values)
+    if not by_site:
+        return {"status": "error", "message": f"No time data for any of {len(lines)} lines"}, 1
+
+    output = {
+        "lines": line_blocks,
+        "sites": {site_path: rollup(site_values) for site_path, site_values in by_site.items()},
+        "period": period,
         "status": "ok",
     }
+    if len(by_site) > 1:
+        output["total"] = rollup([values for site_values in by_site.values() for values in site_values])
+
+    return output, 0
 
-    json.dump(output, sys.stdout, indent=2)
-    print()
+
+def run_trend(args, client, lines):
+    """--shifts N: one compact per-shift series per line."""
+    if args.shifts < 1:
+        return {"status": "error", "message": "--shifts must be at least 1"}, 1
+    if args.bucket or (args.start and args.end):
+        return {"status": "error", "message": "--shifts cannot be combined with --bucket or --start/--end"}, 1
+    if args.fetch not in (None, "stream"):
+        return {"status": "error", "message": "--shifts streams the counters; omit --fetch"}, 1
+
+    with stage("resolve_window"):
+        windows = shift_windows(args.shifts)
+    trends, err = shift_trend(client, args, lines, windows, ROLLOVER_WIDTHS.get(args.rollover_bits))
+    if err:
+        return {"status": "error", "message": f"Historian query failed: {err}"}, 1
+
+    period = {"start": windows[0][0], "end": windows[-1][1], "shifts": len(windows)}
+    if len(lines) == 1 and not args.site:
+        return {"line": lines[0], "period": period, "trend": trends[lines[0]], "status": "ok"}, 0
+    return {
+        "lines": {line: {"trend": rows, "status": "ok"} for line, rows in trends.items()},
+        "period": period,
+        "status": "ok",
+    }, 0
+
+
+def main():
+    run_cli(parse_args, run)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Reset- and rollover-aware deltas of cumulative counters.
+
+A production or state-time counter only ever increases, except when the PLC
+resets it (a work-order change, a restart) or it wraps at its integer width.
+Taking last - first then gives a negative or meaningless figure. A
+CounterDelta instead sums the positive increments between consecutive
+points. A drop is a reset, after which the counter is taken to count up
+from zero. Only for a counter known to wrap at an integer width (opt-in,
+see ROLLOVER_WIDTHS) is a drop from the top of that width to the bottom of
+it a rollover, worth the distance to the wrap plus the new value. Drops
+within floating-point noise are ignored. The state is constant (the last
+value and the running sums), so a series can be fed in chunks, e.g. from
+HistorianClient.iter_chunks, without holding it in memory.
+
+Zero external dependencies (stdlib only).
+"""
+
+
+# Integer widths (bits) a PLC counter can be declared to wrap at, and the modulus.
+ROLLOVER_WIDTHS = {16: 2 ** 16, 31: 2 ** 31, 32: 2 ** 32}
+# A drop is a rollover only from the top of a width to the bottom of it.
+ROLLOVER_MARGIN = 0.1
+# Relative drop treated as noise rather than a reset.
+NOISE_FRACTION = 1e-9
+
+
+def is_rollover(last, value, modulus):
+    """Whether falling from ``last`` to ``value`` is a wrap at ``modulus``."""
+    return (1.0 - ROLLOVER_MARGIN) * modulus <= last < modulus and 0 <= value < ROLLOVER_MARGIN * modulus
+
+
+class CounterDelta:
+    """Running increase of one cumulative counter, fed point by point or in chunks.
+
+    ``modulus`` is the value the counter wraps at (a ROLLOVER_WIDTHS entry);
+    without it every drop is a reset.
+    """
+
+    __slots__ = ("modulus", "total", "resets", "rollovers", "points", "last")
+
+    def __init__(self, modulus=None):
+        self.modulus = modulus
+        self.total = 0.0
+        self.resets = 0
+        self.rollovers = 0
+        self.points = 0
+        self.last = None
+
+    @property
+    def delta(self):
+        """Total increase; None before any point."""
+        return self.total if self.points else None
+
+    @property
+    def discontinuities(self):
+        """Detected resets plus rollovers."""
+        return self.resets + self.rollovers
+
+    def step(self, value):
+        """Feed the next value. Returns the increase it adds."""
+        last = self.last
+        self.points += 1
+        if last is None:
+            self.last = value
+            return 0.0
+        if value >= last:
+            increase = value - last
+        elif last - value <= NOISE_FRACTION * abs(last):
+            # Keep the higher value, so the jitter is not counted twice
+            return 0.0
+        else:
+            modulus = self.modulus
+            if modulus is not None and is_rollover(last, value, modulus):
+                increase = modulus - last + value
+                self.rollovers += 1
+            else:
+                increase = max(value, 0.0)
+                self.resets += 1
+        self.last = value
+        self.total += increase
+        return increase
+
+    def advance(self, values):
+        """Feed a chunk of values in time order."""
+        step = self.step
+        for value in values:
+            step(value)
+        return self
+
+
+def counter_delta(series, modulus=None):
+    """CounterDelta of a whole TagSeries (None or empty gives no points)."""
+    counter = CounterDelta(modulus)
+    if series:
+        counter.advance(series.values)
+    return counter
@@ -10,13 +10,11 @@ Usage:
 """
 
 import argparse
-import json
-import sys
-import urllib.request
-import urllib.parse
-import urllib.error
 from datetime import datetime, timezone, timedelta
 
+from historian_client import add_historian_arguments, run_cli
+from profiling import note_series, stage
+
 
 SITE_FIRST_LINE = {
     "Site1": "fillingline01",
@@ -25,16 +23,17 @@ SITE_FIRST_LINE = {
 }
 
 
-def parse_args():
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Discover available data range for a site")
     parser.add_argument("--site", required=True,
                         help="ISA-95 site path, e.g. 'Enterprise B/Site1'")
-    parser.add_argument("--historian", default="http://localhost:4511",
-                        help="Historian base URL")
-    parser.add_argument("--dataset", default="Virtual Factory",
-                        help="Dataset name")
-    return parser.parse_args()
+    add_historian_arguments(parser, timeout=15)
+    return parser
+
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
 
 
 def identify_site(site_path):
@@ -43,30 +42,6 @@ def identify_site(site_path):
     return parts[-1]
 
 
-def query_historian(base_url, dataset, tag_name, start, end):
-    """Query the historian for a single tag over a time range."""
-    params = [
-        ("tagname", tag_name),
-        ("start", start),
-        ("end", end),
-    ]
-    query = urllib.parse.urlencode(params, quote_via=urllib.parse.quote)
-    url = f"{base_url}/api/datasets/{urllib.parse.quote(dataset)}/data?{query}"
-
-    req = urllib.request.Request(url)
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            data = json.loads(resp.read().decode())
-    except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError) as e:
-        return None, str(e)
-
-    for tag_data in data.get("tl", []):
-        if tag_data["t"]["n"] == tag_name:
-            return [p for p in tag_data.get("d", []) if "v" in p], None
-
-    return [], None
-
-
 def recommend_window(earliest_ts, latest_ts):
     """Recommend a 12-hour analysis window containing the most recent data.
 
@@ -93,44 +68,44 @@ def recommend_window(earliest_ts, latest_ts):
     return shift_start.isoformat(), shift_end.isoformat()
 
 
-def main():
-    args = parse_args()
-
+def run(args, client):
+    """Run the analysis for parsed arguments. Returns (output, exit_code)."""
     site_name = identify_site(args.site)
     if site_name not in SITE_FIRST_LINE:
-        json.dump({
+        return {
             "status": "error",
             "message": f"Unknown site: {site_name}. Expected: {list(SITE_FIRST_LINE.keys())}",
-        }, sys.stdout, indent=2)
-        sys.exit(1)
+        }, 1
 
     first_line = SITE_FIRST_LINE[site_name]
     probe_tag = f"{args.site}/fillerproduction/{first_line}/metric/oee"
 
     # Query the last 30 days to find data boundaries
-    now = datetime.now(timezone.utc)
-    start_30d = (now - timedelta(days=30)).isoformat()
-    end_now = now.isoformat()
+    with stage("resolve_window"):
+        now = datetime.now(timezone.utc)
+        start_30d = (now - timedelta(days=30)).isoformat()
+        end_now = now.isoformat()
 
-    points, err = query_historian(args.historian, args.dataset, probe_tag, start_30d, end_now)
+    with stage("fetch"):
+        data, err = client.query(args.dataset, [probe_tag], start_30d, end_now)
     if err:
-        json.dump({
+        return {
             "status": "error",
             "message": f"Historian query failed: {err}",
-        }, sys.stdout, indent=2)
-        sys.exit(1)
+        }, 1
+    note_series(data)
 
-    if not points:
-        json.dump({
+    series = data.get(probe_tag)
+    if not series:
+        return {
             "site": args.site,
             "status": "no_data",
             "message": f"No data found for {probe_tag} in the last 30 days",
             "tag_probed": probe_tag,
-        }, sys.stdout, indent=2)
-        sys.exit(0)
+        }, 0
 
-    earliest = points[0]["t"]
-    latest = points[-1]["t"]
+    earliest = series.iso(0)
+    latest = series.iso(-1)
     rec_start, rec_end = recommend_window(earliest, latest)
 
     output = {
@@ -139,13 +114,16 @@ def main():
         "latest": latest,
         "recommended_start": rec_start,
         "recommended_end": rec_end,
-        "data_points_sampled": len(points),
+        "data_points_sampled": len(series),
         "tag_probed": probe_tag,
         "status": "ok",
     }
 
-    json.dump(output, sys.stdout, indent=2)
-    print()
+    return output, 0
+
+
+def main():
+    run_cli(parse_args, run)
 
 
 if __name__ == "__main__":
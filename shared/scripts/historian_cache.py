@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Persistent on-disk cache of historian responses.
+
+Entries are keyed by (historian, dataset, tag, start, end) and hold one tag's
+TagSeries in its packed columnar form. A window that ended in the past
+(beyond a short settle margin for late-arriving data) can never change, so
+its entry never expires. A window that includes "now" is kept for a short
+TTL only, and its end is rounded down to a multiple of the TTL in the key,
+so repeated "until now" queries within one TTL share an entry (trimmed to
+each query's end). The store is a single SQLite file with size-bounded
+least-recently-used eviction.
+
+Zero external dependencies (stdlib only).
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+import zlib
+from datetime import datetime, timezone
+
+from tagseries import TagSeries, format_iso_ms
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "enterprise-b-historian")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_LIVE_TTL = 60.0
+# Windows ending less than this many seconds ago are still treated as live,
+# since the collector may deliver the last points late.
+SETTLE_SECONDS = 300.0
+# Bump when the payload encoding changes; older stores are discarded.
+SCHEMA_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    historian TEXT NOT NULL,
+    dataset   TEXT NOT NULL,
+    tag       TEXT NOT NULL,
+    win_start TEXT NOT NULL,
+    win_end   TEXT NOT NULL,
+    expires   REAL,
+    last_used REAL NOT NULL,
+    size      INTEGER NOT NULL,
+    payload   BLOB NOT NULL,
+    PRIMARY KEY (historian, dataset, tag, win_start, win_end)
+);
+CREATE INDEX IF NOT EXISTS series_last_used ON series (last_used);
+"""
+
+
+def default_cache_dir():
+    """Cache directory: $HISTORIAN_CACHE_DIR or ~/.cache/enterprise-b-historian."""
+    return os.environ.get("HISTORIAN_CACHE_DIR") or DEFAULT_CACHE_DIR
+
+
+def historian_key(base_url):
+    """Normalized historian base URL (lowercase scheme and host, explicit port, no trailing '/').
+
+    Part of every stored key, so historians that share a dataset name never
+    share entries.
+    """
+    parts = urllib.parse.urlsplit(base_url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.scheme.lower()}://{(parts.hostname or '').lower()}:{port}{parts.path.rstrip('/')}"
+
+
+def parse_timestamp(ts):
+    """Parse an ISO 8601 timestamp to epoch seconds, or None if unparseable."""
+    try:
+        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class HistorianCache:
+    """SQLite-backed LRU cache of per-tag historian series."""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, live_ttl=DEFAULT_LIVE_TTL):
+        directory = directory or default_cache_dir()
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "historian-cache.sqlite")
+        self.max_bytes = max_bytes
+        self.live_ttl = live_ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS series")
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def open(cls, directory=None, **kwargs):
+        """Open the cache, or return None (with a warning) if it is unusable."""
+        try:
+            return cls(directory, **kwargs)
+        except (OSError, sqlite3.Error) as e:
+            print(f"historian cache disabled: {e}", file=sys.stderr)
+            return None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def expiry(self, end, now=None):
+        """Expiry time for a window ending at ``end``; None means immutable."""
+        now = time.time() if now is None else now
+        end_ts = parse_timestamp(end)
+        if end_ts is not None and end_ts < now - SETTLE_SECONDS:
+            return None
+        return now + self.live_ttl
+
+    def window_end(self, end, now=None):
+        """Window end as stored in the key: live ends rounded down to a multiple of live_ttl."""
+        now = time.time() if now is None else now
+        end_ts = parse_timestamp(end)
+        if end_ts is None or end_ts < now - SETTLE_SECONDS:
+            return end
+        return format_iso_ms(int(end_ts // self.live_ttl * self.live_ttl * 1000))
+
+    def get_many(self, historian, dataset, tag_names, start, end):
+        """Look up tags for one window of one historian (a historian_key()).
+
+        Returns (dict of tag_name -> TagSeries for hits, list of missed tags).
+        """
+        now = time.time()
+        key_end = self.window_end(end, now)
+        # A live entry may reach past this query's end
+        trim_ms = None if key_end == end else int(parse_timestamp(end) * 1000)
+        end = key_end
+        hits, missed = {}, []
+        try:
+            with self._lock:
+                for tag in tag_names:
+                    row = self._db.execute(
+                        "SELECT expires, payload FROM series"
+                        " WHERE historian = ? AND dataset = ? AND tag = ? AND win_start = ? AND win_end = ?",
+                        (historian, dataset, tag, start, end)).fetchone()
+                    if row is None or (row[0] is not None and row[0] < now):
+                        missed.append(tag)
+                        continue
+                    series = TagSeries.from_bytes(tag, zlib.decompress(row[1]))
+                    if trim_ms is not None and series and series.times[-1] > trim_ms:
+                        series = series.between(series.times[0], trim_ms)
+                    hits[tag] = series
+                if hits:
+                    self._db.executemany(
+                        "UPDATE series SET last_used = ?"
+                        " WHERE historian = ? AND dataset = ? AND tag = ? AND win_start = ? AND win_end = ?",
+                        [(now, historian, dataset, tag, start, end) for tag in hits])
+        except sqlite3.Error as e:
+            print(f"historian cache read failed: {e}", file=sys.stderr)
+            return {}, list(tag_names)
+        return hits, missed
+
+    def put_many(self, historian, dataset, series, start, end):
+        """Store a dict of tag_name -> TagSeries for one window, then evict."""
+        if not series:
+            return
+        now = time.time()
+        expires = self.expiry(end, now)
+        end = self.window_end(end, now)
+        rows = []
+        for tag, tag_series in series.items():
+            payload = zlib.compress(tag_series.to_bytes(), 1)
+            rows.append((historian, dataset, tag, start, end, expires, now, len(payload), payload))
+        with self._lock:
+            try:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO series"
+                    " (historian, dataset, tag, win_start, win_end, expires, last_used, size, payload)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._evict(now)
+                self._db.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                print(f"historian cache write failed: {e}", file=sys.stderr)
+
+    def _evict(self, now):
+        """Drop expired entries, then least-recently-used ones down to 90% of max_bytes."""
+        self._db.execute("DELETE FROM series WHERE expires IS NOT NULL AND expires < ?", (now,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM series").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        doomed = []
+        for rowid, size in self._db.execute("SELECT rowid, size FROM series ORDER BY last_used"):
+            if total <= target:
+                break
+            doomed.append((rowid,))
+            total -= size
+        self._db.executemany("DELETE FROM series WHERE rowid = ?", doomed)
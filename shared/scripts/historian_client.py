@@ -0,0 +1,608 @@
+#!/usr/bin/env python3
+"""Shared Timebase historian client for the Enterprise B analysis scripts.
+
+Every script talks to the historian through one HistorianClient. The client
+keeps a small pool of persistent HTTP/1.1 keep-alive connections, so a run
+that issues many queries pays the TCP setup cost once instead of once per
+request. Timeouts, error handling and per-request latency accounting live
+here rather than in each script. Responses are kept in the on-disk
+historian_cache unless --no-cache is given, so re-running a report on a
+closed shift is served locally. Concurrent requests for the same tag and
+window share one historian fetch.
+
+Zero external dependencies (stdlib only).
+
+Usage (from another script in this directory):
+    from historian_client import add_historian_arguments, client_from_args, run_cli
+
+    client = client_from_args(args)
+    data, err = client.query(args.dataset, tag_names, start, end)
+
+    # Many tags: packed under the URL length limit, batches sent concurrently
+    data, errors = client.query_many(args.dataset, tag_names, start, end)
+
+    # Long ranges: fixed-size windows fetched concurrently, yielded in order
+    for chunk_start, chunk_end, data, errors in client.iter_chunks(
+            args.dataset, tag_names, start, end, chunk_seconds=86400):
+        ...
+"""
+
+import http.client
+import json
+import queue
+import sys
+import threading
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from historian_cache import HistorianCache, historian_key, parse_timestamp
+from profiling import run_profiled
+from tagseries import TagSeries
+
+
+DEFAULT_HISTORIAN = "http://localhost:4511"
+DEFAULT_DATASET = "Virtual Factory"
+DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 8
+DEFAULT_MAX_URL_LENGTH = 4000
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_BOUNDARY_WINDOW = 300.0
+# Most recent requests kept in detail; counts and sums cover every request.
+REQUEST_LOG_SIZE = 1000
+
+# Errors that mean a pooled keep-alive connection was closed by the server
+# between requests. The request is retried once on a fresh connection.
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+def add_historian_arguments(parser, timeout=DEFAULT_TIMEOUT):
+    """Add the shared historian connection options to an argparse parser."""
+    parser.add_argument("--historian", default=DEFAULT_HISTORIAN,
+                        help="Historian base URL")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET,
+                        help="Dataset name")
+    parser.add_argument("--timeout", type=float, default=timeout,
+                        help=f"Historian request timeout in seconds (default: {timeout:g})")
+    parser.add_argument("--log-requests", action="store_true",
+                        help="Log per-request historian latency to stderr")
+    parser.add_argument("--max-url-length", type=int, default=DEFAULT_MAX_URL_LENGTH,
+                        help=f"Pack tags into requests up to this URL length (default: {DEFAULT_MAX_URL_LENGTH})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f"Concurrent historian requests for multi-batch queries (default: {DEFAULT_MAX_WORKERS})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the on-disk historian response cache")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Historian cache directory (default: $HISTORIAN_CACHE_DIR or ~/.cache/enterprise-b-historian)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Add a _perf block (stage timings, historian counters, peak memory) to the output")
+
+
+def run_cli(parse_args, run):
+    """Shared script entry point.
+
+    Parses the command line, calls ``run(args, client)`` with a fresh
+    client, prints the returned output as JSON and exits with the returned
+    code. Scripts expose ``run`` so the same logic can be hosted in-process
+    by analytics_daemon.
+    """
+    args = parse_args()
+    client = client_from_args(args)
+    try:
+        output, exit_code = run_profiled(run, args, client)
+    finally:
+        client.log_summary()
+        client.close()
+    json.dump(output, sys.stdout, indent=2)
+    print()
+    sys.exit(exit_code)
+
+
+def client_from_args(args):
+    """Build a HistorianClient from options added by add_historian_arguments()."""
+    cache = None if args.no_cache else HistorianCache.open(args.cache_dir)
+    return HistorianClient(args.historian, timeout=args.timeout,
+                           log_requests=args.log_requests,
+                           max_url_length=args.max_url_length,
+                           max_workers=args.workers,
+                           cache=cache)
+
+
+class HistorianClient:
+    """Pooled keep-alive HTTP client for the Timebase historian API.
+
+    Safe to share between threads: each request checks a connection out of
+    the pool and returns it afterwards, and a tag/window already being
+    fetched by another thread is waited for rather than requested again.
+    With ``memoize`` the fetched series are also kept in memory for the
+    client's lifetime (used by batch runs). Query methods return a
+    ``(result, error)`` tuple; ``error`` is a message string or None.
+    """
+
+    def __init__(self, base_url=DEFAULT_HISTORIAN, timeout=DEFAULT_TIMEOUT,
+                 pool_size=DEFAULT_POOL_SIZE, log_requests=False,
+                 max_url_length=DEFAULT_MAX_URL_LENGTH, max_workers=DEFAULT_MAX_WORKERS,
+                 cache=None, memoize=False):
+        parts = urllib.parse.urlsplit(base_url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported historian URL scheme: {base_url}")
+        self.base_url = base_url
+        self.historian_key = historian_key(base_url)
+        self.timeout = timeout
+        self.log_requests = log_requests
+        self.max_url_length = max_url_length
+        self.max_workers = max(1, max_workers)
+        self.cache = cache
+        self.cache_hits = 0
+        self.memoize = memoize
+        self.shared_fetches = 0
+        self._inflight = {}
+        self._scheme = parts.scheme
+        self._host = parts.hostname
+        self._port = parts.port
+        self._prefix = parts.path.rstrip("/")
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self.requests = deque(maxlen=REQUEST_LOG_SIZE)
+        self.request_count = 0
+        self.reused_count = 0
+        self.bytes_received = 0
+        self.latency_total_ms = 0.0
+        self.latency_max_ms = 0.0
+        self.connections_opened = 0
+        self.points_decoded = 0
+        self.decode_ms = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Connection pool ---
+
+    def _new_connection(self):
+        cls = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+        with self._lock:
+            self.connections_opened += 1
+        return cls(self._host, self._port, timeout=self.timeout)
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _checkin(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        """Close all idle pooled connections and the cache."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+    # --- Requests ---
+
+    def data_path(self, dataset, params):
+        """Build the request path for the dataset data endpoint.
+
+        Every parameter is fully percent-encoded ('/' as %2F, spaces as
+        %20), as the historian expects.
+        """
+        query = urllib.parse.urlencode(params, quote_via=urllib.parse.quote)
+        return f"{self._prefix}/api/datasets/{urllib.parse.quote(dataset)}/data?{query}"
+
+    def get_json(self, path):
+        """GET a path on the historian and decode the JSON body.
+
+        Returns (data, None) on success or (None, error_message) on failure.
+        """
+        conn, reused = self._checkout()
+        started = time.perf_counter()
+        try:
+            try:
+                status, reason, body = self._roundtrip(conn, path)
+            except _STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                conn.close()
+                conn, reused = self._new_connection(), False
+                status, reason, body = self._roundtrip(conn, path)
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            self._record(started, None, 0, reused)
+            return None, str(e) or e.__class__.__name__
+
+        self._checkin(conn)
+        self._record(started, status, len(body), reused)
+        if status != 200:
+            return None, f"HTTP Error {status}: {reason}"
+        decode_started = time.perf_counter()
+        try:
+            return json.loads(body), None
+        except ValueError as e:
+            return None, f"Invalid JSON from historian: {e}"
+        finally:
+            self._count_decode(decode_started, 0)
+
+    def _roundtrip(self, conn, path):
+        conn.request("GET", path, headers={"Accept": "application/json"})
+        resp = conn.getresponse()
+        return resp.status, resp.reason, resp.read()
+
+    def _record(self, started, status, nbytes, reused):
+        latency_ms = (time.perf_counter() - started) * 1000.0
+        with self._lock:
+            self.requests.append({
+                "latency_ms": round(latency_ms, 2),
+                "status": status,
+                "bytes": nbytes,
+                "reused_connection": reused,
+            })
+            self.request_count += 1
+            self.reused_count += reused
+            self.bytes_received += nbytes
+            self.latency_total_ms += latency_ms
+            self.latency_max_ms = max(self.latency_max_ms, latency_ms)
+        if self.log_requests:
+            print(f"historian: GET {status or 'error'} {latency_ms:.1f} ms "
+                  f"{nbytes / 1024:.1f} kB ({'reused' if reused else 'new'} connection)",
+                  file=sys.stderr)
+
+    def _fetch(self, dataset, tag_names, start, end):
+        """Fetch tags from the historian in one request and fill the cache."""
+        params = [("tagname", t) for t in tag_names]
+        params.append(("start", start))
+        params.append(("end", end))
+        data, err = self.get_json(self.data_path(dataset, params))
+        if err:
+            return None, err
+
+        decode_started = time.perf_counter()
+        result = {}
+        for tag_data in data.get("tl", []):
+            name = tag_data["t"]["n"]
+            result[name] = TagSeries.from_points(name, tag_data.get("d", []))
+        del data
+        self._count_decode(decode_started, sum(len(series) for series in result.values()))
+        if self.cache is not None:
+            self.cache.put_many(self.historian_key, dataset, result, start, end)
+        return result, None
+
+    def _count_decode(self, started, points):
+        elapsed = (time.perf_counter() - started) * 1000.0
+        with self._lock:
+            self.decode_ms += elapsed
+            self.points_decoded += points
+
+    def _cached(self, dataset, tag_names, start, end):
+        """Split tags into (cached results, tags still to fetch)."""
+        if self.cache is None:
+            return {}, list(tag_names)
+        hits, missed = self.cache.get_many(self.historian_key, dataset, tag_names, start, end)
+        with self._lock:
+            self.cache_hits += len(hits)
+        return hits, missed
+
+    def _claim(self, dataset, tag_names, start, end):
+        """Register this thread as the fetcher for tags nobody else is fetching.
+
+        Returns (tags to fetch, dict of tag_name -> Future owned by another
+        fetch or memoized from an earlier one).
+        """
+        mine, shared = [], {}
+        with self._lock:
+            for tag in tag_names:
+                key = (dataset, tag, start, end)
+                future = self._inflight.get(key)
+                if future is None:
+                    self._inflight[key] = Future()
+                    mine.append(tag)
+                else:
+                    shared[tag] = future
+            self.shared_fetches += len(shared)
+        return mine, shared
+
+    def _settle(self, dataset, tag_names, start, end, data, err):
+        """Publish a fetch outcome to any threads waiting on the same tags."""
+        with self._lock:
+            futures = []
+            for tag in tag_names:
+                key = (dataset, tag, start, end)
+                futures.append(self._inflight[key] if (self.memoize and not err) else self._inflight.pop(key))
+        for tag, future in zip(tag_names, futures):
+            future.set_result((None if err else data.get(tag), err))
+
+    def _resolve(self, dataset, tag_names, start, end, max_url_length=None):
+        """Cache, then shared in-flight fetches, then URL-packed concurrent requests."""
+        results, missed = self._cached(dataset, tag_names, start, end)
+        errors = {}
+        mine, shared = self._claim(dataset, missed, start, end)
+        batches = self.plan_batches(dataset, mine, start, end, max_url_length)
+
+        def fetch(batch):
+            try:
+                data, err = self._fetch(dataset, batch, start, end)
+            except BaseException as e:
+                self._settle(dataset, batch, start, end, None, f"{type(e).__name__}: {e}")
+                raise
+            self._settle(dataset, batch, start, end, data, err)
+            return batch, data, err
+
+        if len(batches) <= 1 or self.max_workers == 1:
+            outcomes = map(fetch, batches)
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+                outcomes = list(pool.map(fetch, batches))
+
+        for batch, data, err in outcomes:
+            if err:
+                errors.update((t, err) for t in batch)
+            else:
+                results.update(data)
+        for tag, future in shared.items():
+            series, err = future.result()
+            if err:
+                errors[tag] = err
+            elif series is not None:
+                results[tag] = series
+        return results, errors
+
+    def query(self, dataset, tag_names, start, end):
+        """Query one or more tags over a time range.
+
+        Returns (dict of tag_name -> TagSeries, None) or
+        (None, error_message). Points without a value are dropped.
+        """
+        result, errors = self._resolve(dataset, tag_names, start, end)
+        if errors:
+            return None, next(iter(errors.values()))
+        return result, None
+
+    def list_tags(self, dataset):
+        """List the dataset's tags.
+
+        Returns (list of {"n": tag_name, "t": type}, None) or (None, error_message).
+        """
+        data, err = self.get_json(f"{self._prefix}/api/datasets/{urllib.parse.quote(dataset)}/tags")
+        if err:
+            return None, err
+        return data.get("User", []), None
+
+    def plan_batches(self, dataset, tag_names, start, end, max_url_length=None):
+        """Greedily pack tags into batches whose request URL fits the limit.
+
+        A tag that alone exceeds the limit still gets a batch of its own.
+        """
+        limit = max_url_length or self.max_url_length
+        origin = f"{self._scheme}://{self._host}" + (f":{self._port}" if self._port else "")
+        fixed = len(origin) + len(self.data_path(dataset, [("start", start), ("end", end)]))
+
+        batches = []
+        batch, length = [], fixed
+        for tag in tag_names:
+            # "tagname=<quoted tag>&" — same quoting as data_path()
+            cost = len(urllib.parse.urlencode([("tagname", tag)], quote_via=urllib.parse.quote)) + 1
+            if batch and length + cost > limit:
+                batches.append(batch)
+                batch, length = [], fixed
+            batch.append(tag)
+            length += cost
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def query_many(self, dataset, tag_names, start, end, max_url_length=None):
+        """Query any number of tags with as few requests as the URL limit allows.
+
+        Batches are dispatched concurrently on up to ``max_workers`` pooled
+        connections, so the whole set costs roughly one round trip.
+        Returns (dict of tag_name -> TagSeries, dict of tag_name -> error).
+        """
+        return self._resolve(dataset, tag_names, start, end, max_url_length)
+
+    def iter_chunks(self, dataset, tag_names, start, end, chunk_seconds, read_ahead=None):
+        """Fetch [start, end] as consecutive windows, yielding them in time order.
+
+        Window edges fall on multiples of ``chunk_seconds`` since the epoch,
+        so a closed window has the same cache key on every run. Up to
+        ``read_ahead`` windows (default ``max_workers``) are fetched
+        concurrently while the caller works through earlier ones, which
+        bounds memory by the chunk size rather than the range. Windows are
+        half-open: a point on a shared edge is yielded with the later
+        window, like the epoch-aligned buckets of tagseries.resample(), and
+        each point is yielded once.
+
+        Yields (chunk_start, chunk_end, dict of tag_name -> TagSeries,
+        dict of tag_name -> error). Raises ValueError for an unparseable range.
+        """
+        start_ts, end_ts = parse_timestamp(start), parse_timestamp(end)
+        if start_ts is None or end_ts is None:
+            raise ValueError(f"Invalid time range: {start} – {end}")
+        windows = _chunk_windows(start, end, start_ts, end_ts, chunk_seconds)
+        read_ahead = max(1, read_ahead or self.max_workers)
+        edge = {"last_ms": {}, "carry": {}, "final": windows[-1][1]}
+        with ThreadPoolExecutor(max_workers=min(read_ahead, len(windows))) as pool:
+            pending = deque()
+            try:
+                for lo, hi in windows:
+                    pending.append((lo, hi, pool.submit(self.query_many, dataset, tag_names, lo, hi)))
+                    if len(pending) < read_ahead:
+                        continue
+                    yield _next_chunk(pending.popleft(), edge)
+                while pending:
+                    yield _next_chunk(pending.popleft(), edge)
+            finally:
+                for _, _, future in pending:
+                    future.cancel()
+
+    def query_boundaries(self, dataset, tag_names, start, end, window=DEFAULT_BOUNDARY_WINDOW):
+        """Fetch only the first and last point of each tag within [start, end].
+
+        The historian has no first/last aggregate, so this queries a narrow
+        head window [start, start + window] and tail window [end - window, end]
+        concurrently. Tags with no point in a window are retried with a 4x
+        wider one until the windows cover the whole range, so the result is
+        the same as taking the first and last point of a full query.
+
+        Returns (dict of tag_name -> TagSeries of at most two points, None)
+        or (None, error_message). A tag with a single point in range has a
+        one-point series; a tag with none has an empty series.
+        """
+        start_ts, end_ts = parse_timestamp(start), parse_timestamp(end)
+        if start_ts is None or end_ts is None:
+            return None, f"Invalid time range: {start} – {end}"
+
+        first, last = {}, {}
+        need_first, need_last = list(tag_names), list(tag_names)
+        width = window
+        while need_first or need_last:
+            if 2 * width >= end_ts - start_ts:
+                # Windows would overlap: one full-range query settles the rest.
+                pending = list(dict.fromkeys(need_first + need_last))
+                data, errors = self.query_many(dataset, pending, start, end)
+                if errors:
+                    return None, next(iter(errors.values()))
+                for tag in pending:
+                    series = data.get(tag)
+                    if series:
+                        first.setdefault(tag, series.take([0]))
+                        last.setdefault(tag, series.take([-1]))
+                break
+
+            head_end = _isoformat(start_ts + width)
+            tail_start = _isoformat(end_ts - width)
+            jobs = [(need_first, start, head_end), (need_last, tail_start, end)]
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                outcomes = list(pool.map(
+                    lambda job: self.query_many(dataset, job[0], job[1], job[2]), jobs))
+            for _, errors in outcomes:
+                if errors:
+                    return None, next(iter(errors.values()))
+
+            head, tail = outcomes[0][0], outcomes[1][0]
+            for tag in need_first:
+                if head.get(tag):
+                    first[tag] = head[tag].take([0])
+            for tag in need_last:
+                if tail.get(tag):
+                    last[tag] = tail[tag].take([-1])
+            need_first = [t for t in need_first if t not in first]
+            need_last = [t for t in need_last if t not in last]
+            width *= 4
+
+        result = {}
+        for tag in tag_names:
+            if tag not in first:
+                result[tag] = TagSeries(tag)
+            elif first[tag].times[0] == last[tag].times[0]:
+                result[tag] = first[tag]
+            else:
+                result[tag] = _concat(first[tag], last[tag])
+        return result, None
+
+    # --- Latency reporting ---
+
+    def stats(self):
+        """Summarize request count, connection reuse and latency.
+
+        ``latency_ms`` lists only the last REQUEST_LOG_SIZE requests; the
+        other figures cover the client's lifetime.
+        """
+        with self._lock:
+            return {
+                "requests": self.request_count,
+                "connections_opened": self.connections_opened,
+                "reused_connections": self.reused_count,
+                "cache_hits": self.cache_hits,
+                "shared_fetches": self.shared_fetches,
+                "bytes_received": self.bytes_received,
+                "total_ms": round(self.latency_total_ms, 2),
+                "max_ms": round(self.latency_max_ms, 2),
+                "latency_ms": [r["latency_ms"] for r in self.requests],
+            }
+
+    def counters(self):
+        """Cumulative totals, for measuring what one call added (see profiling)."""
+        with self._lock:
+            return {
+                "requests": self.request_count,
+                "bytes_received": self.bytes_received,
+                "cache_hits": self.cache_hits,
+                "shared_fetches": self.shared_fetches,
+                "points_decoded": self.points_decoded,
+                "decode_ms": self.decode_ms,
+            }
+
+    def log_summary(self):
+        """Print the latency summary to stderr when request logging is on."""
+        if not self.log_requests:
+            return
+        s = self.stats()
+        print(f"historian: {s['requests']} requests over {s['connections_opened']} connections "
+              f"({s['reused_connections']} reused), {s['cache_hits']} tags from cache, "
+              f"{s['total_ms']:.1f} ms total",
+              file=sys.stderr)
+
+
+def _isoformat(epoch_seconds):
+    """Format epoch seconds as a UTC ISO 8601 timestamp."""
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).isoformat()
+
+
+def _chunk_windows(start, end, start_ts, end_ts, chunk_seconds):
+    """(start, end) strings of consecutive epoch-aligned windows covering the range."""
+    edges = [start]
+    edge = (start_ts // chunk_seconds + 1) * chunk_seconds
+    while edge < end_ts:
+        edges.append(_isoformat(edge))
+        edge += chunk_seconds
+    edges.append(end)
+    return list(zip(edges, edges[1:]))
+
+
+def _next_chunk(item, edge):
+    """Resolve one iter_chunks window and move points at its end edge to the next."""
+    lo, hi, future = item
+    data, errors = future.result()
+    last_ms, carry = edge["last_ms"], edge["carry"]
+    hi_ms = None if hi == edge["final"] else int(parse_timestamp(hi) * 1000)
+    for tag in set(data) | set(carry):
+        series = data.get(tag)
+        seen = last_ms.get(tag)
+        if series and seen is not None and series.times[0] <= seen:
+            series = series.between(seen + 1, series.times[-1])
+        if series:
+            last_ms[tag] = series.times[-1]
+        held = carry.pop(tag, None)
+        if held:
+            series = _concat(held, series) if series else held
+        if series and hi_ms is not None and series.times[-1] >= hi_ms:
+            carry[tag] = series.between(hi_ms, series.times[-1])
+            series = series.between(series.times[0], hi_ms - 1)
+        if series is not None:
+            data[tag] = series
+    return lo, hi, data, errors
+
+
+def _concat(a, b):
+    """Join two series of the same tag, ``a`` preceding ``b``."""
+    if a.is_numeric and b.is_numeric:
+        return TagSeries(a.name, a.times + b.times, a.values + b.values)
+    return TagSeries(a.name, a.times + b.times, list(a.values) + list(b.values))
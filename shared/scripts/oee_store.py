@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Materialized per-shift production rollups for calculate_oee.
+
+A closed shift never changes, so the raw line values calculate_oee derives
+from every point of the historian counters (reset-aware time and count
+deltas, latest rates and work order) are kept in a SQLite file, one row per (historian, dataset, line,
+shift). Later queries for that shift are answered from the row instead of
+the historian; every reported metric is recomputed from the stored values,
+so the output is the same either way. Only whole 06:00 / 18:00 shifts that ended beyond
+the historian cache's settle margin are stored. backfill_shift_rollups.py
+fills in missing shifts ahead of time.
+
+Zero external dependencies (stdlib only).
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from historian_cache import SETTLE_SECONDS, default_cache_dir
+from tagseries import parse_iso_ms
+
+
+SHIFT_HOURS = (6, 18)
+SHIFT_MS = 12 * 3_600_000
+# Bump when the stored values change meaning; older stores are discarded.
+ROLLUP_VERSION = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shift_rollups (
+    historian   TEXT NOT NULL,
+    dataset     TEXT NOT NULL,
+    line        TEXT NOT NULL,
+    shift_start INTEGER NOT NULL,
+    shift_end   INTEGER NOT NULL,
+    computed    REAL NOT NULL,
+    payload     TEXT NOT NULL,
+    PRIMARY KEY (historian, dataset, line, shift_start, shift_end)
+);
+"""
+
+
+def default_rollup_path():
+    """Rollup store: $OEE_ROLLUP_DB or shift-rollups.sqlite in the historian cache directory."""
+    return os.environ.get("OEE_ROLLUP_DB") or os.path.join(default_cache_dir(), "shift-rollups.sqlite")
+
+
+def closed_shift(start, end, now=None):
+    """(start_ms, end_ms) if [start, end] is one whole, settled shift, else None."""
+    try:
+        start_ms, end_ms = parse_iso_ms(start), parse_iso_ms(end)
+    except (AttributeError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    hour, rest = divmod(start_ms % 86_400_000, 3_600_000)
+    if hour not in SHIFT_HOURS or rest or end_ms - start_ms != SHIFT_MS:
+        return None
+    if end_ms / 1000.0 >= now - SETTLE_SECONDS:
+        return None
+    return start_ms, end_ms
+
+
+class ShiftRollupStore:
+    """SQLite table of line values per closed shift."""
+
+    def __init__(self, path=None):
+        self.path = path or default_rollup_path()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != ROLLUP_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS shift_rollups")
+            self._db.execute(f"PRAGMA user_version = {ROLLUP_VERSION}")
+        self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def open(cls, path=None):
+        """Open the store, or return None (with a warning) if it is unusable."""
+        try:
+            return cls(path)
+        except (OSError, sqlite3.Error) as e:
+            print(f"shift rollup store disabled: {e}", file=sys.stderr)
+            return None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get_many(self, historian, dataset, lines, shift):
+        """Dict of line -> stored values for one shift of one historian (a historian_key()).
+
+        Lines without a row are left out.
+        """
+        start_ms, end_ms = shift
+        found = {}
+        try:
+            with self._lock:
+                for line in lines:
+                    row = self._db.execute(
+                        "SELECT payload FROM shift_rollups"
+                        " WHERE historian = ? AND dataset = ? AND line = ? AND shift_start = ? AND shift_end = ?",
+                        (historian, dataset, line, start_ms, end_ms)).fetchone()
+                    if row is not None:
+                        found[line] = json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            print(f"shift rollup read failed: {e}", file=sys.stderr)
+            return {}
+        return found
+
+    def put_many(self, historian, dataset, values_by_line, shift):
+        """Store a dict of line -> values for one shift."""
+        if not values_by_line:
+            return
+        start_ms, end_ms = shift
+        now = time.time()
+        rows = [(historian, dataset, line, start_ms, end_ms, now, json.dumps(values, separators=(",", ":")))
+                for line, values in values_by_line.items()]
+        with self._lock:
+            try:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO shift_rollups"
+                    " (historian, dataset, line, shift_start, shift_end, computed, payload)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                print(f"shift rollup write failed: {e}", file=sys.stderr)
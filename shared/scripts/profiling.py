@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Per-invocation profiling for the Enterprise B analysis scripts.
+
+With --profile a script's JSON output gains a ``_perf`` object: wall time per
+stage (resolve_window, fetch, compute, serialize), historian requests, bytes
+received, points decoded, decode time, points returned per tag and peak
+Python memory from tracemalloc. Scripts mark their stages with
+``with stage("fetch"):``; when profiling is off that is a shared no-op
+context manager, so the instrumentation can stay in place. Time in ``run``
+outside the marked stages counts as ``compute``. Work a script hands to a
+thread pool must run in a copy of the caller's context
+(``contextvars.copy_context().run``) to be recorded; stages timed in several
+threads at once add up.
+
+``historian.decode_ms`` is the CPU time the historian client spent parsing
+JSON responses and building TagSeries, summed over its fetch threads. It
+overlaps the ``fetch`` stage and can exceed the wall time, so it is reported
+on its own rather than as a stage. In the analytics daemon the client is shared,
+so the historian figures of overlapping calls can include each other's
+requests. tracemalloc is process-wide, so profiled calls run one at a time
+(unprofiled calls still run alongside and count toward the peak).
+
+Zero external dependencies (stdlib only).
+"""
+
+import contextvars
+import json
+import threading
+import time
+import tracemalloc
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _NullProfiler:
+    """Profiler used when --profile is off: every call is a no-op."""
+
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def note_series(self, series_by_tag):
+        pass
+
+
+NULL_PROFILER = _NullProfiler()
+_current = contextvars.ContextVar("profiler", default=NULL_PROFILER)
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "started")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = (time.perf_counter() - self.started) * 1000.0
+        profiler = self.profiler
+        with profiler.lock:
+            profiler.stages[self.name] = profiler.stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+class Profiler:
+    """Collects stage timings and historian counters for one script call."""
+
+    enabled = True
+
+    def __init__(self, client):
+        self.client = client
+        self.stages = {}
+        self.points = {}
+        self.lock = threading.Lock()
+        self.run_ms = 0.0
+        self._baseline = client.counters()
+        self._started = time.perf_counter()
+        self._own_tracing = not tracemalloc.is_tracing()
+        if self._own_tracing:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def note_series(self, series_by_tag):
+        """Record how many points each fetched tag returned."""
+        with self.lock:
+            for tag, series in series_by_tag.items():
+                self.points[tag] = self.points.get(tag, 0) + len(series)
+
+    def cancel(self):
+        """Stop tracing without reporting."""
+        if self._own_tracing:
+            tracemalloc.stop()
+
+    def finish(self, output):
+        """Time serializing ``output`` and attach the ``_perf`` block to it."""
+        with self.stage("serialize"):
+            json.dumps(output, indent=2)
+        peak = tracemalloc.get_traced_memory()[1]
+        if self._own_tracing:
+            tracemalloc.stop()
+
+        counters = self.client.counters()
+        delta = {k: counters[k] - self._baseline[k] for k in counters}
+        delta["decode_ms"] = round(delta["decode_ms"], 2)
+        stages = dict(self.stages)
+        if "compute" not in stages:
+            marked = sum(v for k, v in stages.items() if k != "serialize")
+            stages["compute"] = max(0.0, self.run_ms - marked)
+        order = ("resolve_window", "fetch", "compute", "serialize")
+        output["_perf"] = {
+            "wall_ms": round((time.perf_counter() - self._started) * 1000.0, 2),
+            "stages_ms": {name: round(stages.get(name, 0.0), 2) for name in order},
+            "historian": delta,
+            "points": self.points,
+            "peak_memory_bytes": peak,
+        }
+        return output
+
+
+def stage(name):
+    """Context manager timing a named stage of the current script call."""
+    return _current.get().stage(name)
+
+
+def note_series(series_by_tag):
+    """Record per-tag point counts for the current script call."""
+    _current.get().note_series(series_by_tag)
+
+
+_PROFILE_LOCK = threading.Lock()
+
+
+def run_profiled(run, args, client):
+    """Call ``run(args, client)``, profiling it when ``args.profile`` is set."""
+    if not getattr(args, "profile", False):
+        return run(args, client)
+    # One profiled call at a time: concurrent ones would reset each other's
+    # tracemalloc peak, and the first to finish would stop tracing
+    with _PROFILE_LOCK:
+        return _run_profiled(run, args, client)
+
+
+def _run_profiled(run, args, client):
+    profiler = Profiler(client)
+    token = _current.set(profiler)
+    started = time.perf_counter()
+    try:
+        output, exit_code = run(args, client)
+        profiler.run_ms = (time.perf_counter() - started) * 1000.0
+    except BaseException:
+        profiler.cancel()
+        raise
+    finally:
+        _current.reset(token)
+    if not isinstance(output, dict):
+        profiler.cancel()
+        return output, exit_code
+    return profiler.finish(output), exit_code
@@ -7,16 +7,17 @@ consumption by AI agents.
 
 Usage:
     python3 scripts/query_equipment_states.py --site "Enterprise B/Site1" --shift current
+    python3 scripts/query_equipment_states.py --site all --shift current
 """
 
 import argparse
-import json
-import sys
-import urllib.request
-import urllib.parse
-import urllib.error
 from datetime import datetime, timezone, timedelta
 
+from historian_client import add_historian_arguments, run_cli
+from profiling import note_series, stage
+
+
+ENTERPRISE = "Enterprise B"
 
 SITE_CONFIG = {
     "Site1": {
@@ -38,21 +39,22 @@ EQUIPMENT_TYPES = ["washer", "filler", "caploader"]
 OEE_METRICS = ["oee", "availability", "performance", "quality"]
 
 
-def parse_args():
+def build_parser():
     parser = argparse.ArgumentParser(description="Query equipment states for a site")
-    parser.add_argument("--site", required=True,
-                        help="ISA-95 site path, e.g. 'Enterprise B/Site1'")
+    parser.add_argument("--site", required=True, nargs="+",
+                        help="ISA-95 site path(s), e.g. 'Enterprise B/Site1', or 'all' for every site")
     parser.add_argument("--shift", default="current", choices=["last", "current", "day", "night"],
                         help="Shift to query (default: current)")
     parser.add_argument("--start", default=None,
                         help="ISO 8601 start time (overrides --shift)")
     parser.add_argument("--end", default=None,
                         help="ISO 8601 end time (overrides --shift)")
-    parser.add_argument("--historian", default="http://localhost:4511",
-                        help="Historian base URL")
-    parser.add_argument("--dataset", default="Virtual Factory",
-                        help="Dataset name")
-    return parser.parse_args()
+    add_historian_arguments(parser)
+    return parser
+
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
 
 
 def resolve_shift(shift_name):
@@ -82,36 +84,22 @@ def resolve_shift(shift_name):
             return today_6am.isoformat(), today_6pm.isoformat()
 
 
-def query_tags(base_url, dataset, tag_names, start, end):
+def query_tags(client, dataset, tag_names, start, end):
     """Query the historian for multiple tags. Returns dict of tag_name -> latest value."""
     results = {}
 
-    # Query in batches to avoid URL length issues
-    batch_size = 5
-    for i in range(0, len(tag_names), batch_size):
-        batch = tag_names[i:i + batch_size]
-        params = [("tagname", t) for t in batch]
-        params.append(("start", start))
-        params.append(("end", end))
-        query = urllib.parse.urlencode(params, quote_via=urllib.parse.quote)
-        url = f"{base_url}/api/datasets/{urllib.parse.quote(dataset)}/data?{query}"
-
-        try:
-            req = urllib.request.Request(url)
-            with urllib.request.urlopen(req, timeout=10) as resp:
-                data = json.loads(resp.read().decode())
-        except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError) as e:
-            for t in batch:
-                results[t] = {"value": None, "error": str(e)}
-            continue
-
-        for tag_data in data.get("tl", []):
-            name = tag_data["t"]["n"]
-            points = [p for p in tag_data.get("d", []) if "v" in p]
-            if points:
-                results[name] = {"value": points[-1]["v"], "timestamp": points[-1]["t"]}
-            else:
-                results[name] = {"value": None, "error": "no data"}
+    # Batches are packed up to the client's URL length limit and sent concurrently
+    with stage("fetch"):
+        data, errors = client.query_many(dataset, tag_names, start, end)
+    note_series(data)
+    for name, err in errors.items():
+        results[name] = {"value": None, "error": err}
+
+    for name, series in data.items():
+        if series:
+            results[name] = {"value": series.values[-1], "timestamp": series.iso(-1)}
+        else:
+            results[name] = {"value": None, "error": "no data"}
 
     return results
 
@@ -122,52 +110,44 @@ def identify_site(site_path):
     return parts[-1]
 
 
-def main():
-    args = parse_args()
-
-    if args.start and args.end:
-        start, end = args.start, args.end
-    else:
-        start, end = resolve_shift(args.shift)
-
-    site_name = identify_site(args.site)
-    if site_name not in SITE_CONFIG:
-        json.dump({"status": "error", "message": f"Unknown site: {site_name}. Expected: {list(SITE_CONFIG.keys())}"}, sys.stdout, indent=2)
-        sys.exit(1)
+def resolve_sites(site_args):
+    """Expand --site values into site paths. 'all' selects every configured site."""
+    if any(s.lower() == "all" for s in site_args):
+        return [f"{ENTERPRISE}/{name}" for name in SITE_CONFIG]
+    return list(dict.fromkeys(s.rstrip("/") for s in site_args))
 
-    config = SITE_CONFIG[site_name]
 
-    # Build tag lists
+def site_tags(site_path, config):
+    """All equipment state, OEE and vat state tags for one site."""
     equipment_state_tags = []
     oee_tags = []
     vat_state_tags = []
 
     for line in config["filling_lines"]:
         for equip in EQUIPMENT_TYPES:
-            equipment_state_tags.append(f"{args.site}/fillerproduction/{line}/{equip}/processdata/state/name")
+            equipment_state_tags.append(f"{site_path}/fillerproduction/{line}/{equip}/processdata/state/name")
         for metric in OEE_METRICS:
-            oee_tags.append(f"{args.site}/fillerproduction/{line}/metric/{metric}")
+            oee_tags.append(f"{site_path}/fillerproduction/{line}/metric/{metric}")
 
     for vat in config["vats"]:
-        vat_state_tags.append(f"{args.site}/liquidprocessing/mixroom01/{vat}/processdata/state/name")
+        vat_state_tags.append(f"{site_path}/liquidprocessing/mixroom01/{vat}/processdata/state/name")
 
-    all_tags = equipment_state_tags + oee_tags + vat_state_tags
+    return equipment_state_tags + oee_tags + vat_state_tags
 
-    # Query historian
-    raw = query_tags(args.historian, args.dataset, all_tags, start, end)
 
-    # Assemble structured output
+def assemble_site(site_path, config, raw):
+    """Build the filling line and vat blocks for one site from queried values."""
     filling_lines = {}
     for line in config["filling_lines"]:
         equipment = {}
         for equip in EQUIPMENT_TYPES:
-            tag = f"{args.site}/fillerproduction/{line}/{equip}/processdata/state/name"
+            tag = f"{site_path}/fillerproduction/{line}/{equip}/processdata/state/name"
             result = raw.get(tag, {"value": None})
             equipment[equip] = result.get("value", None)
 
         oee_data = {}
         for metric in OEE_METRICS:
-            tag = f"{args.site}/fillerproduction/{line}/metric/{metric}"
+            tag = f"{site_path}/fillerproduction/{line}/metric/{metric}"
             result = raw.get(tag, {"value": None})
             val = result.get("value", None)
             if isinstance(val, (int, float)):
@@ -182,20 +162,59 @@ def main():
 
     vats = {}
     for vat in config["vats"]:
-        tag = f"{args.site}/liquidprocessing/mixroom01/{vat}/processdata/state/name"
+        tag = f"{site_path}/liquidprocessing/mixroom01/{vat}/processdata/state/name"
         result = raw.get(tag, {"value": None})
         vats[vat] = {"state": result.get("value", None)}
 
-    output = {
-        "site": args.site,
-        "period": {"start": start, "end": end},
-        "filling_lines": filling_lines,
-        "vats": vats,
-        "status": "ok",
-    }
+    return {"filling_lines": filling_lines, "vats": vats}
+
 
-    json.dump(output, sys.stdout, indent=2)
-    print()
+def run(args, client):
+    """Run the analysis for parsed arguments. Returns (output, exit_code)."""
+    with stage("resolve_window"):
+        if args.start and args.end:
+            start, end = args.start, args.end
+        else:
+            start, end = resolve_shift(args.shift)
+
+    site_paths = resolve_sites(args.site)
+    for site_path in site_paths:
+        site_name = identify_site(site_path)
+        if site_name not in SITE_CONFIG:
+            return {"status": "error", "message": f"Unknown site: {site_name}. Expected: {list(SITE_CONFIG.keys())}"}, 1
+
+    # One combined tag set for every site: packed and fetched concurrently
+    all_tags = []
+    for site_path in site_paths:
+        all_tags.extend(site_tags(site_path, SITE_CONFIG[identify_site(site_path)]))
+
+    # Query historian
+    raw = query_tags(client, args.dataset, all_tags, start, end)
+
+    # Assemble structured output
+    if len(site_paths) == 1:
+        site_path = site_paths[0]
+        output = {
+            "site": site_path,
+            "period": {"start": start, "end": end},
+            **assemble_site(site_path, SITE_CONFIG[identify_site(site_path)], raw),
+            "status": "ok",
+        }
+    else:
+        output = {
+            "sites": {
+                site_path: assemble_site(site_path, SITE_CONFIG[identify_site(site_path)], raw)
+                for site_path in site_paths
+            },
+            "period": {"start": start, "end": end},
+            "status": "ok",
+        }
+
+    return output, 0
+
+
+def main():
+    run_cli(parse_args, run)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Run many analysis jobs in one process.
+
+Reads jobs as JSON lines, one per line:
+    {"script": "calculate_oee", "args": ["--line", "Enterprise B/Site1/fillerproduction/fillingline01"]}
+
+Jobs run concurrently against shared historian clients. Identical historian
+queries (same tag and window) across jobs are fetched once. Results are
+streamed to stdout as JSON lines in job order, each holding the job's
+position, script, exit code and the exact output the script CLI would print.
+
+Zero external dependencies (stdlib only).
+
+Usage:
+    python3 scripts/run_batch.py --jobs jobs.jsonl
+    cat jobs.jsonl | python3 scripts/run_batch.py
+"""
+
+import argparse
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics_daemon import ArgumentsError, ClientRegistry, execute
+
+
+DEFAULT_CONCURRENCY = 8
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run many analysis jobs in one process")
+    parser.add_argument("--jobs", default="-",
+                        help="JSON lines file of jobs (default: stdin)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Jobs to run at once (default: {DEFAULT_CONCURRENCY})")
+    return parser.parse_args()
+
+
+def read_jobs(stream):
+    """Parse job lines. Malformed lines become jobs that report an error."""
+    jobs = []
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            job = json.loads(line)
+            script = job["script"]
+            args = job.get("args", [])
+            if not isinstance(args, list) or not all(isinstance(a, str) for a in args):
+                raise TypeError("'args' must be a list of strings")
+        except (ValueError, KeyError, TypeError) as e:
+            jobs.append({"line": lineno, "error": f"Invalid job on line {lineno}: {e}"})
+            continue
+        if script.endswith(".py"):
+            script = script[:-3]
+        jobs.append({"line": lineno, "id": job.get("id"), "script": script, "args": args})
+    return jobs
+
+
+def run_job(job, registry):
+    """Run one job. Returns (output, exit_code)."""
+    if "error" in job:
+        return {"status": "error", "message": job["error"]}, 2
+    try:
+        return execute(job["script"], job["args"], registry)
+    except ArgumentsError as e:
+        return {"status": "error", "message": str(e)}, 2
+    except Exception as e:
+        return {"status": "error", "message": f"{type(e).__name__}: {e}"}, 1
+
+
+def main():
+    args = parse_args()
+
+    if args.jobs == "-":
+        jobs = read_jobs(sys.stdin)
+    else:
+        with open(args.jobs) as f:
+            jobs = read_jobs(f)
+
+    registry = ClientRegistry(memoize=True)
+    worst = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+            futures = [pool.submit(run_job, job, registry) for job in jobs]
+            # Stream in job order: each line is written as soon as it and
+            # every job before it are done.
+            for index, (job, future) in enumerate(zip(jobs, futures)):
+                output, exit_code = future.result()
+                worst = max(worst, exit_code)
+                record = {"job": index, "script": job.get("script"), "exit_code": exit_code, "output": output}
+                if job.get("id") is not None:
+                    record["id"] = job["id"]
+                sys.stdout.write(json.dumps(record) + "\n")
+                sys.stdout.flush()
+    finally:
+        for stats in registry.stats():
+            if stats["requests"] or stats["shared_fetches"]:
+                print(f"historian {stats['historian']}: {stats['requests']} requests, "
+                      f"{stats['shared_fetches']} shared tag fetches, {stats['cache_hits']} tags from cache",
+                      file=sys.stderr)
+        registry.close()
+    sys.exit(1 if worst else 0)
+
+
+if __name__ == "__main__":
+    main()
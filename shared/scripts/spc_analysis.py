@@ -2,28 +2,82 @@
 """SPC analysis with Western Electric Rules for process tags.
 
 Queries the Timebase historian HTTP API and evaluates process data against
-Western Electric Rules. Returns compact JSON to stdout for consumption by AI agents.
+Western Electric Rules 1-4, plus the zone rules 5-8 and the EWMA and CUSUM
+small-shift detectors on request (--rules 1-4,ewma,cusum).
+Returns compact JSON to stdout for consumption by AI agents. Consecutive
+violations of a rule are reported as one episode (first point, end, count,
+peak); violation_count still counts every violating point.
+
+Several tags, or glob patterns matched against the historian's tag list,
+are fetched in one batched query and reported together with a combined
+violation summary.
+
+With --incremental (for repeated runs on --shift current) each tag's running
+statistics, rule state and last processed timestamp are checkpointed, and
+the next run for the same window fetches and evaluates only newer points.
+Calculated control limits are fixed by the first run that has enough points.
+
+--baseline START END computes each tag's center, sigma and moving-range
+sigma from a reference period and stores the limits. Later runs use the
+stored limits (source "baseline") instead of limits calculated from the
+analyzed window, which also lets statistics and rules share one pass.
+
+--resample INTERVAL reduces each tag to fixed-interval buckets (--agg last,
+mean or time-weighted mean) and --max-points caps the points evaluated with
+LTTB or min/max decimation, so rule evaluation and output cost stay bounded
+whatever the historian's sampling rate. Baselines computed with these
+options see the same reduced series.
+
+--chunk DURATION fetches long ranges as consecutive windows, several in
+flight at once (--workers), and feeds them in time order through the
+streaming statistics and rules, so memory is bounded by the chunk size
+instead of the range. Calculated control limits need the window's
+statistics first, which costs a second pass over the chunks; it is served
+from the historian cache unless --no-cache is given.
+
+--capability with --usl and/or --lsl adds Cp/Cpk (within sigma, MR-bar /
+1.128), Pp/Ppk (overall sigma) and bootstrap confidence intervals for each,
+computed from the raw points of the window (see spc_capability).
 
 Usage:
     python3 scripts/spc_analysis.py \
       --tag "Enterprise B/Site1/liquidprocessing/mixroom01/vat01/processdata/process/weight" \
       --shift last
+    python3 scripts/spc_analysis.py \
+      --tag "Enterprise B/Site1/liquidprocessing/*/*/processdata/process/weight" --shift last
+    python3 scripts/spc_analysis.py \
+      --tag "Enterprise B/Site1/liquidprocessing/tankstorage01/tank01/processdata/process/weight" \
+      --start 2026-01-01T00:00:00Z --end 2026-02-01T00:00:00Z --chunk 1d --workers 8
 """
 
 import argparse
-import json
-import math
-import sys
-import urllib.request
-import urllib.parse
-import urllib.error
+import fnmatch
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone, timedelta
 
+from historian_client import add_historian_arguments, run_cli
+from profiling import note_series, stage
+from spc_capability import (DEFAULT_CONFIDENCE, DEFAULT_RESAMPLES, block_length, bootstrap_intervals,
+                            capability_indices)
+from spc_engine import (ALL_RULES, CHUNK_POINTS, DEFAULT_CUSUM, DEFAULT_EWMA, DEFAULT_RULES, MovingRange,
+                        RunningStats, evaluate, get_state, set_state, western_electric_rules)
+from spc_store import CheckpointStore, LimitStore
+from tagseries import (DECIMATE_METHODS, RESAMPLE_AGGREGATES, decimate, format_iso_ms, parse_duration_ms,
+                       parse_iso_ms, resample)
+
+# Minimum points for Western Electric Rule evaluation.
+MIN_POINTS = 20
+# Multi-tag runs smaller than this are evaluated in-process.
+PARALLEL_MIN_POINTS = 200_000
+
 
-def parse_args():
+def build_parser():
     parser = argparse.ArgumentParser(description="SPC analysis with Western Electric Rules")
-    parser.add_argument("--tag", required=True,
-                        help="Full tag path to analyze")
+    parser.add_argument("--tag", required=True, nargs="+",
+                        help="Full tag path(s) to analyze, or glob patterns such as "
+                             "'Enterprise B/Site1/liquidprocessing/*/processdata/process/weight'")
     parser.add_argument("--shift", default="last", choices=["last", "current", "day", "night"],
                         help="Shift to analyze (default: last)")
     parser.add_argument("--start", default=None,
@@ -36,11 +90,91 @@ def parse_args():
                         help="Lower control limit (optional, auto-calculated if omitted)")
     parser.add_argument("--target", type=float, default=None,
                         help="Target value / center line (optional, uses mean if omitted)")
-    parser.add_argument("--historian", default="http://localhost:4511",
-                        help="Historian base URL")
-    parser.add_argument("--dataset", default="Virtual Factory",
-                        help="Dataset name")
-    return parser.parse_args()
+    parser.add_argument("--rules", type=parse_rules, default=DEFAULT_RULES,
+                        help="Rules to evaluate: comma-separated numbers or ranges 1-8, 'ewma', 'cusum', "
+                             "or 'all' (default: 1-4)")
+    parser.add_argument("--ewma-lambda", type=float, default=DEFAULT_EWMA[0],
+                        help=f"EWMA weight of the newest point, 0-1 (default: {DEFAULT_EWMA[0]})")
+    parser.add_argument("--ewma-l", type=float, default=DEFAULT_EWMA[1],
+                        help=f"EWMA limit width in sigma of the EWMA statistic (default: {DEFAULT_EWMA[1]})")
+    parser.add_argument("--cusum-k", type=float, default=DEFAULT_CUSUM[0],
+                        help=f"CUSUM reference value in sigma, about half the shift to detect (default: {DEFAULT_CUSUM[0]})")
+    parser.add_argument("--cusum-h", type=float, default=DEFAULT_CUSUM[1],
+                        help=f"CUSUM decision interval in sigma (default: {DEFAULT_CUSUM[1]})")
+    parser.add_argument("--baseline", nargs=2, metavar=("START", "END"), default=None,
+                        help="Compute control limits from this ISO 8601 reference period and save them "
+                             "for later runs instead of analyzing")
+    parser.add_argument("--baseline-sigma", default="std", choices=["std", "moving-range"],
+                        help="Sigma for saved baseline limits: overall std dev or MR-bar/1.128 (default: std)")
+    parser.add_argument("--limits-file", default=None,
+                        help="Baseline limit store (default: $SPC_LIMITS_FILE or ~/.config/enterprise-b/spc-limits.json)")
+    parser.add_argument("--ignore-baseline", action="store_true",
+                        help="Calculate limits from the analyzed window even if a baseline is stored")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Resume from the tag's checkpoint for this window and fetch only newer points")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="SPC checkpoint directory (default: spc-checkpoints in the historian cache directory)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for evaluating many tags (default: CPU count; 1 disables)")
+    parser.add_argument("--resample", type=duration, default=None, metavar="INTERVAL",
+                        help="Evaluate fixed-interval buckets instead of raw points, e.g. 30s, 1m, 15m, 1h")
+    parser.add_argument("--agg", default="mean", choices=RESAMPLE_AGGREGATES,
+                        help="Bucket value for --resample: last, mean or time-weighted mean (default: mean)")
+    parser.add_argument("--max-points", type=int, default=None,
+                        help="Decimate each tag to at most this many points before evaluation")
+    parser.add_argument("--decimate", default="lttb", choices=DECIMATE_METHODS,
+                        help="Decimation for --max-points: LTTB shape-preserving or per-bucket min/max (default: lttb)")
+    parser.add_argument("--capability", action="store_true",
+                        help="Report Cp/Cpk/Pp/Ppk against --usl/--lsl with bootstrap confidence intervals")
+    parser.add_argument("--usl", type=float, default=None,
+                        help="Upper specification limit for --capability")
+    parser.add_argument("--lsl", type=float, default=None,
+                        help="Lower specification limit for --capability")
+    parser.add_argument("--bootstrap", type=int, default=DEFAULT_RESAMPLES,
+                        help=f"Bootstrap resamples for capability intervals, 0 to skip (default: {DEFAULT_RESAMPLES})")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE,
+                        help=f"Confidence level of the capability intervals (default: {DEFAULT_CONFIDENCE})")
+    parser.add_argument("--chunk", type=duration, default=None, metavar="DURATION",
+                        help="Fetch and evaluate the window in chunks of this size, e.g. 6h or 1d, "
+                             "--workers at a time (bounds memory on long ranges)")
+    add_historian_arguments(parser)
+    return parser
+
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
+
+
+def duration(text):
+    try:
+        return parse_duration_ms(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid interval: {text!r}")
+
+
+def parse_rules(text):
+    """Parse a --rules value such as '1-4,7,ewma' or 'all' into rule ids."""
+    if text.strip().lower() == "all":
+        return ALL_RULES
+    rules = set()
+    try:
+        for part in text.split(","):
+            part = part.strip().lower()
+            if part in ("ewma", "cusum"):
+                rules.add(part)
+                continue
+            lo, _, hi = part.partition("-")
+            rules.update(range(int(lo), int(hi or lo) + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid rule list: {text!r}")
+    if not rules or not rules <= set(ALL_RULES):
+        raise argparse.ArgumentTypeError(f"rules must be 1-8, 'ewma' or 'cusum': {text!r}")
+    return tuple(r for r in ALL_RULES if r in rules)
+
+
+def rule_order(summary_key):
+    """Sort key for violation_summary keys ('rule_1' ... 'rule_cusum')."""
+    return [f"rule_{r}" for r in ALL_RULES].index(summary_key)
 
 
 def resolve_shift(shift_name):
@@ -70,266 +204,570 @@ def resolve_shift(shift_name):
             return today_6am.isoformat(), today_6pm.isoformat()
 
 
-def query_historian(base_url, dataset, tag_name, start, end):
-    """Query the Timebase historian for a single tag over a time range."""
-    params = [
-        ("tagname", tag_name),
-        ("start", start),
-        ("end", end),
-    ]
-    query = urllib.parse.urlencode(params, quote_via=urllib.parse.quote)
-    url = f"{base_url}/api/datasets/{urllib.parse.quote(dataset)}/data?{query}"
-
-    req = urllib.request.Request(url)
-    try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
-    except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError) as e:
-        return None, str(e)
-
-    for tag_data in data.get("tl", []):
-        if tag_data["t"]["n"] == tag_name:
-            return [p for p in tag_data.get("d", []) if "v" in p], None
-
-    return [], None
-
-
-def compute_statistics(values):
-    """Compute mean, std dev, min, max."""
-    n = len(values)
-    if n == 0:
-        return None
-    mean = sum(values) / n
-    if n > 1:
-        variance = sum((v - mean) ** 2 for v in values) / (n - 1)
-        std_dev = math.sqrt(variance)
+def analyze_series(tag, series, start, end, options, checkpoint=None):
+    """SPC for one tag's series. Returns (output, exit_code, checkpoint).
+
+    ``options`` holds ucl, lcl, target and rules as given on the command
+    line. Given the ``checkpoint`` of an earlier run over the same window,
+    ``series`` holds only the points after it and the evaluation continues
+    from the saved state and control limits. The returned checkpoint is None
+    until the window has enough points to fix the limits. Module-level and
+    picklable so tags can be analyzed in a process pool.
+    """
+    if checkpoint is not None:
+        return resume_series(tag, series, start, end, options, checkpoint)
+
+    raw, sampling = series, None
+    if options.get("sampling") and series and series.is_numeric:
+        series, sampling = reduce_series(series, end, options["sampling"])
+
+    if not series:
+        return empty_output(tag, start, end), 0, None
+
+    if not series.is_numeric:
+        return {"status": "error", "message": f"Tag {tag} has non-numeric values"}, 1, None
+
+    # Statistics and Western Electric Rules. With --ucl/--lcl/--target all
+    # given nothing depends on the window's statistics, so the statistics and
+    # every rule share one pass over the points.
+    stats = RunningStats()
+    limits_provided = options["ucl"] is not None and options["lcl"] is not None
+    single_pass = limits_provided and options["target"] is not None
+    if single_pass:
+        rules = western_electric_rules(options["ucl"], options["lcl"], options["target"], options["rules"],
+                                       options["ewma"], options["cusum"])
+        evaluate(series, rules, stats, resumable=options.get("incremental", False))
     else:
-        std_dev = 0.0
+        stats.feed(series.values)
+    if stats.count == 0:
+        return {"status": "error", "message": "Could not compute statistics"}, 1, None
+
+    limits = control_limits(options, stats)
+    center = limits["center"]
+    if stats.count < MIN_POINTS:
+        output = build_output(tag, start, end, stats, limits, [])
+        if sampling:
+            output["sampling"] = sampling
+        return output, 0, None
+    if not single_pass:
+        rules = western_electric_rules(limits["ucl"], limits["lcl"], center, options["rules"],
+                                       options["ewma"], options["cusum"])
+        evaluate(series, rules, resumable=options.get("incremental", False))
+
+    checkpoint = {
+        "last_ms": series.times[-1],
+        "limits": limits,
+        "stats": get_state(stats),
+        "rules": [get_state(rule) for rule in rules],
+    }
+    output = build_output(tag, start, end, stats, limits, rules)
+    if sampling:
+        output["sampling"] = sampling
+    if options.get("capability"):
+        output["capability"] = capability_report(raw, options["capability"])
+    return output, 0, checkpoint
+
+
+def control_limits(options, stats):
+    """Given, baseline or calculated (mean +/- 3 sigma) control limits."""
+    center = options["target"] if options["target"] is not None else stats.mean
+    if options["ucl"] is not None and options["lcl"] is not None:
+        limits = {"ucl": options["ucl"], "lcl": options["lcl"], "center": center,
+                  "source": options.get("limit_source", "provided")}
+        if options.get("baseline"):
+            limits["baseline"] = options["baseline"]
+        return limits
+    return {"ucl": stats.mean + 3 * stats.std_dev, "lcl": stats.mean - 3 * stats.std_dev,
+            "center": center, "source": "calculated"}
+
+
+def empty_output(tag, start, end):
     return {
-        "mean": mean,
-        "std_dev": std_dev,
-        "min": min(values),
-        "max": max(values),
-        "count": n,
+        "tag": tag,
+        "period": {"start": start, "end": end},
+        "statistics": None,
+        "control_limits": None,
+        "violations": [],
+        "violation_count": 0,
+        "episode_count": 0,
+        "status": "ok",
+        "message": "No data points in the specified period",
     }
 
 
-def check_rule_1(values, timestamps, ucl, lcl):
-    """Rule 1: One point beyond 3 sigma (UCL or LCL)."""
-    violations = []
-    for i, v in enumerate(values):
-        if v > ucl or v < lcl:
-            violations.append({
-                "rule": 1,
-                "description": f"Point beyond control limits ({'above UCL' if v > ucl else 'below LCL'})",
-                "timestamp": timestamps[i],
-                "value": round(v, 2),
-                "severity": "immediate_action",
-            })
-    return violations
-
-
-def check_rule_2(values, timestamps, center):
-    """Rule 2: 9 consecutive points on same side of center."""
-    violations = []
-    if len(values) < 9:
-        return violations
-
-    run_count = 1
-    above = values[0] > center
-
-    for i in range(1, len(values)):
-        current_above = values[i] > center
-        if values[i] == center:
-            run_count = 0
-            continue
-        if current_above == above:
-            run_count += 1
-        else:
-            run_count = 1
-            above = current_above
-
-        if run_count >= 9:
-            violations.append({
-                "rule": 2,
-                "description": f"9 consecutive points {'above' if above else 'below'} center line",
-                "timestamp": timestamps[i],
-                "value": round(values[i], 2),
-                "severity": "trend_alert",
-            })
-            run_count = 0  # Reset to avoid duplicate reporting for extended runs
-
-    return violations
-
-
-def check_rule_3(values, timestamps):
-    """Rule 3: 6 consecutive points steadily increasing or decreasing."""
-    violations = []
-    if len(values) < 6:
-        return violations
-
-    inc_count = 1
-    dec_count = 1
-
-    for i in range(1, len(values)):
-        if values[i] > values[i - 1]:
-            inc_count += 1
-            dec_count = 1
-        elif values[i] < values[i - 1]:
-            dec_count += 1
-            inc_count = 1
-        else:
-            inc_count = 1
-            dec_count = 1
-
-        if inc_count >= 6:
-            violations.append({
-                "rule": 3,
-                "description": "6 consecutive points steadily increasing",
-                "timestamp": timestamps[i],
-                "value": round(values[i], 2),
-                "severity": "trend_alert",
-            })
-            inc_count = 1  # Reset
-        elif dec_count >= 6:
-            violations.append({
-                "rule": 3,
-                "description": "6 consecutive points steadily decreasing",
-                "timestamp": timestamps[i],
-                "value": round(values[i], 2),
-                "severity": "trend_alert",
-            })
-            dec_count = 1  # Reset
-
-    return violations
-
-
-def check_rule_4(values, timestamps):
-    """Rule 4: 14 consecutive points alternating up and down."""
-    violations = []
-    if len(values) < 14:
-        return violations
-
-    alt_count = 1
-
-    for i in range(2, len(values)):
-        prev_dir = values[i - 1] - values[i - 2]
-        curr_dir = values[i] - values[i - 1]
-
-        if (prev_dir > 0 and curr_dir < 0) or (prev_dir < 0 and curr_dir > 0):
-            alt_count += 1
+def resume_series(tag, series, start, end, options, checkpoint):
+    """Continue a checkpointed evaluation with the points in ``series``."""
+    limits = checkpoint["limits"]
+    stats = set_state(RunningStats(), checkpoint["stats"])
+    rules = western_electric_rules(limits["ucl"], limits["lcl"], limits["center"], options["rules"],
+                                   options["ewma"], options["cusum"])
+    for rule, state in zip(rules, checkpoint["rules"]):
+        set_state(rule, state)
+
+    new_points = len(series) if series else 0
+    if new_points:
+        if not series.is_numeric:
+            return {"status": "error", "message": f"Tag {tag} has non-numeric values"}, 1, None
+        evaluate(series, rules, stats, fresh=False)
+        checkpoint = {
+            "last_ms": series.times[-1],
+            "limits": limits,
+            "stats": get_state(stats),
+            "rules": [get_state(rule) for rule in rules],
+        }
+
+    output = build_output(tag, start, end, stats, limits, rules)
+    output["incremental"] = {
+        "resumed": True,
+        "new_points": new_points,
+        "last_point": format_iso_ms(checkpoint["last_ms"]),
+    }
+    return output, 0, checkpoint
+
+
+def build_output(tag, start, end, stats, limits, rules):
+    """Output document for one tag from accumulated statistics and rules."""
+    # Each rule keeps its counts and first 3 violation episodes for compact output
+    violations = [v for rule in rules for v in rule.violations(limits["center"])]
+    rule_summary = {f"rule_{rule.rule}": rule.count for rule in rules if rule.count}
+    violation_count = sum(rule.count for rule in rules)
+    episode_count = sum(rule.episode_count for rule in rules)
+
+    output = {
+        "tag": tag,
+        "period": {"start": start, "end": end},
+        "statistics": {
+            "mean": round(stats.mean, 2),
+            "std_dev": round(stats.std_dev, 2),
+            "min": round(stats.min, 2),
+            "max": round(stats.max, 2),
+            "count": stats.count,
+        },
+        "control_limits": {
+            "ucl": round(limits["ucl"], 2),
+            "lcl": round(limits["lcl"], 2),
+            "target": round(limits["center"], 2),
+            "source": limits["source"],
+        },
+        "violations": violations,
+        "violation_summary": rule_summary,
+        "violation_count": violation_count,
+        "episode_count": episode_count,
+        "status": "ok",
+    }
+
+    if "baseline" in limits:
+        output["control_limits"]["baseline"] = limits["baseline"]
+
+    if stats.count < MIN_POINTS:
+        output["message"] = f"Only {stats.count} data points — minimum {MIN_POINTS} required for Western Electric Rule evaluation. Statistics reported only."
+
+    return output
+
+
+def spc_options(args):
+    capability = None
+    if args.capability:
+        capability = {"usl": args.usl, "lsl": args.lsl, "resamples": args.bootstrap,
+                      "confidence": args.confidence, "processes": args.processes}
+    sampling = None
+    if args.resample or args.max_points:
+        sampling = {"resample_ms": args.resample, "agg": args.agg,
+                    "max_points": args.max_points, "decimate": args.decimate}
+    return {"ucl": args.ucl, "lcl": args.lcl, "target": args.target, "rules": args.rules,
+            "ewma": (args.ewma_lambda, args.ewma_l), "cusum": (args.cusum_k, args.cusum_h),
+            "sampling": sampling, "incremental": args.incremental, "capability": capability}
+
+
+def capability_report(series, capability):
+    """Capability indices of the raw series, with bootstrap intervals."""
+    stats = RunningStats()
+    moving_range = MovingRange()
+    for lo in range(0, len(series.values), CHUNK_POINTS):
+        chunk = series.values[lo:lo + CHUNK_POINTS]
+        stats.feed(chunk)
+        moving_range.feed(chunk)
+    usl, lsl = capability["usl"], capability["lsl"]
+    indices = capability_indices(stats.mean, moving_range.sigma, stats.std_dev, usl, lsl)
+    report = {
+        "usl": usl,
+        "lsl": lsl,
+        "mean": round(stats.mean, 4),
+        "sigma_within": round(moving_range.sigma, 4),
+        "sigma_overall": round(stats.std_dev, 4),
+    }
+    report.update((name, None if value is None else round(value, 3)) for name, value in indices.items())
+    if capability["resamples"] > 0:
+        intervals = bootstrap_intervals(series.values, usl, lsl, capability["resamples"],
+                                        capability["confidence"], processes=capability["processes"])
+        report["confidence_intervals"] = {
+            name: None if bounds is None or indices[name] is None else [round(b, 3) for b in bounds]
+            for name, bounds in intervals.items()}
+        report["bootstrap"] = {"method": "moving block percentile", "resamples": capability["resamples"],
+                               "confidence": capability["confidence"], "block_length": block_length(len(series))}
+    return report
+
+
+def reduce_series(series, end, sampling):
+    """Apply --resample and --max-points. Returns (series, sampling summary)."""
+    summary = {"raw_points": len(series)}
+    if sampling["resample_ms"]:
+        series = resample(series, sampling["resample_ms"], sampling["agg"], parse_iso_ms(end))
+        summary["interval_seconds"] = sampling["resample_ms"] / 1000
+        summary["agg"] = sampling["agg"]
+    if sampling["max_points"]:
+        series = decimate(series, sampling["max_points"], sampling["decimate"])
+        summary["max_points"] = sampling["max_points"]
+        summary["decimate"] = sampling["decimate"]
+    summary["points"] = len(series)
+    return series, summary
+
+
+def baseline_options(options, stored):
+    """Options using a tag's stored baseline limits (--target still wins)."""
+    return dict(options, ucl=stored["ucl"], lcl=stored["lcl"],
+                target=options["target"] if options["target"] is not None else stored["center"],
+                limit_source="baseline", baseline=stored["baseline"])
+
+
+def compute_baseline(series, start, end, sigma_kind):
+    """Center, sigma, moving-range sigma and limits from a reference series."""
+    stats = RunningStats()
+    moving_range = MovingRange()
+    for lo in range(0, len(series.values), CHUNK_POINTS):
+        chunk = series.values[lo:lo + CHUNK_POINTS]
+        stats.feed(chunk)
+        moving_range.feed(chunk)
+    sigma = moving_range.sigma if sigma_kind == "moving-range" else stats.std_dev
+    return {
+        "center": stats.mean,
+        "sigma": stats.std_dev,
+        "mr_sigma": moving_range.sigma,
+        "limit_sigma": sigma_kind,
+        "ucl": stats.mean + 3 * sigma,
+        "lcl": stats.mean - 3 * sigma,
+        "count": stats.count,
+        "baseline": {"start": start, "end": end},
+    }
+
+
+def run_baseline(args, client, tags, single):
+    """--baseline: compute reference limits for each tag and save them."""
+    start, end = args.baseline
+    sampling = spc_options(args)["sampling"]
+    with stage("fetch"):
+        data, errors = client.query_many(args.dataset, tags, start, end)
+    note_series(data)
+
+    limits, per_tag = {}, {}
+    for tag in tags:
+        series = data.get(tag)
+        if sampling and series and series.is_numeric:
+            series = reduce_series(series, end, sampling)[0]
+        if tag in errors:
+            per_tag[tag] = {"status": "error", "message": f"Historian query failed: {errors[tag]}"}
+        elif not series or len(series) < MIN_POINTS:
+            per_tag[tag] = {"status": "error",
+                            "message": f"Baseline needs at least {MIN_POINTS} points, got {len(series or ())}"}
+        elif not series.is_numeric:
+            per_tag[tag] = {"status": "error", "message": f"Tag {tag} has non-numeric values"}
         else:
-            alt_count = 1
+            limits[tag] = compute_baseline(series, start, end, args.baseline_sigma)
+            per_tag[tag] = {key: round(v, 4) if isinstance(v, float) else v
+                            for key, v in limits[tag].items() if key != "baseline"}
 
-        if alt_count >= 14:
-            violations.append({
-                "rule": 4,
-                "description": "14 consecutive points alternating up and down",
-                "timestamp": timestamps[i],
-                "value": round(values[i], 2),
-                "severity": "process_alert",
-            })
-            alt_count = 1  # Reset
+    store = LimitStore(args.limits_file)
+    err = store.save(args.dataset, limits) if limits else None
+    if err:
+        return {"status": "error", "message": err}, 1
+    if single:
+        if tags[0] not in limits:
+            return per_tag[tags[0]], 1
+        return {"tag": tags[0], "baseline": {"start": start, "end": end}, "limits": per_tag[tags[0]],
+                "saved_to": store.path, "status": "ok"}, 0
+    return {
+        "baseline": {"start": start, "end": end},
+        "tags": per_tag,
+        "saved": len(limits),
+        "saved_to": store.path,
+        "status": "ok" if limits else "error",
+    }, 0 if limits else 1
 
-    return violations
 
+def is_pattern(tag):
+    return any(c in tag for c in "*?[")
 
-def main():
-    args = parse_args()
 
+def resolve_tags(client, dataset, tag_args):
+    """Expand glob patterns against the historian's tag list.
+
+    Returns (list of tag names, None) or (None, error_message).
+    """
+    if not any(is_pattern(t) for t in tag_args):
+        return list(dict.fromkeys(tag_args)), None
+    listing, err = client.list_tags(dataset)
+    if err:
+        return None, f"Tag listing failed: {err}"
+    names = [entry["n"] for entry in listing]
+    tags = []
+    for pattern in tag_args:
+        if not is_pattern(pattern):
+            tags.append(pattern)
+            continue
+        matches = sorted(n for n in names if fnmatch.fnmatchcase(n, pattern))
+        if not matches:
+            return None, f"No tags match {pattern}"
+        tags.extend(matches)
+    return list(dict.fromkeys(tags)), None
+
+
+def _analyze_job(job):
+    return analyze_series(*job)
+
+
+def serial_capability(options):
+    if not options.get("capability"):
+        return options
+    return dict(options, capability=dict(options["capability"], processes=1))
+
+
+def analyze_all(jobs, processes):
+    """Run analyze_series over (tag, series, start, end, options, checkpoint) jobs.
+
+    Large multi-tag workloads are spread over a process pool; small ones stay
+    in-process, where pool startup would cost more than it saves.
+    """
+    points = sum(len(job[1] or ()) for job in jobs)
+    if processes <= 1 or len(jobs) < 2 or points < PARALLEL_MIN_POINTS:
+        return [analyze_series(*job) for job in jobs]
+    workers = min(processes, len(jobs))
+    # Workers already run in parallel; keep capability bootstraps in-process
+    jobs = [job[:4] + (serial_capability(job[4]),) + job[5:] for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(_analyze_job, jobs))
+
+
+def analyze_fetched(args, client, tags, start, end, tag_options):
+    """Fetch every tag's window at once and analyze the tags, in a pool if large.
+
+    Returns (dict of tag -> (output, exit_code), dict of tag -> historian error).
+    """
+    store = CheckpointStore(args.checkpoint_dir) if args.incremental else None
+    checkpoints = {}
+    if store is not None:
+        for tag in tags:
+            state = store.load(args.dataset, tag, start, tag_options[tag])
+            if state is not None:
+                checkpoints[tag] = state
+
+    # Query historian: every tag in one batched, URL-packed fetch. Tags
+    # resuming from a checkpoint only need the points after it.
+    fresh = [tag for tag in tags if tag not in checkpoints]
+    with stage("fetch"):
+        data, errors = client.query_many(args.dataset, fresh, start, end) if fresh else ({}, {})
+        if checkpoints:
+            since = format_iso_ms(min(state["last_ms"] for state in checkpoints.values()))
+            newer, newer_errors = client.query_many(args.dataset, list(checkpoints), since, end)
+            errors.update(newer_errors)
+            for tag, state in checkpoints.items():
+                series = newer.get(tag)
+                if series:
+                    data[tag] = series.between(state["last_ms"] + 1, series.times[-1])
+    note_series(data)
+
+    jobs = [(tag, data.get(tag), start, end, tag_options[tag], checkpoints.get(tag))
+            for tag in tags if tag not in errors]
+    results = {}
+    for job, (result, exit_code, state) in zip(jobs, analyze_all(jobs, args.processes)):
+        tag = job[0]
+        if store is not None:
+            if state is not None:
+                store.save(args.dataset, tag, start, tag_options[tag], state)
+            if tag not in checkpoints and not exit_code:
+                result["incremental"] = {"resumed": False, "new_points": len(job[1] or ())}
+        results[tag] = result, exit_code
+
+    return results, errors
+
+
+def analyze_chunked(args, client, tags, start, end, tag_options):
+    """--chunk: stream every tag through consecutive windows fetched concurrently.
+
+    Statistics and rules are fed one chunk at a time, carrying their state
+    across chunk edges, so the result matches a single-request run. Tags
+    with calculated limits take a second pass once their statistics are
+    known. With --agg twa a value held across a chunk edge does not carry
+    into the first bucket of the next chunk. Returns the same (results,
+    errors) as analyze_fetched.
+    """
+    sampling = spc_options(args)["sampling"]
+    stats = {tag: RunningStats() for tag in tags}
+    raw_points = dict.fromkeys(tags, 0)
+    rules = {}
+    for tag in tags:
+        options = tag_options[tag]
+        if options["ucl"] is not None and options["lcl"] is not None and options["target"] is not None:
+            rules[tag] = western_electric_rules(options["ucl"], options["lcl"], options["target"],
+                                                options["rules"], options["ewma"], options["cusum"])
+    errors, non_numeric = {}, set()
+
+    def stream(pass_tags, feed, first_pass):
+        chunks = client.iter_chunks(args.dataset, pass_tags, start, end, args.chunk / 1000)
+        while True:
+            with stage("fetch"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            _, chunk_end, data, chunk_errors = chunk
+            for tag, err in chunk_errors.items():
+                errors.setdefault(tag, err)
+            if first_pass:
+                note_series(data)
+            for tag, series in data.items():
+                if not series or tag in errors or tag in non_numeric:
+                    continue
+                if not series.is_numeric:
+                    non_numeric.add(tag)
+                    continue
+                if first_pass:
+                    raw_points[tag] += len(series)
+                if sampling:
+                    series = resample(series, sampling["resample_ms"], sampling["agg"], parse_iso_ms(chunk_end))
+                feed(tag, series)
+
+    def first(tag, series):
+        if tag in rules:
+            evaluate(series, rules[tag], stats[tag], fresh=False)
+        else:
+            stats[tag].feed(series.values)
+
+    stream(tags, first, True)
+    second = [tag for tag in tags
+              if tag not in rules and tag not in errors and tag not in non_numeric
+              and stats[tag].count >= MIN_POINTS]
+    for tag in second:
+        limits = control_limits(tag_options[tag], stats[tag])
+        rules[tag] = western_electric_rules(limits["ucl"], limits["lcl"], limits["center"], tag_options[tag]["rules"],
+                                            tag_options[tag]["ewma"], tag_options[tag]["cusum"])
+    if second:
+        stream(second, lambda tag, series: evaluate(series, rules[tag], fresh=False), False)
+
+    results = {}
+    for tag in tags:
+        if tag in errors:
+            continue
+        if tag in non_numeric:
+            results[tag] = {"status": "error", "message": f"Tag {tag} has non-numeric values"}, 1
+            continue
+        if not stats[tag].count:
+            results[tag] = empty_output(tag, start, end), 0
+            continue
+        enough = stats[tag].count >= MIN_POINTS
+        output = build_output(tag, start, end, stats[tag], control_limits(tag_options[tag], stats[tag]),
+                              rules[tag] if enough else [])
+        if sampling:
+            output["sampling"] = {"raw_points": raw_points[tag], "interval_seconds": sampling["resample_ms"] / 1000,
+                                  "agg": sampling["agg"], "points": stats[tag].count}
+        results[tag] = output, 0
+    return results, errors
+
+
+def run(args, client):
+    """Run the analysis for parsed arguments. Returns (output, exit_code)."""
+    if not 0.0 < args.ewma_lambda <= 1.0:
+        return {"status": "error", "message": f"--ewma-lambda must be in (0, 1]: {args.ewma_lambda}"}, 1
+    if args.max_points is not None and args.max_points < MIN_POINTS:
+        return {"status": "error", "message": f"--max-points must be at least {MIN_POINTS}"}, 1
+    if args.incremental and (args.resample or args.max_points):
+        return {"status": "error", "message": "--incremental cannot be combined with --resample or --max-points"}, 1
+    if args.chunk and (args.incremental or args.max_points):
+        return {"status": "error", "message": "--chunk cannot be combined with --incremental or --max-points"}, 1
+    if args.capability:
+        if args.usl is None and args.lsl is None:
+            return {"status": "error", "message": "--capability needs --usl and/or --lsl"}, 1
+        if args.usl is not None and args.lsl is not None and args.usl <= args.lsl:
+            return {"status": "error", "message": "--usl must be greater than --lsl"}, 1
+        if not 0.0 < args.confidence < 1.0:
+            return {"status": "error", "message": f"--confidence must be between 0 and 1: {args.confidence}"}, 1
+        if args.chunk or args.incremental:
+            return {"status": "error",
+                    "message": "--capability needs the whole window and cannot be combined with --chunk or --incremental"}, 1
+    if args.chunk and args.resample and args.chunk % args.resample:
+        return {"status": "error", "message": "--chunk must be a multiple of the --resample interval"}, 1
     # Resolve time range
-    if args.start and args.end:
-        start, end = args.start, args.end
-    else:
-        start, end = resolve_shift(args.shift)
+    with stage("resolve_window"):
+        if args.start and args.end:
+            start, end = args.start, args.end
+        else:
+            start, end = resolve_shift(args.shift)
 
-    # Query historian
-    points, err = query_historian(args.historian, args.dataset, args.tag, start, end)
+    tags, err = resolve_tags(client, args.dataset, args.tag)
     if err:
-        json.dump({"status": "error", "message": f"Historian query failed: {err}"}, sys.stdout, indent=2)
-        sys.exit(1)
-
-    if not points:
-        json.dump({
-            "tag": args.tag,
-            "period": {"start": start, "end": end},
-            "statistics": None,
-            "control_limits": None,
-            "violations": [],
-            "violation_count": 0,
-            "status": "ok",
-            "message": "No data points in the specified period",
-        }, sys.stdout, indent=2)
-        print()
-        sys.exit(0)
-
-    # Extract values and timestamps
-    values = [p["v"] for p in points]
-    timestamps = [p["t"] for p in points]
-
-    # Compute statistics
-    stats = compute_statistics(values)
-    if stats is None:
-        json.dump({"status": "error", "message": "Could not compute statistics"}, sys.stdout, indent=2)
-        sys.exit(1)
-
-    # Determine control limits
-    center = args.target if args.target is not None else stats["mean"]
-
-    if args.ucl is not None and args.lcl is not None:
-        ucl = args.ucl
-        lcl = args.lcl
-        limit_source = "provided"
+        return {"status": "error", "message": err}, 1
+    single = len(tags) == 1 and not is_pattern(args.tag[0])
+    if args.baseline:
+        return run_baseline(args, client, tags, single)
+
+    # Stored baseline limits replace per-window limits unless limits are given
+    options = spc_options(args)
+    tag_options = {tag: options for tag in tags}
+    if not args.ignore_baseline and (args.ucl is None or args.lcl is None):
+        stored = LimitStore(args.limits_file).load(args.dataset)
+        for tag in tags:
+            if tag in stored:
+                tag_options[tag] = baseline_options(options, stored[tag])
+
+    if args.chunk:
+        results, errors = analyze_chunked(args, client, tags, start, end, tag_options)
     else:
-        ucl = stats["mean"] + 3 * stats["std_dev"]
-        lcl = stats["mean"] - 3 * stats["std_dev"]
-        limit_source = "calculated"
-
-    # Check Western Electric Rules
-    all_violations = []
-    if stats["count"] >= 20:
-        all_violations.extend(check_rule_1(values, timestamps, ucl, lcl))
-        all_violations.extend(check_rule_2(values, timestamps, center))
-        all_violations.extend(check_rule_3(values, timestamps))
-        all_violations.extend(check_rule_4(values, timestamps))
-
-    # Summarize by rule, cap detail to first 3 per rule for compact output
+        results, errors = analyze_fetched(args, client, tags, start, end, tag_options)
+    if single and errors:
+        return {"status": "error", "message": f"Historian query failed: {errors[tags[0]]}"}, 1
+
+    if single:
+        return results[tags[0]]
+
+    per_tag = {}
     rule_summary = {}
-    violations = []
-    for v in all_violations:
-        r = v["rule"]
-        rule_summary[r] = rule_summary.get(r, 0) + 1
-        if sum(1 for x in violations if x["rule"] == r) < 3:
-            violations.append(v)
-
-    # Build output
+    tags_with_violations = {}
+    episode_count = 0
+    failed = 0
+    for tag in tags:
+        if tag in errors:
+            per_tag[tag] = {"status": "error", "message": f"Historian query failed: {errors[tag]}"}
+            failed += 1
+            continue
+        result, exit_code = results[tag]
+        result.pop("tag", None)
+        result.pop("period", None)
+        per_tag[tag] = result
+        if exit_code:
+            failed += 1
+            continue
+        for rule, count in result.get("violation_summary", {}).items():
+            rule_summary[rule] = rule_summary.get(rule, 0) + count
+        if result["violation_count"]:
+            tags_with_violations[tag] = result["violation_count"]
+        episode_count += result["episode_count"]
+
     output = {
-        "tag": args.tag,
         "period": {"start": start, "end": end},
-        "statistics": {
-            "mean": round(stats["mean"], 2),
-            "std_dev": round(stats["std_dev"], 2),
-            "min": round(stats["min"], 2),
-            "max": round(stats["max"], 2),
-            "count": stats["count"],
-        },
-        "control_limits": {
-            "ucl": round(ucl, 2),
-            "lcl": round(lcl, 2),
-            "target": round(center, 2),
-            "source": limit_source,
+        "tags": per_tag,
+        "summary": {
+            "tag_count": len(tags),
+            "failed": failed,
+            "violation_count": sum(tags_with_violations.values()),
+            "episode_count": episode_count,
+            "violation_summary": {r: rule_summary[r] for r in sorted(rule_summary, key=rule_order)},
+            "tags_with_violations": dict(sorted(tags_with_violations.items(), key=lambda kv: -kv[1])),
         },
-        "violations": violations,
-        "violation_summary": {f"rule_{r}": c for r, c in sorted(rule_summary.items())},
-        "violation_count": len(all_violations),
-        "status": "ok",
+        "status": "ok" if failed < len(tags) else "error",
     }
+    return output, 0 if failed < len(tags) else 1
 
-    if stats["count"] < 20:
-        output["message"] = f"Only {stats['count']} data points — minimum 20 required for Western Electric Rule evaluation. Statistics reported only."
 
-    json.dump(output, sys.stdout, indent=2)
-    print()
+def main():
+    run_cli(parse_args, run)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Process capability indices with bootstrap confidence intervals.
+
+Cp and Cpk compare the specification limits with the within-subgroup
+sigma (MR-bar / 1.128, the short-term spread); Pp and Ppk use the overall
+standard deviation (the long-term spread). With a single specification
+limit only the one-sided Cpk / Ppk are reported.
+
+Confidence intervals come from a moving-block bootstrap: historian series
+are autocorrelated, so each resample joins randomly chosen blocks of about
+n ** (1/3) consecutive points instead of single points. A resample's
+within sigma uses only the moving ranges inside its blocks, since the jump
+between two unrelated blocks is not a short-term variation. Every block's
+sum, sum of squares and moving-range sum are precomputed from prefix sums,
+so a resample costs O(n / block) rather than O(n). With NumPy the
+resamples are vectorized in batches; without it they are split across a
+process pool. The two paths draw different random numbers, so their
+intervals differ slightly; each is reproducible for a given seed.
+
+Zero external dependencies (stdlib only; NumPy optional).
+"""
+
+import math
+import multiprocessing
+import operator
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from spc_engine import MovingRange
+
+try:
+    import numpy as np
+except ImportError:  # optional: the process pool covers it
+    np = None
+
+
+DEFAULT_RESAMPLES = 2000
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_SEED = 0
+# Resample-block draws per NumPy batch, bounding the index matrix.
+NUMPY_BATCH_DRAWS = 2_000_000
+# Pure-Python resamples per seeded batch (the unit of work for the process pool).
+PYTHON_BATCH = 250
+# Pure-Python draws below which the process pool is not worth starting.
+PARALLEL_MIN_DRAWS = 2_000_000
+
+INDICES = ("cp", "cpk", "pp", "ppk")
+
+
+def capability_indices(mean, sigma_within, sigma_overall, usl, lsl):
+    """Cp, Cpk, Pp and Ppk as a dict; None where undefined."""
+    cp, cpk = _indices(mean, sigma_within, usl, lsl)
+    pp, ppk = _indices(mean, sigma_overall, usl, lsl)
+    return {"cp": cp, "cpk": cpk, "pp": pp, "ppk": ppk}
+
+
+def _indices(mean, sigma, usl, lsl):
+    if not sigma > 0:
+        return None, None
+    spread = (usl - lsl) / (6 * sigma) if usl is not None and lsl is not None else None
+    sides = []
+    if usl is not None:
+        sides.append((usl - mean) / (3 * sigma))
+    if lsl is not None:
+        sides.append((mean - lsl) / (3 * sigma))
+    return spread, min(sides)
+
+
+def block_length(n):
+    return max(2, round(n ** (1 / 3)))
+
+
+def bootstrap_intervals(values, usl, lsl, resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE,
+                        seed=DEFAULT_SEED, processes=1):
+    """Percentile intervals for each index: dict of name -> [low, high] (None if undefined)."""
+    n = len(values)
+    block = block_length(n)
+    if np is not None:
+        samples = _bootstrap_numpy(values, block, resamples, seed)
+    else:
+        samples = _bootstrap_python(values, block, resamples, seed, processes)
+
+    alpha = (1.0 - confidence) / 2.0
+    intervals = {}
+    for name in INDICES:
+        drawn = sorted(s for s in (capability_indices(mean, within, overall, usl, lsl)[name]
+                                   for mean, within, overall in samples) if s is not None)
+        intervals[name] = [_quantile(drawn, alpha), _quantile(drawn, 1.0 - alpha)] if drawn else None
+    return intervals
+
+
+def _quantile(ordered, q):
+    """Linear-interpolation quantile of a sorted list (NumPy's default method)."""
+    position = q * (len(ordered) - 1)
+    lo = math.floor(position)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (position - lo)
+
+
+def _block_sums(values, block):
+    """Per-block-start sum, sum of squares and moving-range sum.
+
+    Values are centered on their mean (returned as the offset) so the sums
+    of squares do not lose precision.
+    """
+    offset = math.fsum(values) / len(values)
+    centered = [v - offset for v in values]
+    s1, s2, mr = [0.0], [0.0], [0.0]
+    for i, v in enumerate(centered):
+        s1.append(s1[-1] + v)
+        s2.append(s2[-1] + v * v)
+        if i:
+            mr.append(mr[-1] + abs(v - centered[i - 1]))
+    starts = len(values) - block + 1
+    return (offset,
+            [s1[s + block] - s1[s] for s in range(starts)],
+            [s2[s + block] - s2[s] for s in range(starts)],
+            [mr[s + block - 1] - mr[s] for s in range(starts)])
+
+
+def _moments(offset, k, block, total, squares, ranges):
+    m = k * block
+    mean = total / m
+    variance = max(0.0, (squares - m * mean * mean) / (m - 1))
+    return offset + mean, ranges / (k * (block - 1)) / MovingRange.D2, math.sqrt(variance)
+
+
+def _bootstrap_numpy(values, block, resamples, seed):
+    v = np.asarray(values, dtype=np.float64)
+    offset = v.mean()
+    c = v - offset
+    n = len(c)
+    s1 = np.concatenate([[0.0], np.cumsum(c)])
+    s2 = np.concatenate([[0.0], np.cumsum(c * c)])
+    mr = np.concatenate([[0.0], np.cumsum(np.abs(np.diff(c)))])
+    starts = np.arange(n - block + 1)
+    sums = s1[starts + block] - s1[starts]
+    squares = s2[starts + block] - s2[starts]
+    ranges = mr[starts + block - 1] - mr[starts]
+
+    k = math.ceil(n / block)
+    m = k * block
+    rng = np.random.default_rng(seed)
+    batch = max(1, NUMPY_BATCH_DRAWS // k)
+    samples = []
+    for lo in range(0, resamples, batch):
+        picks = rng.integers(0, len(starts), size=(min(batch, resamples - lo), k))
+        total = sums[picks].sum(axis=1) / m
+        variance = np.maximum(0.0, (squares[picks].sum(axis=1) - m * total * total) / (m - 1))
+        within = ranges[picks].sum(axis=1) / (k * (block - 1)) / MovingRange.D2
+        samples.extend(zip((offset + total).tolist(), within.tolist(), np.sqrt(variance).tolist()))
+    return samples
+
+
+def _bootstrap_python(values, block, resamples, seed, processes):
+    tables = _block_sums(values, block)
+    k = math.ceil(len(values) / block)
+    # Fixed batches, each with its own seed, so results do not depend on the worker count
+    jobs = [(tables, block, k, min(PYTHON_BATCH, resamples - lo), (seed, lo))
+            for lo in range(0, resamples, PYTHON_BATCH)]
+    workers = min(processes, len(jobs))
+    if workers <= 1 or resamples * k < PARALLEL_MIN_DRAWS:
+        batches = map(_resample_batch, jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            batches = list(pool.map(_resample_batch, jobs))
+    return [sample for batch in batches for sample in batch]
+
+
+def _resample_batch(job):
+    """(mean, within sigma, overall sigma) for ``count`` block resamples."""
+    (offset, sums, squares, ranges), block, k, count, seed = job
+    rng = random.Random(repr(seed))
+    starts = range(len(sums))
+    samples = []
+    for _ in range(count):
+        # itemgetter with k >= 2 indices returns a tuple, gathered in C
+        pick = operator.itemgetter(*rng.choices(starts, k=k))
+        samples.append(_moments(offset, k, block, sum(pick(sums)), sum(pick(squares)), sum(pick(ranges))))
+    return samples
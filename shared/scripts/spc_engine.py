@@ -0,0 +1,708 @@
+#!/usr/bin/env python3
+"""Streaming Western Electric / Nelson rule engine for spc_analysis.
+
+The points of a TagSeries are consumed once, in time order, in chunks. Each
+rule is a small object with constant state (run counters, the previous
+point) that carries over from one chunk to the next, and each chunk runs
+through every rule's own tight loop. The statistics accumulate the same way,
+so with fixed control limits one pass computes everything. A rule merges its
+violations into episodes as it goes: violations of the same kind no further
+apart than the points the rule's pattern spans form one episode (start, end,
+count, peak). It keeps its violation and episode counts and the first few
+episodes, so output and allocation scale with the number of excursions, not
+with the number of offending points. The zone rules (5-8) measure
+sigma as (UCL - LCL) / 6 around the center line and keep their recent
+points as bitmasks or run counters, so each point stays O(1) whatever rules
+are enabled. EWMA and tabular CUSUM charts, which catch small sustained
+shifts the run rules miss, are rules too ("ewma", "cusum") and run in the
+same pass.
+
+With NumPy installed, long series are evaluated by vectorized ``scan``
+implementations that reproduce the streaming results exactly. Every
+accumulator can be snapshotted with get_state() and restored with
+set_state(), so an evaluation can stop and resume later on newer points.
+
+Zero external dependencies (stdlib only; NumPy optional).
+"""
+
+import math
+import operator
+from bisect import bisect_left
+
+from tagseries import format_iso_ms
+
+try:
+    import numpy as np
+except ImportError:  # optional: the streaming path covers everything
+    np = None
+
+
+# Violation episodes reported in detail per rule; the rest are only counted.
+MAX_EXAMPLES = 3
+# Points per chunk fed through the rules.
+CHUNK_POINTS = 65536
+# Series at least this long take the NumPy path when it is available.
+NUMPY_MIN_POINTS = 50_000
+
+# Western Electric Rules 1-4 are the plant default (ENT-B-QA-012).
+DEFAULT_RULES = (1, 2, 3, 4)
+# Rules 1-8 then the EWMA and CUSUM detectors, in reporting order.
+ALL_RULES = (1, 2, 3, 4, 5, 6, 7, 8, "ewma", "cusum")
+# EWMA weight lambda and limit width L (in sigma of the EWMA statistic).
+DEFAULT_EWMA = (0.2, 3.0)
+# CUSUM reference value k and decision interval h, in sigma.
+DEFAULT_CUSUM = (0.5, 5.0)
+
+# Set bits in a window bitmask of up to 5 points.
+_BITS = tuple(bin(i).count("1") for i in range(32))
+
+
+class RunningStats:
+    """Count, mean, variance, min and max accumulated chunk by chunk.
+
+    Each chunk is reduced with two C-level passes and merged into the
+    running totals with Chan's parallel update of Welford's M2, so a single
+    chunk gives exactly the textbook two-pass result.
+    """
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def feed(self, values):
+        n = len(values)
+        if n == 0:
+            return
+        mean = sum(values) / n
+        m2 = sum((v - mean) ** 2 for v in values)
+        lo, hi = min(values), max(values)
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = n, mean, m2, lo, hi
+            return
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, lo)
+        self.max = max(self.max, hi)
+
+    @property
+    def std_dev(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def result(self):
+        """Statistics as a dict, or None if no points were seen."""
+        if self.count == 0:
+            return None
+        return {
+            "mean": self.mean,
+            "std_dev": self.std_dev,
+            "min": self.min,
+            "max": self.max,
+            "count": self.count,
+        }
+
+
+class MovingRange:
+    """Average moving range |x[i] - x[i-1]|, accumulated chunk by chunk.
+
+    MR-bar / d2 (1.128 for ranges of two) estimates the short-term,
+    within-process sigma, which long-term drift does not inflate.
+    """
+
+    __slots__ = ("prev", "total", "count")
+    D2 = 1.128
+
+    def __init__(self):
+        self.prev = None
+        self.total = 0.0
+        self.count = 0
+
+    def feed(self, values):
+        if not len(values):
+            return
+        if self.prev is not None:
+            self.total += abs(values[0] - self.prev)
+            self.count += 1
+        self.total += sum(map(abs, map(operator.sub, values[1:], values[:-1])))
+        self.count += len(values) - 1
+        self.prev = values[-1]
+
+    @property
+    def sigma(self):
+        return self.total / self.count / self.D2 if self.count else 0.0
+
+
+class Rule:
+    """Base rule: violation and episode counts plus the first MAX_EXAMPLES episodes.
+
+    An episode is kept as [start_ms, first_value, end_ms, count, min_value,
+    max_value, description]. ``span`` is how many points apart two
+    violations of the same kind may be and still extend one episode.
+    """
+
+    __slots__ = ("count", "episode_count", "episodes", "seen", "last_pos", "last_desc", "_times")
+    rule = None
+    severity = None
+    span = 1
+
+    def __init__(self):
+        self.count = 0
+        self.episode_count = 0
+        self.episodes = []
+        self.seen = 0  # points consumed before the current chunk
+        self.last_pos = None
+        self.last_desc = None
+        self._times = None
+
+    def advance(self, times, values):
+        """Feed one chunk, tracking point positions for episode merging."""
+        self._times = times
+        self.feed(times, values)
+        self.seen += len(times)
+        self._times = None
+
+    def _continues(self, pos, description):
+        return description == self.last_desc and pos - self.last_pos <= self.span
+
+    def _flag(self, t, v, description):
+        self.count += 1
+        pos = self.seen + bisect_left(self._times, t)
+        if self._continues(pos, description):
+            if len(self.episodes) == self.episode_count:
+                episode = self.episodes[-1]
+                episode[2] = t
+                episode[3] += 1
+                if v < episode[4]:
+                    episode[4] = v
+                elif v > episode[5]:
+                    episode[5] = v
+        else:
+            self.episode_count += 1
+            if len(self.episodes) < MAX_EXAMPLES:
+                self.episodes.append([t, v, t, 1, v, v, description])
+        self.last_pos, self.last_desc = pos, description
+
+    def _flag_indices(self, times, values, hits, describe, keys=None):
+        """Record violations at NumPy indices ``hits`` (vectorized path).
+
+        ``keys`` tells apart hits with different descriptions (e.g. above
+        or below the center line); runs of hits with the same key and gaps
+        of at most ``span`` points are episodes.
+        """
+        if not len(hits):
+            return
+        self.count += len(hits)
+        positions = self.seen + hits
+        breaks = np.diff(positions) > self.span
+        if keys is not None:
+            breaks |= keys[1:] != keys[:-1]
+        bounds = np.concatenate([[0], np.flatnonzero(breaks) + 1, [len(hits)]]).tolist()
+        for n, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if len(self.episodes) >= MAX_EXAMPLES and n > 0:
+                self.episode_count += len(bounds) - 1 - n
+                break
+            first = int(hits[lo])
+            description = describe(first, float(values[first]))
+            segment = values[hits[lo:hi]]
+            end, low, high = int(times[hits[hi - 1]]), float(segment.min()), float(segment.max())
+            if n == 0 and self._continues(int(positions[0]), description):
+                if len(self.episodes) == self.episode_count:
+                    episode = self.episodes[-1]
+                    episode[2] = end
+                    episode[3] += hi - lo
+                    episode[4] = min(episode[4], low)
+                    episode[5] = max(episode[5], high)
+                continue
+            self.episode_count += 1
+            if len(self.episodes) < MAX_EXAMPLES:
+                self.episodes.append([int(times[first]), float(values[first]), end, hi - lo, low, high, description])
+        last = int(hits[-1])
+        self.last_pos, self.last_desc = int(positions[-1]), describe(last, float(values[last]))
+
+    def violations(self, center):
+        """The example episodes in output form; ``peak`` is the value farthest from center."""
+        return [{
+            "rule": self.rule,
+            "description": description,
+            "timestamp": format_iso_ms(start),
+            "value": round(first, 2),
+            "end": format_iso_ms(end),
+            "count": count,
+            "peak": round(high if abs(high - center) >= abs(low - center) else low, 2),
+            "severity": self.severity,
+        } for start, first, end, count, low, high, description in self.episodes]
+
+
+class BeyondLimits(Rule):
+    """Rule 1: One point beyond 3 sigma (UCL or LCL)."""
+
+    __slots__ = ("ucl", "lcl")
+    rule = 1
+    severity = "immediate_action"
+
+    def __init__(self, ucl, lcl):
+        super().__init__()
+        self.ucl = ucl
+        self.lcl = lcl
+
+    @staticmethod
+    def _describe(above):
+        return f"Point beyond control limits ({'above UCL' if above else 'below LCL'})"
+
+    def feed(self, times, values):
+        ucl, lcl = self.ucl, self.lcl
+        for t, v in zip(times, values):
+            if v > ucl or v < lcl:
+                self._flag(t, v, self._describe(v > ucl))
+
+    def scan(self, times, values):
+        hits = np.flatnonzero((values > self.ucl) | (values < self.lcl))
+        self._flag_indices(times, values, hits, lambda i, v: self._describe(v > self.ucl),
+                           values[hits] > self.ucl)
+
+
+class RunAboveBelow(Rule):
+    """Rule 2: 9 consecutive points on same side of center.
+
+    A point exactly on the center line ends the run, and the count restarts
+    after each violation so an extended run is reported every 9 points.
+    """
+
+    __slots__ = ("center", "run", "above")
+    rule = 2
+    severity = "trend_alert"
+    span = 9
+
+    def __init__(self, center):
+        super().__init__()
+        self.center = center
+        self.run = 0
+        self.above = None
+
+    @staticmethod
+    def _describe(above):
+        return f"9 consecutive points {'above' if above else 'below'} center line"
+
+    def feed(self, times, values):
+        center, run, above = self.center, self.run, self.above
+        for t, v in zip(times, values):
+            if above is None:
+                above = v > center
+                run = 1
+                continue
+            if v == center:
+                run = 0
+                continue
+            current_above = v > center
+            if current_above == above:
+                run += 1
+            else:
+                run = 1
+                above = current_above
+            if run >= 9:
+                self._flag(t, v, self._describe(above))
+                run = 0  # Reset to avoid duplicate reporting for extended runs
+        self.run, self.above = run, above
+
+    def scan(self, times, values):
+        side = np.where(values > self.center, 1, -1)
+        side[values == self.center] = 0
+        side[0] = 1 if values[0] > self.center else -1
+        same = np.zeros(len(values), dtype=bool)
+        same[1:] = (side[1:] != 0) & (side[1:] == side[:-1])
+        position = _run_position(same) + 1
+        hits = np.flatnonzero((side != 0) & (position % 9 == 0))
+        self._flag_indices(times, values, hits, lambda i, v: self._describe(side[i] > 0), side[hits])
+
+
+class Trend(Rule):
+    """Rule 3: 6 consecutive points steadily increasing or decreasing."""
+
+    __slots__ = ("prev", "inc", "dec")
+    rule = 3
+    severity = "trend_alert"
+    span = 6
+
+    def __init__(self):
+        super().__init__()
+        self.prev = None
+        self.inc = 1
+        self.dec = 1
+
+    def feed(self, times, values):
+        prev, inc, dec = self.prev, self.inc, self.dec
+        for t, v in zip(times, values):
+            if prev is None:
+                prev = v
+                continue
+            if v > prev:
+                inc += 1
+                dec = 1
+            elif v < prev:
+                dec += 1
+                inc = 1
+            else:
+                inc = 1
+                dec = 1
+            prev = v
+            if inc >= 6:
+                self._flag(t, v, "6 consecutive points steadily increasing")
+                inc = 1  # Reset
+            elif dec >= 6:
+                self._flag(t, v, "6 consecutive points steadily decreasing")
+                dec = 1  # Reset
+        self.prev, self.inc, self.dec = prev, inc, dec
+
+    def scan(self, times, values):
+        step = np.diff(values)
+        rising = _run_position(step > 0)
+        falling = _run_position(step < 0)
+        hits = np.flatnonzero(((rising > 0) & (rising % 5 == 0)) | ((falling > 0) & (falling % 5 == 0))) + 1
+        self._flag_indices(
+            times, values, hits,
+            lambda i, v: f"6 consecutive points steadily {'increasing' if step[i - 1] > 0 else 'decreasing'}",
+            step[hits - 1] > 0)
+
+
+class Alternating(Rule):
+    """Rule 4: 14 consecutive points alternating up and down."""
+
+    __slots__ = ("prev", "direction", "alt")
+    rule = 4
+    severity = "process_alert"
+    span = 14
+
+    def __init__(self):
+        super().__init__()
+        self.prev = None
+        self.direction = None
+        self.alt = 1
+
+    def feed(self, times, values):
+        prev, prev_dir, alt = self.prev, self.direction, self.alt
+        for t, v in zip(times, values):
+            if prev is None:
+                prev = v
+                continue
+            curr_dir = v - prev
+            prev = v
+            if prev_dir is None:
+                prev_dir = curr_dir
+                continue
+            if (prev_dir > 0 and curr_dir < 0) or (prev_dir < 0 and curr_dir > 0):
+                alt += 1
+            else:
+                alt = 1
+            prev_dir = curr_dir
+            if alt >= 14:
+                self._flag(t, v, "14 consecutive points alternating up and down")
+                alt = 1  # Reset
+        self.prev, self.direction, self.alt = prev, prev_dir, alt
+
+    def scan(self, times, values):
+        step = np.diff(values)
+        flips = ((step[:-1] > 0) & (step[1:] < 0)) | ((step[:-1] < 0) & (step[1:] > 0))
+        position = _run_position(flips)
+        hits = np.flatnonzero((position > 0) & (position % 13 == 0)) + 2
+        self._flag_indices(times, values, hits, lambda i, v: "14 consecutive points alternating up and down")
+
+
+class KOfN(Rule):
+    """k of the last n points beyond ``zone`` sigma on the same side.
+
+    Each side keeps its last n points as a bitmask; the side that reports
+    is cleared so one excursion is not reported on every following point.
+    """
+
+    __slots__ = ("upper", "lower", "above", "below")
+    k = n = zone = None
+
+    def __init__(self, center, sigma):
+        super().__init__()
+        self.upper = center + self.zone * sigma
+        self.lower = center - self.zone * sigma
+        self.above = 0
+        self.below = 0
+
+    @property
+    def span(self):
+        return self.n
+
+    def _describe(self, above):
+        return (f"{self.k} of {self.n} consecutive points beyond {self.zone} sigma "
+                f"{'above' if above else 'below'} center line")
+
+    def feed(self, times, values):
+        upper, lower, above, below = self.upper, self.lower, self.above, self.below
+        k, window = self.k, (1 << self.n) - 1
+        for t, v in zip(times, values):
+            above = ((above << 1) | (v > upper)) & window
+            below = ((below << 1) | (v < lower)) & window
+            if v > upper and _BITS[above] >= k:
+                self._flag(t, v, self._describe(True))
+                above = 0
+            elif v < lower and _BITS[below] >= k:
+                self._flag(t, v, self._describe(False))
+                below = 0
+        self.above, self.below = above, below
+
+    def scan(self, times, values):
+        hits = np.sort(np.concatenate([self._scan_side(values > self.upper),
+                                       self._scan_side(values < self.lower)]))
+        self._flag_indices(times, values, hits, lambda i, v: self._describe(v > self.upper),
+                           values[hits] > self.upper)
+
+    def _scan_side(self, beyond):
+        """Indices reported for one side, replaying the clear-after-report."""
+        counts = np.concatenate([[0], np.cumsum(beyond)])
+        index = np.arange(len(beyond))
+        in_window = counts[index + 1] - counts[np.maximum(index - self.n + 1, 0)]
+        hits, cleared = [], -1
+        for i in np.flatnonzero(beyond & (in_window >= self.k)):
+            if counts[i + 1] - counts[max(i - self.n + 1, cleared + 1)] >= self.k:
+                hits.append(i)
+                cleared = i
+        return np.array(hits, dtype=np.int64)
+
+
+class TwoOfThree(KOfN):
+    """Rule 5: 2 of 3 consecutive points beyond 2 sigma on the same side."""
+
+    __slots__ = ()
+    rule = 5
+    severity = "trend_alert"
+    k, n, zone = 2, 3, 2
+
+
+class FourOfFive(KOfN):
+    """Rule 6: 4 of 5 consecutive points beyond 1 sigma on the same side."""
+
+    __slots__ = ()
+    rule = 6
+    severity = "trend_alert"
+    k, n, zone = 4, 5, 1
+
+
+class ZoneRun(Rule):
+    """``length`` consecutive points inside (or outside) 1 sigma of center."""
+
+    __slots__ = ("center", "sigma", "run")
+    length = inside = description = None
+
+    def __init__(self, center, sigma):
+        super().__init__()
+        self.center = center
+        self.sigma = sigma
+        self.run = 0
+
+    @property
+    def span(self):
+        return self.length
+
+    def feed(self, times, values):
+        center, sigma, run, length, inside = self.center, self.sigma, self.run, self.length, self.inside
+        for t, v in zip(times, values):
+            if (abs(v - center) < sigma) == inside:
+                run += 1
+                if run >= length:
+                    self._flag(t, v, self.description)
+                    run = 0
+            else:
+                run = 0
+        self.run = run
+
+    def scan(self, times, values):
+        position = _run_position((np.abs(values - self.center) < self.sigma) == self.inside)
+        hits = np.flatnonzero((position > 0) & (position % self.length == 0))
+        self._flag_indices(times, values, hits, lambda i, v: self.description)
+
+
+class Stratification(ZoneRun):
+    """Rule 7: 15 consecutive points within 1 sigma of center."""
+
+    __slots__ = ()
+    rule = 7
+    severity = "process_alert"
+    length, inside = 15, True
+    description = "15 consecutive points within 1 sigma of center line"
+
+
+class Mixture(ZoneRun):
+    """Rule 8: 8 consecutive points beyond 1 sigma, either side of center."""
+
+    __slots__ = ()
+    rule = 8
+    severity = "process_alert"
+    length, inside = 8, False
+    description = "8 consecutive points beyond 1 sigma of center line"
+
+
+class Ewma(Rule):
+    """EWMA chart: z = lambda * x + (1 - lambda) * z, started at center.
+
+    Alarms when z leaves center +/- L * sigma_z, using the exact
+    time-varying sigma_z, then restarts z at center.
+    """
+
+    __slots__ = ("center", "lam", "width", "base", "z", "decay")
+    rule = "ewma"
+    severity = "trend_alert"
+
+    def __init__(self, center, sigma, lam, width):
+        super().__init__()
+        self.center = center
+        self.lam = lam
+        self.width = width
+        self.base = sigma * sigma * lam / (2.0 - lam)
+        self.z = center
+        self.decay = 1.0  # (1 - lambda) ** (2 * points since start)
+
+    @property
+    def span(self):
+        # Effective memory of the EWMA, (2 - lambda) / lambda points
+        return math.ceil((2.0 - self.lam) / self.lam)
+
+    def _describe(self, above):
+        return (f"EWMA (lambda {self.lam:g}) beyond {self.width:g} sigma limit "
+                f"{'above' if above else 'below'} center line")
+
+    def feed(self, times, values):
+        center, lam, width, base, z, decay = self.center, self.lam, self.width, self.base, self.z, self.decay
+        keep = 1.0 - lam
+        keep2 = keep * keep
+        for t, v in zip(times, values):
+            z = lam * v + keep * z
+            decay *= keep2
+            if abs(z - center) > width * math.sqrt(base * (1.0 - decay)):
+                self._flag(t, v, self._describe(z > center))
+                z = center
+                decay = 1.0
+        self.z, self.decay = z, decay
+
+
+class Cusum(Rule):
+    """Tabular CUSUM: one-sided sums of deviations beyond k sigma.
+
+    Alarms when either sum exceeds h sigma, then restarts that side.
+    """
+
+    __slots__ = ("center", "slack", "threshold", "k", "h", "high", "low")
+    rule = "cusum"
+    severity = "trend_alert"
+
+    def __init__(self, center, sigma, k, h):
+        super().__init__()
+        self.center = center
+        self.k = k
+        self.h = h
+        self.slack = k * sigma
+        self.threshold = h * sigma
+        self.high = 0.0
+        self.low = 0.0
+
+    @property
+    def span(self):
+        # Points to re-alarm after a restart on the shift CUSUM is tuned for (2k)
+        return math.ceil(self.h / self.k) if self.k > 0 else 1
+
+    def _describe(self, up):
+        return f"CUSUM (k {self.k:g}, h {self.h:g}) sustained shift {'above' if up else 'below'} center line"
+
+    def feed(self, times, values):
+        center, slack, threshold, high, low = self.center, self.slack, self.threshold, self.high, self.low
+        for t, v in zip(times, values):
+            high += v - center - slack
+            if high < 0.0:
+                high = 0.0
+            low += center - slack - v
+            if low < 0.0:
+                low = 0.0
+            if high > threshold:
+                self._flag(t, v, self._describe(True))
+                high = 0.0
+            elif low > threshold:
+                self._flag(t, v, self._describe(False))
+                low = 0.0
+        self.high, self.low = high, low
+
+
+def western_electric_rules(ucl, lcl, center, rules=DEFAULT_RULES, ewma=DEFAULT_EWMA, cusum=DEFAULT_CUSUM):
+    """Fresh rule objects for the given rule ids, in reporting order."""
+    sigma = (ucl - lcl) / 6.0
+    factories = {
+        1: lambda: BeyondLimits(ucl, lcl),
+        2: lambda: RunAboveBelow(center),
+        3: Trend,
+        4: Alternating,
+        5: lambda: TwoOfThree(center, sigma),
+        6: lambda: FourOfFive(center, sigma),
+        7: lambda: Stratification(center, sigma),
+        8: lambda: Mixture(center, sigma),
+        "ewma": lambda: Ewma(center, sigma, *ewma),
+        "cusum": lambda: Cusum(center, sigma, *cusum),
+    }
+    wanted = set(rules)
+    return [factories[r]() for r in ALL_RULES if r in wanted]
+
+
+def evaluate(series, rules, stats=None, chunk_points=CHUNK_POINTS, fresh=True, resumable=False):
+    """Feed a TagSeries through ``rules`` (and ``stats``) in one pass.
+
+    Long series go to each rule's vectorized ``scan`` when NumPy is
+    available and the rules are ``fresh``; everything else streams through
+    ``feed`` chunk by chunk, continuing from the rules' current state. A
+    scan does not leave the streaming state behind, so ``resumable`` rules
+    (to be checkpointed and continued) always stream.
+    """
+    times, values = series.times, series.values
+    streamed = rules
+    if fresh and not resumable and np is not None and len(values) >= NUMPY_MIN_POINTS:
+        t = np.frombuffer(times, dtype=np.int64)
+        v = np.frombuffer(values, dtype=np.float64)
+        for rule in rules:
+            if hasattr(rule, "scan"):
+                rule.scan(t, v)
+                rule.seen += len(v)
+        streamed = [r for r in rules if not hasattr(r, "scan")]
+    if not streamed and stats is None:
+        return
+    for lo in range(0, len(values), chunk_points):
+        chunk_t = times[lo:lo + chunk_points]
+        chunk_v = values[lo:lo + chunk_points]
+        if stats is not None:
+            stats.feed(chunk_v)
+        for rule in streamed:
+            rule.advance(chunk_t, chunk_v)
+
+
+def get_state(obj):
+    """JSON-ready snapshot of a RunningStats or Rule (all of its slots)."""
+    return {name: getattr(obj, name) for name in _slot_names(type(obj))}
+
+
+def set_state(obj, state):
+    """Restore a snapshot taken by get_state() onto a fresh object."""
+    for name in _slot_names(type(obj)):
+        if name in state:
+            setattr(obj, name, state[name])
+    return obj
+
+
+def _slot_names(cls):
+    """Slots that make up the state; underscore slots are per-chunk scratch."""
+    return [name for klass in reversed(cls.__mro__) for name in getattr(klass, "__slots__", ())
+            if not name.startswith("_")]
+
+
+def _run_position(mask):
+    """1-based position of each True within its run of Trues; 0 where False."""
+    index = np.arange(1, len(mask) + 1)
+    last_false = np.maximum.accumulate(np.where(mask, 0, index))
+    return np.where(mask, index - last_false, 0)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""On-disk state for spc_analysis.
+
+Baseline control limits (--baseline) are kept per tag in one JSON file, so
+later analyses use fixed limits computed once from a reference period
+instead of limits that move with every analyzed window.
+
+A checkpoint records where an incremental SPC evaluation of one tag stopped:
+the window start and options it was computed for, the frozen control limits,
+the timestamp of the last processed point and the snapshots of the running
+statistics and every rule (see spc_engine.get_state). The next
+``--incremental`` run for the same window fetches only newer points and
+continues from there. Checkpoints are small JSON files, one per tag, kept
+next to the historian cache.
+
+Zero external dependencies (stdlib only).
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+
+from historian_cache import default_cache_dir
+
+
+CHECKPOINT_VERSION = 2
+LIMITS_VERSION = 1
+
+
+def default_checkpoint_dir():
+    return os.path.join(default_cache_dir(), "spc-checkpoints")
+
+
+def default_limits_path():
+    """Limit store: $SPC_LIMITS_FILE or ~/.config/enterprise-b/spc-limits.json."""
+    return os.environ.get("SPC_LIMITS_FILE") or os.path.join(
+        os.path.expanduser("~"), ".config", "enterprise-b", "spc-limits.json")
+
+
+def _filename(dataset, tag):
+    return hashlib.sha1(f"{dataset}\0{tag}".encode()).hexdigest() + ".json"
+
+
+class CheckpointStore:
+    """One JSON checkpoint per (dataset, tag); a new window replaces the old one."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or default_checkpoint_dir()
+
+    def path(self, dataset, tag):
+        return os.path.join(self.directory, _filename(dataset, tag))
+
+    def load(self, dataset, tag, start, options):
+        """The saved state for this tag, window start and options, or None."""
+        try:
+            with open(self.path(dataset, tag)) as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"spc checkpoint ignored: {e}", file=sys.stderr)
+            return None
+        if (checkpoint.get("version") != CHECKPOINT_VERSION
+                or checkpoint.get("dataset") != dataset
+                or checkpoint.get("tag") != tag
+                or checkpoint.get("start") != start
+                or checkpoint.get("options") != checkpoint_options(options)):
+            return None
+        return checkpoint.get("state")
+
+    def save(self, dataset, tag, start, options, state):
+        """Write atomically, so a concurrent reader never sees a partial file."""
+        checkpoint = {
+            "version": CHECKPOINT_VERSION,
+            "dataset": dataset,
+            "tag": tag,
+            "start": start,
+            "options": checkpoint_options(options),
+            "state": state,
+        }
+        path = self.path(dataset, tag)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(checkpoint, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"spc checkpoint not saved: {e}", file=sys.stderr)
+
+
+def checkpoint_options(options):
+    """The analysis options a checkpoint is valid for, in JSON form."""
+    return {"ucl": options["ucl"], "lcl": options["lcl"], "target": options["target"],
+            "rules": list(options["rules"]), "ewma": list(options["ewma"]), "cusum": list(options["cusum"])}
+
+
+class LimitStore:
+    """Baseline control limits per (dataset, tag) in a single JSON file."""
+
+    def __init__(self, path=None):
+        self.path = path or default_limits_path()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"spc limit store unreadable: {e}", file=sys.stderr)
+            return {}
+        if data.get("version") != LIMITS_VERSION:
+            return {}
+        return data.get("datasets", {})
+
+    def load(self, dataset):
+        """Dict of tag -> stored limits for the dataset."""
+        return self._read().get(dataset, {})
+
+    def save(self, dataset, limits_by_tag):
+        """Merge limits into the store (re-read first, then replace atomically)."""
+        datasets = self._read()
+        datasets.setdefault(dataset, {}).update(limits_by_tag)
+        directory = os.path.dirname(self.path) or "."
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump({"version": LIMITS_VERSION, "datasets": datasets}, f, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            return f"Could not save limits to {self.path}: {e}"
+        return None
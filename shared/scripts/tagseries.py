@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""Columnar time series for historian tag data.
+
+A TagSeries holds one tag's points as two parallel columns instead of a list
+of {"t": "...", "v": ...} dicts: timestamps as int64 epoch milliseconds in
+``array('q')`` and values in ``array('d')``. Tags with non-numeric values
+(state names, work order numbers) keep their values in a plain list. The
+historian client builds these straight from the decoded response, so the
+point dicts are never kept around.
+
+resample() reduces a numeric series to fixed-interval buckets (last, mean or
+time-weighted mean) and decimate() caps its length with min/max or LTTB
+(largest triangle three buckets) selection; both make one pass over the
+points.
+
+Zero external dependencies (stdlib only).
+"""
+
+import json
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_MS = datetime.fromtimestamp(0.001, timezone.utc) - _EPOCH
+_MINUTE_CACHE = {}
+_HEADER = struct.Struct("<cI")
+
+
+def parse_iso_ms(ts):
+    """Parse an ISO 8601 timestamp to epoch milliseconds.
+
+    The historian's UTC form ``YYYY-MM-DDTHH:MM:SS[.fff…]Z`` takes a fast
+    path that memoizes the minute prefix; anything else goes through
+    datetime.fromisoformat().
+    """
+    if len(ts) >= 20 and ts[-1] == "Z" and ts[16] == ":":
+        base = _MINUTE_CACHE.get(ts[:16])
+        if base is None:
+            dt = datetime.fromisoformat(ts[:16]).replace(tzinfo=timezone.utc)
+            base = (dt - _EPOCH) // _ONE_MS
+            if len(_MINUTE_CACHE) > 100_000:
+                _MINUTE_CACHE.clear()
+            _MINUTE_CACHE[ts[:16]] = base
+        seconds = ts[17:-1]
+        if "." in seconds:
+            whole, frac = seconds.split(".", 1)
+            return base + int(whole) * 1000 + int((frac + "000")[:3])
+        return base + int(seconds) * 1000
+    dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // _ONE_MS
+
+
+def format_iso_ms(ms):
+    """Format epoch milliseconds as ``YYYY-MM-DDTHH:MM:SS.fffZ``."""
+    seconds, millis = divmod(ms, 1000)
+    dt = datetime.fromtimestamp(seconds, timezone.utc)
+    return f"{dt.strftime('%Y-%m-%dT%H:%M:%S')}.{millis:03d}Z"
+
+
+_DURATION_UNITS = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000}
+
+
+def parse_duration_ms(text):
+    """Parse a duration such as '30s', '15m', '1h' or '1d' (bare numbers are seconds) to ms."""
+    text = text.strip().lower()
+    for unit in ("ms", "s", "m", "h", "d"):
+        if text.endswith(unit) and (unit != "s" or not text.endswith("ms")):
+            number, scale = text[:-len(unit)], _DURATION_UNITS[unit]
+            break
+    else:
+        number, scale = text, 1000
+    ms = int(float(number) * scale)
+    if ms <= 0:
+        raise ValueError(f"duration must be positive: {text!r}")
+    return ms
+
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+class TagSeries:
+    """One tag's points as parallel timestamp/value columns."""
+
+    __slots__ = ("name", "times", "values")
+
+    def __init__(self, name, times=None, values=None):
+        self.name = name
+        self.times = times if times is not None else array("q")
+        self.values = values if values is not None else array("d")
+
+    @classmethod
+    def from_points(cls, name, points):
+        """Build from the historian's ``d`` list, skipping points without a value."""
+        times = array("q")
+        raw = []
+        for p in points:
+            if "v" in p:
+                times.append(parse_iso_ms(p["t"]))
+                raw.append(p["v"])
+        if all(_is_number(v) for v in raw):
+            return cls(name, times, array("d", raw))
+        return cls(name, times, raw)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __bool__(self):
+        return len(self.times) > 0
+
+    def __repr__(self):
+        return f"TagSeries({self.name!r}, {len(self)} points)"
+
+    @property
+    def is_numeric(self):
+        return isinstance(self.values, array)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the columns."""
+        if self.is_numeric:
+            return self.times.itemsize * len(self.times) + self.values.itemsize * len(self.values)
+        return self.times.itemsize * len(self.times) + 8 * len(self.values)
+
+    def iso(self, i):
+        """Timestamp of point ``i`` as an ISO 8601 string."""
+        return format_iso_ms(self.times[i])
+
+    def take(self, indices):
+        """New series holding only the points at the given indices."""
+        times = array("q", (self.times[i] for i in indices))
+        if self.is_numeric:
+            return TagSeries(self.name, times, array("d", (self.values[i] for i in indices)))
+        return TagSeries(self.name, times, [self.values[i] for i in indices])
+
+    def between(self, start_ms, end_ms):
+        """New series holding the points with start_ms <= t <= end_ms."""
+        lo = bisect_left(self.times, start_ms)
+        hi = bisect_right(self.times, end_ms)
+        return TagSeries(self.name, self.times[lo:hi], self.values[lo:hi])
+
+    # --- Serialization (used by the on-disk cache) ---
+
+    def to_bytes(self):
+        """Pack as a header, the raw timestamp column and the value column."""
+        if self.is_numeric:
+            body = self.values.tobytes()
+            kind = b"d"
+        else:
+            body = json.dumps(self.values, separators=(",", ":")).encode()
+            kind = b"j"
+        return _HEADER.pack(kind, len(self.times)) + self.times.tobytes() + body
+
+    @classmethod
+    def from_bytes(cls, name, data):
+        kind, n = _HEADER.unpack_from(data)
+        offset = _HEADER.size + 8 * n
+        times = array("q")
+        times.frombytes(data[_HEADER.size:offset])
+        if kind == b"d":
+            values = array("d")
+            values.frombytes(data[offset:])
+        else:
+            values = json.loads(data[offset:])
+        return cls(name, times, values)
+
+
+# --- Resampling and decimation (numeric series) ---
+
+RESAMPLE_AGGREGATES = ("last", "mean", "twa")
+DECIMATE_METHODS = ("lttb", "minmax")
+
+
+def resample(series, interval_ms, agg="mean", end_ms=None):
+    """Fixed-interval series with one point per non-empty bucket.
+
+    Buckets are aligned to the epoch, so hour and shift boundaries fall on
+    bucket edges, and each point is stamped with its bucket start. ``agg`` is
+    the bucket's last value, mean value or time-weighted mean ("twa"): the
+    historian holds a value until the next point, so each value is weighted
+    by how long it held within the bucket, including a value carried over
+    from the previous bucket. The last bucket is closed at ``end_ms`` (the
+    window end) or at the last point.
+    """
+    if agg not in RESAMPLE_AGGREGATES:
+        raise ValueError(f"unknown aggregate {agg!r}")
+    times, values = array("q"), array("d")
+    if not series:
+        return TagSeries(series.name, times, values)
+    if agg == "twa":
+        _resample_twa(series, interval_ms, end_ms, times, values)
+        return TagSeries(series.name, times, values)
+
+    bucket = None
+    total = 0.0
+    count = 0
+    last = 0.0
+    for t, v in zip(series.times, series.values):
+        b = t - t % interval_ms
+        if b != bucket:
+            if bucket is not None:
+                times.append(bucket)
+                values.append(last if agg == "last" else total / count)
+            bucket, total, count = b, 0.0, 0
+        total += v
+        count += 1
+        last = v
+    times.append(bucket)
+    values.append(last if agg == "last" else total / count)
+    return TagSeries(series.name, times, values)
+
+
+def _resample_twa(series, interval_ms, end_ms, times, values):
+    series_times = series.times
+    bucket = series_times[0] - series_times[0] % interval_ms
+    area = 0.0
+    weight = 0
+    prev_t, prev_v = series_times[0], series.values[0]
+    for t, v in zip(series_times, series.values):
+        b = t - t % interval_ms
+        if b != bucket:
+            bucket_end = bucket + interval_ms
+            area += prev_v * (bucket_end - prev_t)
+            weight += bucket_end - prev_t
+            times.append(bucket)
+            values.append(area / weight)
+            bucket = b
+            # The previous value holds from the bucket start until this point
+            area = prev_v * (t - b)
+            weight = t - b
+        else:
+            area += prev_v * (t - prev_t)
+            weight += t - prev_t
+        prev_t, prev_v = t, v
+    stop = bucket + interval_ms
+    if end_ms is not None:
+        stop = min(stop, end_ms)
+    stop = max(stop, prev_t)
+    area += prev_v * (stop - prev_t)
+    weight += stop - prev_t
+    times.append(bucket)
+    values.append(area / weight if weight else prev_v)
+
+
+def decimate(series, max_points, method="lttb"):
+    """At most ``max_points`` points of the series, chosen to keep its shape.
+
+    "lttb" keeps the first and last point and, from each of the equal-count
+    buckets between them, the point forming the largest triangle with the
+    previous pick and the next bucket's average. "minmax" keeps the minimum
+    and maximum of each of ``max_points // 2`` buckets, in time order, so
+    every excursion survives. Shorter series are returned unchanged.
+    """
+    if method not in DECIMATE_METHODS:
+        raise ValueError(f"unknown decimation method {method!r}")
+    n = len(series)
+    if n <= max_points:
+        return series
+    if method == "minmax":
+        return series.take(_minmax_indices(series.values, max_points))
+    return series.take(_lttb_indices(series.times, series.values, max_points))
+
+
+def _minmax_indices(values, max_points):
+    n = len(values)
+    buckets = max(1, max_points // 2)
+    pick = values.__getitem__
+    indices = []
+    for i in range(buckets):
+        lo, hi = i * n // buckets, (i + 1) * n // buckets
+        if lo == hi:
+            continue
+        low = min(range(lo, hi), key=pick)
+        high = max(range(lo, hi), key=pick)
+        if low == high:
+            indices.append(low)
+        else:
+            indices.extend((low, high) if low < high else (high, low))
+    return indices
+
+
+def _lttb_indices(times, values, max_points):
+    n = len(times)
+    if max_points < 3:
+        return [0, n - 1][:max(1, max_points)]
+    every = (n - 2) / (max_points - 2)
+    origin = times[0]
+    indices = [0]
+    a = 0
+    for i in range(max_points - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        next_lo = hi
+        next_hi = min(int((i + 2) * every) + 1, n)
+        span = next_hi - next_lo
+        avg_t = sum(times[next_lo:next_hi]) / span - origin
+        avg_v = sum(values[next_lo:next_hi]) / span
+        at, av = times[a] - origin, values[a]
+        dt = at - avg_t
+        dv = avg_v - av
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs(dt * (values[j] - av) - (at - (times[j] - origin)) * dv)
+            if area > best_area:
+                best, best_area = j, area
+        indices.append(best)
+        a = best
+    indices.append(n - 1)
+    return indices
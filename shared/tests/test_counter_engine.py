@@ -0,0 +1,73 @@
+"""Reset and rollover handling of counter_engine.CounterDelta.
+
+Run with: python3 -m unittest discover shared/tests
+"""
+
+import os
+import sys
+import unittest
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from calculate_oee import bucket_deltas  # noqa: E402
+from counter_engine import ROLLOVER_WIDTHS, CounterDelta  # noqa: E402
+from tagseries import TagSeries  # noqa: E402
+
+
+class CounterDeltaTest(unittest.TestCase):
+
+    def test_monotonic_counter_is_last_minus_first(self):
+        counter = CounterDelta().advance([100.0, 150.0, 150.0, 400.0])
+        self.assertEqual(counter.delta, 300.0)
+        self.assertEqual(counter.discontinuities, 0)
+
+    def test_no_points_has_no_delta(self):
+        self.assertIsNone(CounterDelta().delta)
+
+    def test_reset_near_16_bit_top_is_not_a_rollover(self):
+        counter = CounterDelta().advance([59000.0, 60000.0, 0.0, 250.0])
+        self.assertEqual(counter.delta, 1000.0 + 250.0)
+        self.assertEqual((counter.resets, counter.rollovers), (1, 0))
+
+    def test_reset_ending_above_start_is_counted(self):
+        counter = CounterDelta().advance([500.0, 900.0, 10.0, 800.0])
+        self.assertEqual(counter.delta, 400.0 + 10.0 + 790.0)
+        self.assertEqual(counter.resets, 1)
+
+    def test_opt_in_rollover_adds_distance_to_wrap(self):
+        counter = CounterDelta(ROLLOVER_WIDTHS[16]).advance([65000.0, 65530.0, 20.0])
+        self.assertEqual(counter.delta, 530.0 + 6.0 + 20.0)
+        self.assertEqual((counter.resets, counter.rollovers), (0, 1))
+
+    def test_drop_away_from_the_wrap_is_still_a_reset_with_rollover(self):
+        counter = CounterDelta(ROLLOVER_WIDTHS[16]).advance([30000.0, 40000.0, 5.0])
+        self.assertEqual(counter.delta, 10000.0 + 5.0)
+        self.assertEqual((counter.resets, counter.rollovers), (1, 0))
+
+    def test_noise_drop_is_ignored(self):
+        counter = CounterDelta().advance([1e6, 1e6 - 1e-6, 1e6 + 10.0])
+        self.assertAlmostEqual(counter.delta, 10.0)
+        self.assertEqual(counter.resets, 0)
+
+    def test_chunks_match_one_pass(self):
+        values = [59000.0, 60000.0, 0.0, 250.0, 300.0, 5.0, 90.0]
+        chunked = CounterDelta()
+        for i in range(0, len(values), 3):
+            chunked.advance(values[i:i + 3])
+        whole = CounterDelta().advance(values)
+        self.assertEqual((chunked.delta, chunked.resets), (whole.delta, whole.resets))
+
+
+class BucketDeltasTest(unittest.TestCase):
+
+    def test_buckets_add_up_across_a_reset(self):
+        series = TagSeries("count", array("q", [0, 1000, 2000, 3000]), array("d", [60000.0, 60100.0, 0.0, 40.0]))
+        deltas, resets = bucket_deltas(series, 0, 2000, 2)
+        self.assertEqual(deltas, [100.0, 40.0])
+        self.assertEqual(resets, [0, 1])
+        self.assertEqual(sum(deltas), CounterDelta().advance(series.values).delta)
+
+
+if __name__ == "__main__":
+    unittest.main()
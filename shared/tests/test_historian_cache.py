@@ -0,0 +1,70 @@
+"""Window keys and expiry of historian_cache.HistorianCache.
+
+Run with: python3 -m unittest discover shared/tests
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from array import array
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from historian_cache import HistorianCache  # noqa: E402
+from tagseries import TagSeries  # noqa: E402
+
+
+HISTORIAN = "http://127.0.0.1:4511"
+DATASET = "Virtual Factory"
+TAG = "Enterprise B/Site1/fillerproduction/fillingline01/metric/input/countinfeed"
+
+
+def iso(epoch_seconds):
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).isoformat()
+
+
+class HistorianCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = HistorianCache(self.directory.name)
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def series(self, times_s):
+        return TagSeries(TAG, array("q", [int(t * 1000) for t in times_s]),
+                         array("d", [float(i) for i in range(len(times_s))]))
+
+    def test_closed_window_is_keyed_by_its_own_end(self):
+        end = "2026-02-17T18:00:00+00:00"
+        self.assertEqual(self.cache.window_end(end), end)
+        self.assertIsNone(self.cache.expiry(end))
+
+    def test_live_ends_within_one_ttl_share_an_entry(self):
+        now = time.time()
+        bucket = now // self.cache.live_ttl * self.cache.live_ttl
+        start = iso(bucket - 600)
+        self.cache.put_many(HISTORIAN, DATASET, {TAG: self.series([bucket - 300, bucket])}, start, iso(bucket))
+
+        hits, missed = self.cache.get_many(HISTORIAN, DATASET, [TAG], start, iso(now))
+        self.assertEqual(missed, [])
+        self.assertEqual(len(hits[TAG]), 2)
+
+    def test_live_hit_is_trimmed_to_the_query_end(self):
+        now = time.time()
+        bucket = now // self.cache.live_ttl * self.cache.live_ttl
+        start = iso(bucket - 600)
+        self.cache.put_many(HISTORIAN, DATASET, {TAG: self.series([bucket - 300, bucket, now])}, start, iso(now))
+
+        hits, missed = self.cache.get_many(HISTORIAN, DATASET, [TAG], start, iso(bucket))
+        self.assertEqual(missed, [])
+        self.assertEqual(list(hits[TAG].times), [int((bucket - 300) * 1000), int(bucket * 1000)])
+
+
+if __name__ == "__main__":
+    unittest.main()
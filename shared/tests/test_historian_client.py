@@ -0,0 +1,160 @@
+"""URL packing, chunked reads and boundary queries of HistorianClient.
+
+The chunk and boundary tests run against a stubbed get_json that serves
+synthetic points from an inclusive [start, end] window, as the historian does.
+
+Run with: python3 -m unittest discover shared/tests
+"""
+
+import os
+import sys
+import unittest
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from calculate_oee import line_tags  # noqa: E402
+from historian_client import HistorianClient  # noqa: E402
+from query_equipment_states import SITE_CONFIG, resolve_sites, site_tags  # noqa: E402
+from tagseries import format_iso_ms, parse_iso_ms  # noqa: E402
+
+
+START = "2026-02-17T06:00:00+00:00"
+END = "2026-02-17T18:00:00+00:00"
+DATASET = "Virtual Factory"
+
+
+def all_site_tags():
+    tags = []
+    for site_path in resolve_sites(["all"]):
+        config = SITE_CONFIG[site_path.rsplit("/", 1)[-1]]
+        tags.extend(site_tags(site_path, config))
+        for line in config["filling_lines"]:
+            tags.extend(line_tags(f"{site_path}/fillerproduction/{line}").values())
+    return tags
+
+
+def at(clock):
+    """Epoch ms of an HH:MM[:SS] time on 2026-02-17 UTC."""
+    return parse_iso_ms(f"2026-02-17T{clock}Z")
+
+
+class StubHistorian(HistorianClient):
+    """HistorianClient whose requests are answered from ``points`` (tag -> [(ms, value)])."""
+
+    def __init__(self, points):
+        super().__init__("http://historian.test")
+        self.points = points
+        self.windows = []
+
+    def get_json(self, path):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)
+        lo, hi = parse_iso_ms(query["start"][0]), parse_iso_ms(query["end"][0])
+        self.windows.append((lo, hi))
+        return {"tl": [
+            {"t": {"n": tag}, "d": [{"t": format_iso_ms(t), "v": v} for t, v in self.points[tag] if lo <= t <= hi]}
+            for tag in query["tagname"] if tag in self.points
+        ]}, None
+
+
+class PlanBatchesTest(unittest.TestCase):
+
+    def test_every_planned_url_fits_the_limit(self):
+        client = HistorianClient("http://127.0.0.1:4511")
+        tags = all_site_tags()
+        for limit in (1000, 2000, 4000):
+            batches = client.plan_batches("Virtual Factory", tags, START, END, limit)
+            self.assertEqual(sorted(t for batch in batches for t in batch), sorted(tags))
+            for batch in batches:
+                params = [("tagname", t) for t in batch] + [("start", START), ("end", END)]
+                url = "http://127.0.0.1:4511" + client.data_path("Virtual Factory", params)
+                self.assertLessEqual(len(url), limit)
+
+
+class IterChunksTest(unittest.TestCase):
+
+    # Every 10 minutes from 05:50 to 09:10, so points fall on each hour edge
+    POINTS = {
+        "dense": [(at("05:50") + 600_000 * i, float(i)) for i in range(21)],
+        "edge_only": [(at("08:00"), 1.0)],
+        "ends": [(at("06:17"), 1.0), (at("09:00"), 2.0)],
+    }
+    START, END = "2026-02-17T06:17:00Z", "2026-02-17T09:00:00Z"
+
+    def chunks(self, read_ahead=None):
+        client = StubHistorian(self.POINTS)
+        return list(client.iter_chunks(DATASET, list(self.POINTS), self.START, self.END, 3600, read_ahead))
+
+    def test_windows_are_epoch_aligned_after_a_non_aligned_start(self):
+        edges = [(parse_iso_ms(lo), parse_iso_ms(hi)) for lo, hi, _, _ in self.chunks()]
+        self.assertEqual(edges, [(at("06:17"), at("07:00")), (at("07:00"), at("08:00")),
+                                 (at("08:00"), at("09:00"))])
+
+    def test_points_are_half_open_and_yielded_once(self):
+        for read_ahead in (1, 2, 4):
+            chunks = self.chunks(read_ahead)
+            for tag, points in self.POINTS.items():
+                expected = [t for t, _ in points if at("06:17") <= t <= at("09:00")]
+                with self.subTest(read_ahead=read_ahead, tag=tag):
+                    yielded = [t for _, _, data, _ in chunks if tag in data for t in data[tag].times]
+                    self.assertEqual(yielded, expected)
+                    for index, (lo, hi, data, errors) in enumerate(chunks):
+                        self.assertEqual(errors, {})
+                        last = index == len(chunks) - 1
+                        for t in data[tag].times if tag in data else ():
+                            self.assertTrue(parse_iso_ms(lo) <= t and (t <= parse_iso_ms(hi) if last
+                                                                       else t < parse_iso_ms(hi)))
+
+    def test_edge_point_goes_to_the_later_window(self):
+        chunks = self.chunks()
+        self.assertEqual([len(data["edge_only"]) if "edge_only" in data else 0 for _, _, data, _ in chunks],
+                         [0, 0, 1])
+        self.assertEqual(list(chunks[1][2]["dense"].times)[0], at("07:00"))
+        self.assertEqual(list(chunks[0][2]["dense"].times)[-1], at("06:50"))
+
+    def test_final_window_is_closed_at_end(self):
+        self.assertEqual(list(self.chunks()[-1][2]["ends"].times), [at("09:00")])
+
+
+class QueryBoundariesTest(unittest.TestCase):
+
+    POINTS = {
+        "dense": [(at("06:00") + 60_000 * i, float(i)) for i in range(721)],
+        "sparse": [(at("09:00"), 1.0), (at("09:30"), 2.0), (at("10:00"), 3.0)],
+        "single": [(at("12:00"), 5.0)],
+        "empty": [],
+    }
+
+    def test_first_and_last_point_match_a_full_query(self):
+        tags = list(self.POINTS) + ["missing"]
+        client = StubHistorian(self.POINTS)
+        result, err = client.query_boundaries(DATASET, tags, START, END)
+        self.assertIsNone(err)
+        full, _ = StubHistorian(self.POINTS).query_many(DATASET, tags, START, END)
+        for tag in tags:
+            with self.subTest(tag=tag):
+                times = list(full[tag].times) if tag in full else []
+                self.assertEqual(list(result[tag].times), sorted(set(times[:1] + times[-1:])))
+
+    def test_dense_tags_need_only_the_narrow_windows(self):
+        client = StubHistorian(self.POINTS)
+        result, _ = client.query_boundaries(DATASET, ["dense"], START, END, window=300)
+        self.assertEqual(list(result["dense"].values), [0.0, 720.0])
+        self.assertEqual(sorted(client.windows), [(at("06:00"), at("06:05")), (at("17:55"), at("18:00"))])
+
+    def test_empty_windows_are_widened(self):
+        client = StubHistorian(self.POINTS)
+        result, _ = client.query_boundaries(DATASET, ["sparse"], START, END, window=300)
+        self.assertEqual(list(result["sparse"].values), [1.0, 3.0])
+        heads = sorted(hi - lo for lo, hi in client.windows if lo == at("06:00"))
+        self.assertEqual(heads[:3], [300_000, 1_200_000, 4_800_000])
+
+    def test_missing_and_empty_tags_give_empty_series(self):
+        result, err = StubHistorian(self.POINTS).query_boundaries(DATASET, ["empty", "missing"], START, END)
+        self.assertIsNone(err)
+        self.assertEqual((len(result["empty"]), len(result["missing"])), (0, 0))
+        self.assertEqual(result["missing"].name, "missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,301 @@
+"""spc_engine against the per-rule functions it replaced, its NumPy path and checkpoint resume.
+
+Run with: python3 -m unittest discover shared/tests
+"""
+
+import json
+import math
+import os
+import random
+import sys
+import unittest
+from array import array
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import spc_engine  # noqa: E402
+from spc_engine import (ALL_RULES, MAX_EXAMPLES, RunningStats, evaluate, get_state, set_state,  # noqa: E402
+                        western_electric_rules)
+from tagseries import TagSeries  # noqa: E402
+
+
+CENTER, UCL, LCL = 100.0, 103.0, 97.0
+SIGMA = (UCL - LCL) / 6.0
+ZONE_RULES = (1, 2, 3, 4, 5, 6, 7, 8)
+
+
+# --- Baseline: the per-rule functions of spc_analysis before the engine (rules 1-4),
+# --- and direct definitions of rules 5-8. Each returns [(index, description)].
+
+def compute_statistics(values):
+    n = len(values)
+    if n == 0:
+        return None
+    mean = sum(values) / n
+    std_dev = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1)) if n > 1 else 0.0
+    return {"mean": mean, "std_dev": std_dev, "min": min(values), "max": max(values), "count": n}
+
+
+def check_rule_1(values, ucl, lcl):
+    return [(i, f"Point beyond control limits ({'above UCL' if v > ucl else 'below LCL'})")
+            for i, v in enumerate(values) if v > ucl or v < lcl]
+
+
+def check_rule_2(values, center):
+    violations = []
+    if len(values) < 9:
+        return violations
+    run_count = 1
+    above = values[0] > center
+    for i in range(1, len(values)):
+        current_above = values[i] > center
+        if values[i] == center:
+            run_count = 0
+            continue
+        if current_above == above:
+            run_count += 1
+        else:
+            run_count = 1
+            above = current_above
+        if run_count >= 9:
+            violations.append((i, f"9 consecutive points {'above' if above else 'below'} center line"))
+            run_count = 0
+    return violations
+
+
+def check_rule_3(values):
+    violations = []
+    if len(values) < 6:
+        return violations
+    inc_count = dec_count = 1
+    for i in range(1, len(values)):
+        if values[i] > values[i - 1]:
+            inc_count += 1
+            dec_count = 1
+        elif values[i] < values[i - 1]:
+            dec_count += 1
+            inc_count = 1
+        else:
+            inc_count = dec_count = 1
+        if inc_count >= 6:
+            violations.append((i, "6 consecutive points steadily increasing"))
+            inc_count = 1
+        elif dec_count >= 6:
+            violations.append((i, "6 consecutive points steadily decreasing"))
+            dec_count = 1
+    return violations
+
+
+def check_rule_4(values):
+    violations = []
+    if len(values) < 14:
+        return violations
+    alt_count = 1
+    for i in range(2, len(values)):
+        prev_dir = values[i - 1] - values[i - 2]
+        curr_dir = values[i] - values[i - 1]
+        if (prev_dir > 0 and curr_dir < 0) or (prev_dir < 0 and curr_dir > 0):
+            alt_count += 1
+        else:
+            alt_count = 1
+        if alt_count >= 14:
+            violations.append((i, "14 consecutive points alternating up and down"))
+            alt_count = 1
+    return violations
+
+
+def check_k_of_n(values, center, sigma, k, n, zone):
+    """k of the last n points beyond zone sigma on one side; the reporting side starts over."""
+    upper, lower = center + zone * sigma, center - zone * sigma
+    violations = []
+    cleared = {True: -1, False: -1}
+    for i, v in enumerate(values):
+        for above, beyond in ((True, v > upper), (False, v < lower)):
+            if not beyond:
+                continue
+            window = values[max(i - n + 1, cleared[above] + 1):i + 1]
+            if sum(1 for u in window if (u > upper if above else u < lower)) >= k:
+                side = "above" if above else "below"
+                violations.append((i, f"{k} of {n} consecutive points beyond {zone} sigma {side} center line"))
+                cleared[above] = i
+    return violations
+
+
+def check_zone_run(values, center, sigma, length, inside, description):
+    """``length`` consecutive points inside (or outside) 1 sigma; the run starts over after a report."""
+    violations = []
+    start = 0
+    for i, v in enumerate(values):
+        if (abs(v - center) < sigma) != inside:
+            start = i + 1
+        elif i - start + 1 >= length:
+            violations.append((i, description))
+            start = i + 1
+    return violations
+
+
+def baseline(values):
+    """Violations and episode span per rule id."""
+    return {
+        1: (check_rule_1(values, UCL, LCL), 1),
+        2: (check_rule_2(values, CENTER), 9),
+        3: (check_rule_3(values), 6),
+        4: (check_rule_4(values), 14),
+        5: (check_k_of_n(values, CENTER, SIGMA, 2, 3, 2), 3),
+        6: (check_k_of_n(values, CENTER, SIGMA, 4, 5, 1), 5),
+        7: (check_zone_run(values, CENTER, SIGMA, 15, True, "15 consecutive points within 1 sigma of center line"), 15),
+        8: (check_zone_run(values, CENTER, SIGMA, 8, False, "8 consecutive points beyond 1 sigma of center line"), 8),
+    }
+
+
+def episodes(violations, times, values, span):
+    """(count, episode_count, first MAX_EXAMPLES episodes) from a flat violation list."""
+    kept, episode_count, last = [], 0, None
+    for i, description in violations:
+        if last is not None and description == last[1] and i - last[0] <= span:
+            if episode_count == len(kept):
+                episode = kept[-1]
+                episode[2] = times[i]
+                episode[3] += 1
+                episode[4] = min(episode[4], values[i])
+                episode[5] = max(episode[5], values[i])
+        else:
+            episode_count += 1
+            if len(kept) < MAX_EXAMPLES:
+                kept.append([times[i], values[i], times[i], 1, values[i], values[i], description])
+        last = (i, description)
+    return len(violations), episode_count, kept
+
+
+# --- Series: random noise with shifts, ramps and zigzags, optionally on a coarse grid
+# --- so values land exactly on the center line, zone edges and control limits.
+
+def make_series(seed, n=2500, grid=None):
+    rng = random.Random(seed)
+    values = []
+    while len(values) < n:
+        kind = rng.choice(("noise", "noise", "shift", "ramp", "zigzag", "flat", "spike"))
+        length = rng.randint(5, 40)
+        if kind == "noise":
+            values.extend(rng.gauss(CENTER, SIGMA) for _ in range(length))
+        elif kind == "shift":
+            offset = rng.choice((-1, 1)) * rng.uniform(0.8, 2.5) * SIGMA
+            values.extend(rng.gauss(CENTER + offset, SIGMA * 0.4) for _ in range(length))
+        elif kind == "ramp":
+            step = rng.choice((-1, 1)) * rng.uniform(0.05, 0.4)
+            base = rng.gauss(CENTER, SIGMA)
+            values.extend(base + step * j for j in range(length))
+        elif kind == "zigzag":
+            base, amplitude = rng.gauss(CENTER, SIGMA * 0.5), rng.uniform(0.2, 2.0)
+            values.extend(base + (amplitude if j % 2 else -amplitude) for j in range(length))
+        elif kind == "flat":
+            values.extend([rng.choice((CENTER, CENTER + SIGMA, CENTER - 2 * SIGMA, UCL, LCL))] * length)
+        else:
+            values.append(rng.choice((UCL + 1.0, LCL - 1.0, UCL, LCL)))
+    values = values[:n]
+    if grid:
+        values = [round(v / grid) * grid for v in values]
+    times = array("q", (1_700_000_000_000 + 10_000 * i for i in range(n)))
+    return TagSeries("tag", times, array("d", values))
+
+
+SERIES = [make_series(seed) for seed in range(4)] + [make_series(seed, grid=0.5) for seed in range(4, 8)]
+
+
+class StreamingMatchesBaselineTest(unittest.TestCase):
+
+    def test_rules_1_to_8(self):
+        for index, series in enumerate(SERIES):
+            values, times = list(series.values), list(series.times)
+            expected = baseline(values)
+            for chunk_points in (7, 256, spc_engine.CHUNK_POINTS):
+                rules = western_electric_rules(UCL, LCL, CENTER, ZONE_RULES)
+                evaluate(series, rules, chunk_points=chunk_points, resumable=True)
+                for rule in rules:
+                    with self.subTest(series=index, chunk_points=chunk_points, rule=rule.rule):
+                        violations, span = expected[rule.rule]
+                        self.assertEqual((rule.count, rule.episode_count, rule.episodes),
+                                         episodes(violations, times, values, span))
+
+    def test_rules_fire_on_the_test_series(self):
+        # Guard against a generator that never exercises a rule
+        fired = set()
+        for series in SERIES:
+            fired.update(rule for rule, (violations, _) in baseline(list(series.values)).items() if violations)
+        self.assertEqual(fired, set(ZONE_RULES))
+
+    def test_statistics(self):
+        for index, series in enumerate(SERIES):
+            expected = compute_statistics(list(series.values))
+            for chunk_points in (7, spc_engine.CHUNK_POINTS):
+                stats = RunningStats()
+                evaluate(series, [], stats, chunk_points=chunk_points)
+                result = stats.result()
+                with self.subTest(series=index, chunk_points=chunk_points):
+                    self.assertEqual((result["count"], result["min"], result["max"]),
+                                     (expected["count"], expected["min"], expected["max"]))
+                    self.assertAlmostEqual(result["mean"], expected["mean"], places=9)
+                    self.assertAlmostEqual(result["std_dev"], expected["std_dev"], places=9)
+
+    def test_empty_and_short_series(self):
+        for n in (0, 1, 5, 8):
+            series = TagSeries("tag", array("q", range(n)), array("d", [CENTER + 5.0] * n))
+            rules = western_electric_rules(UCL, LCL, CENTER, ZONE_RULES)
+            evaluate(series, rules)
+            counts = {rule.rule: rule.count for rule in rules}
+            self.assertEqual(counts[1], n)
+            self.assertEqual(counts[2], 0)
+
+
+@unittest.skipIf(spc_engine.np is None, "NumPy not installed")
+class NumpyMatchesStreamingTest(unittest.TestCase):
+
+    def test_scan_reproduces_feed(self):
+        outcome = ("count", "episode_count", "episodes", "seen", "last_pos", "last_desc")
+        with mock.patch.object(spc_engine, "NUMPY_MIN_POINTS", 1):
+            for index, series in enumerate(SERIES):
+                scanned = western_electric_rules(UCL, LCL, CENTER, ALL_RULES)
+                streamed = western_electric_rules(UCL, LCL, CENTER, ALL_RULES)
+                evaluate(series, scanned)
+                evaluate(series, streamed, resumable=True)
+                for a, b in zip(scanned, streamed):
+                    with self.subTest(series=index, rule=a.rule):
+                        self.assertEqual({k: getattr(a, k) for k in outcome}, {k: getattr(b, k) for k in outcome})
+
+
+class ResumeTest(unittest.TestCase):
+
+    def test_checkpointed_halves_match_one_run(self):
+        for index, series in enumerate(SERIES[::2]):
+            full_rules = western_electric_rules(UCL, LCL, CENTER, ALL_RULES)
+            full_stats = RunningStats()
+            evaluate(series, full_rules, full_stats, resumable=True)
+
+            for split in (1, 9, len(series) // 3, len(series) - 1):
+                first = TagSeries("tag", series.times[:split], series.values[:split])
+                rest = TagSeries("tag", series.times[split:], series.values[split:])
+                rules = western_electric_rules(UCL, LCL, CENTER, ALL_RULES)
+                stats = RunningStats()
+                evaluate(first, rules, stats, chunk_points=100, resumable=True)
+                # Through JSON, as spc_store keeps checkpoints
+                snapshot = json.loads(json.dumps({"stats": get_state(stats),
+                                                  "rules": [get_state(rule) for rule in rules]}))
+
+                stats = set_state(RunningStats(), snapshot["stats"])
+                rules = western_electric_rules(UCL, LCL, CENTER, ALL_RULES)
+                for rule, state in zip(rules, snapshot["rules"]):
+                    set_state(rule, state)
+                evaluate(rest, rules, stats, chunk_points=100, fresh=False)
+
+                with self.subTest(series=index, split=split):
+                    for resumed, whole in zip(rules, full_rules):
+                        self.assertEqual(get_state(resumed), get_state(whole), resumed.rule)
+                    self.assertEqual((stats.count, stats.min, stats.max),
+                                     (full_stats.count, full_stats.min, full_stats.max))
+                    self.assertAlmostEqual(stats.mean, full_stats.mean, places=9)
+                    self.assertAlmostEqual(stats.m2, full_stats.m2, delta=1e-9 * full_stats.m2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""TagSeries columns, resampling and decimation on small hand-checked series.
+
+Run with: python3 -m unittest discover shared/tests
+"""
+
+import os
+import sys
+import unittest
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from tagseries import TagSeries, decimate, format_iso_ms, parse_iso_ms, resample  # noqa: E402
+
+
+def numeric(times, values):
+    return TagSeries("tag", array("q", times), array("d", values))
+
+
+class ColumnsTest(unittest.TestCase):
+
+    def test_from_points_skips_points_without_value(self):
+        series = TagSeries.from_points("tag", [
+            {"t": "2026-02-17T06:00:00Z", "v": 1.5},
+            {"t": "2026-02-17T06:00:10Z"},
+            {"t": "2026-02-17T06:00:20.250Z", "v": 3},
+        ])
+        self.assertTrue(series.is_numeric)
+        self.assertEqual(list(series.values), [1.5, 3.0])
+        self.assertEqual(series.times[1] - series.times[0], 20_250)
+
+    def test_non_numeric_values_stay_a_list(self):
+        series = TagSeries.from_points("tag", [{"t": "2026-02-17T06:00:00Z", "v": "Running"},
+                                               {"t": "2026-02-17T06:01:00Z", "v": 2}])
+        self.assertFalse(series.is_numeric)
+        self.assertEqual(series.values, ["Running", 2])
+
+    def test_numeric_bytes_round_trip(self):
+        series = numeric([1_000, 2_000, 3_500], [1.0, -2.5, 1e300])
+        copy = TagSeries.from_bytes("tag", series.to_bytes())
+        self.assertEqual(copy.times, series.times)
+        self.assertEqual(copy.values, series.values)
+        self.assertTrue(copy.is_numeric)
+
+    def test_list_bytes_round_trip(self):
+        series = TagSeries("tag", array("q", [1_000, 2_000]), ["Idle", None])
+        copy = TagSeries.from_bytes("tag", series.to_bytes())
+        self.assertEqual(copy.times, series.times)
+        self.assertEqual(copy.values, ["Idle", None])
+
+    def test_empty_bytes_round_trip(self):
+        copy = TagSeries.from_bytes("tag", TagSeries("tag").to_bytes())
+        self.assertEqual(len(copy), 0)
+
+    def test_between_is_inclusive(self):
+        series = numeric([0, 10, 20, 30], [0.0, 1.0, 2.0, 3.0])
+        self.assertEqual(list(series.between(10, 20).values), [1.0, 2.0])
+
+    def test_iso_round_trip(self):
+        for text in ("2026-02-17T06:00:00.000Z", "2026-02-17T23:59:59.999Z"):
+            self.assertEqual(format_iso_ms(parse_iso_ms(text)), text)
+        self.assertEqual(parse_iso_ms("2026-02-17T06:00:00Z"), parse_iso_ms("2026-02-17T06:00:00+00:00"))
+        self.assertEqual(parse_iso_ms("2026-02-17T07:00:00+01:00"), parse_iso_ms("2026-02-17T06:00:00Z"))
+
+
+class ResampleTest(unittest.TestCase):
+
+    series = numeric([0, 30, 90], [10.0, 20.0, 40.0])
+
+    def test_mean_and_last(self):
+        mean = resample(self.series, 60, "mean")
+        self.assertEqual((list(mean.times), list(mean.values)), ([0, 60], [15.0, 40.0]))
+        last = resample(self.series, 60, "last")
+        self.assertEqual(list(last.values), [20.0, 40.0])
+
+    def test_time_weighted_average_carries_value_into_next_bucket(self):
+        # [0, 60): 10 for 30, 20 for 30; [60, 120): 20 carried for 30, then 40 for 30
+        twa = resample(self.series, 60, "twa", end_ms=120)
+        self.assertEqual((list(twa.times), list(twa.values)), ([0, 60], [15.0, 30.0]))
+
+    def test_time_weighted_average_skips_empty_buckets(self):
+        # [60, 120) has no point; [120, 180) holds 10 for 30, then 30 for 30
+        twa = resample(numeric([0, 150], [10.0, 30.0]), 60, "twa")
+        self.assertEqual((list(twa.times), list(twa.values)), ([0, 120], [10.0, 20.0]))
+
+    def test_last_bucket_closes_at_window_end(self):
+        # [60, 120) closes at 100: 20 for 30, 40 for 10
+        twa = resample(self.series, 60, "twa", end_ms=100)
+        self.assertEqual(list(twa.values), [15.0, 25.0])
+
+    def test_buckets_are_epoch_aligned(self):
+        self.assertEqual(list(resample(numeric([59, 61], [1.0, 2.0]), 60, "last").times), [0, 60])
+
+    def test_unknown_aggregate(self):
+        with self.assertRaises(ValueError):
+            resample(self.series, 60, "median")
+
+
+class DecimateTest(unittest.TestCase):
+
+    def test_short_series_is_unchanged(self):
+        series = numeric([0, 1, 2], [1.0, 2.0, 3.0])
+        self.assertIs(decimate(series, 3), series)
+
+    def test_minmax_keeps_each_bucket_extremes_in_time_order(self):
+        series = numeric(list(range(8)), [5.0, 1.0, 9.0, 3.0, 7.0, 2.0, 8.0, 4.0])
+        picked = decimate(series, 4, "minmax")
+        self.assertEqual(list(picked.times), [1, 2, 5, 6])
+        self.assertEqual(list(picked.values), [1.0, 9.0, 2.0, 8.0])
+
+    def test_lttb_keeps_the_ends_and_the_spike(self):
+        series = numeric(list(range(7)), [0.0, 0.0, 10.0, 0.0, 0.0, 0.0, 5.0])
+        picked = decimate(series, 4, "lttb")
+        self.assertEqual(list(picked.times), [0, 2, 3, 6])
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            decimate(numeric([0, 1, 2], [0.0, 1.0, 2.0]), 2, "every_nth")
+
+
+if __name__ == "__main__":
+    unittest.main()